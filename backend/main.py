@@ -1,10 +1,11 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Request
+from fastapi import FastAPI, APIRouter, HTTPException, Request, Query
 from fastapi.responses import Response
 from fastapi.middleware.cors import CORSMiddleware
 from pathlib import Path
 import xml.etree.ElementTree as ET
 import re
 from pydantic import BaseModel
+from typing import Union
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse, StreamingResponse
 import io
@@ -13,18 +14,35 @@ from datetime import datetime
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from email.utils import formatdate
 import os
 import zipfile
+import zlib
+import struct
+import gzip
 from dotenv import load_dotenv
 from pptx import Presentation
 from pptx.util import Inches
 from pptx.enum.shapes import MSO_SHAPE_TYPE
 import tempfile
 import shutil
+import stat
+import contextlib
 from copy import deepcopy
 from starlette.staticfiles import StaticFiles
 from starlette.responses import Response
 from urllib.parse import unquote
+import threading
+import time
+import sqlite3
+import hashlib
+import secrets
+import base64
+import bisect
+from urllib.parse import quote
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import asyncio
 
 # Load environment variables
 load_dotenv()
@@ -139,6 +157,33 @@ except ImportError:
     CAIRO_AVAILABLE = False
     print("Warning: cairosvg not available. PNG export will be disabled.")
 
+# orjson and msgpack are optional; catalog responses fall back to the stdlib json encoder
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+# brotli is optional; without it SVG routes only offer gzip
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+# Pillow is optional; without it /img derivatives are unavailable
+try:
+    from PIL import Image, ImageOps
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
 # --- Setup Directories ---
 BASE_DIR = Path(__file__).parent.parent
 ICON_DIR = BASE_DIR / "exported_svgs"
@@ -150,6 +195,9 @@ ICON_DIR_LIGHT = ICON_DIR / "light"
 ICON_DIR_DARK = ICON_DIR / "dark"
 SINGLE_COLOR_DIR_LIGHT = COLORFUL_ICON_DIR / "SingleColor" / "light"
 SINGLE_COLOR_DIR_DARK = COLORFUL_ICON_DIR / "SingleColor" / "dark"
+BCORE_DIR = Path(__file__).parent / "bcore_files"
+THUMBNAILS_DIR = Path(__file__).parent / "thumbnails"
+INFOGRAPHICS_DIR = BASE_DIR / "infographics"
 
 # Create directories
 ICON_DIR.mkdir(exist_ok=True)
@@ -171,8 +219,22 @@ app.add_middleware(
 )
 
 class CORSAwareStaticFiles(StaticFiles):
+    def lookup_path(self, path):
+        full_path = asset_resolver.resolve_static(self.directory, path)
+        if full_path is None:
+            return "", None
+        try:
+            return str(full_path), os.stat(full_path)
+        except FileNotFoundError:
+            asset_resolver.forget()
+            return "", None
+
     async def get_response(self, path, scope):
         response = await super().get_response(path, scope)
+        if (scope["method"] == "GET" and isinstance(response, FileResponse)
+                and response.status_code == 200 and str(response.path).lower().endswith(".svg")):
+            response = await io_pool.run(encoded_asset_response, Request(scope), Path(response.path),
+                                         "image/svg+xml", {})
         response.headers["Access-Control-Allow-Origin"] = "*"
         response.headers["Access-Control-Allow-Methods"] = "GET, OPTIONS"
         response.headers["Access-Control-Allow-Headers"] = "*"
@@ -204,6 +266,20 @@ class ExportPngRequest(BaseModel):
     type: str = "icon"  # "icon" or "flag"
     folder: str = "Root"  # folder name for icons
     mode: str = "light"  # "light" or "dark"
+    width: int = None  # PNG output size; defaults to the SVG's own size
+    height: int = None
+    scale: float = 1.0
+    background: str = None  # e.g. "#ffffff"; transparent when omitted
+
+class MultiSizeExportRequest(BaseModel):
+    icon_name: str
+    type: str = "icon"  # "icon", "colorful-icon", "flag" or "single-color"
+    folder: str = "Root"
+    mode: str = "light"
+    sizes: list[int]  # longest edge in pixels, e.g. [16, 32, 48, 256]
+    formats: list[str] = ["png"]  # "png", "webp" and/or "ico"
+    background: str = None  # transparent when omitted
+    packaging: str = "zip"  # "zip" or "multipart"
 
 class GreyscaleRequest(BaseModel):
     icon_name: str
@@ -224,12 +300,34 @@ class SingleColorRevertRequest(BaseModel):
     icon_name: str
     mode: str = "light"  # "light" or "dark"
 
+class EditOperation(BaseModel):
+    op: str  # "color", "single-color", "single-color-revert", "greyscale" or "revert"
+    icon_name: str  # with or without the .svg extension
+    type: str = None  # defaults per op: icon, single-color or colorful-icon
+    folder: str = "Root"
+    mode: str = "light"  # "light" or "dark"
+    group_id: str = None  # for "color"
+    color: str = None  # for "color" and "single-color"
+
+class BatchEditRequest(BaseModel):
+    operations: list[EditOperation]
+
+class ZipExportItem(BaseModel):
+    name: str
+    type: str = None  # defaults to the request's type, folder and mode
+    folder: str = None
+    mode: str = None
+
 class ZipExportRequest(BaseModel):
-    items: list[str]  # List of icon names
+    items: list[Union[str, ZipExportItem]]  # icon names, or items from other folders/types
     type: str = "icon"  # "icon", "colorful-icon", or "flag"
     folder: str = "Root"  # folder name for icons
     format: str = "svg"  # "svg" or "png"
     mode: str = "light"  # "light" or "dark"
+    width: int = None  # PNG options, applied to every item
+    height: int = None
+    scale: float = 1.0
+    background: str = None
 
 class FeedbackRequest(BaseModel):
     type: str
@@ -243,25 +341,11 @@ class FeedbackResponseRequest(BaseModel):
 # --- Feedback Storage ---
 FEEDBACK_DIR = BASE_DIR / "feedback_submissions"
 FEEDBACK_DIR.mkdir(exist_ok=True)
+feedback_lock = threading.Lock()  # saves run on worker threads and pick the next free ID
 
 def get_icon_directory(icon_type: str, folder: str = "Root", mode: str = "light") -> Path:
     """Get the appropriate directory for icons based on type, folder, and mode"""
-    if icon_type == "icon":
-        if folder == "Root":
-            return ICON_DIR_LIGHT if mode == "light" else ICON_DIR_DARK
-        else:
-            # For subfolders, use mode-specific directories
-            base_dir = ICON_DIR_LIGHT if mode == "light" else ICON_DIR_DARK
-            return base_dir / folder
-    elif icon_type == "colorful-icon":
-        # Colorful icons use the same directory regardless of mode
-        return COLORFUL_ICON_DIR
-    elif icon_type == "single-color":
-        return SINGLE_COLOR_DIR_LIGHT if mode == "light" else SINGLE_COLOR_DIR_DARK
-    elif icon_type == "flag":
-        return FLAG_DIR
-    else:
-        return ICON_DIR
+    return asset_resolver.directory(icon_type, folder, mode)
 
 def load_feedback():
     """Load feedback from individual files"""
@@ -299,30 +383,31 @@ def load_feedback():
 
 def save_feedback(feedback_type, feedback_message, email=""):
     """Save a new feedback submission as a file"""
-    try:
-        # Get the next available ID
-        existing_files = list(FEEDBACK_DIR.glob("*.txt"))
-        next_id = 1
-        if existing_files:
-            existing_ids = [int(f.stem) for f in existing_files if f.stem.isdigit()]
-            if existing_ids:
-                next_id = max(existing_ids) + 1
+    with feedback_lock:
+        try:
+            # Get the next available ID
+            existing_files = list(FEEDBACK_DIR.glob("*.txt"))
+            next_id = 1
+            if existing_files:
+                existing_ids = [int(f.stem) for f in existing_files if f.stem.isdigit()]
+                if existing_ids:
+                    next_id = max(existing_ids) + 1
         
-        # Create the feedback file
-        file_path = FEEDBACK_DIR / f"{next_id}.txt"
-        timestamp = datetime.now().isoformat()
+            # Create the feedback file
+            file_path = FEEDBACK_DIR / f"{next_id}.txt"
+            timestamp = datetime.now().isoformat()
         
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(f"{timestamp}\n")
-            f.write(f"{feedback_type}\n")
-            f.write("new\n")  # default status
-            f.write(f"{email}\n")  # user's email
-            f.write(f"{feedback_message}\n")
+            with open(file_path, 'w', encoding='utf-8') as f:
+                f.write(f"{timestamp}\n")
+                f.write(f"{feedback_type}\n")
+                f.write("new\n")  # default status
+                f.write(f"{email}\n")  # user's email
+                f.write(f"{feedback_message}\n")
         
-        return next_id
-    except Exception as e:
-        print(f"Error saving feedback: {e}")
-        return None
+            return next_id
+        except Exception as e:
+            print(f"Error saving feedback: {e}")
+            return None
 
 def update_feedback_status_file(feedback_id, new_status):
     """Update the status of a feedback submission"""
@@ -389,22 +474,1463 @@ def convert_to_greyscale(element):
             style += ';filter:url(#greyscale)'
             element.set('style', style)
 
-def create_backup(filepath):
-    """Create a backup of the original SVG file"""
-    backup_path = filepath.with_suffix('.svg.backup')
-    if not backup_path.exists():
-        import shutil
-        shutil.copy2(filepath, backup_path)
-    return backup_path
-
-def restore_from_backup(filepath):
-    """Restore the original SVG from backup"""
-    backup_path = filepath.with_suffix('.svg.backup')
-    if backup_path.exists():
-        import shutil
-        shutil.copy2(backup_path, filepath)
-        return True
-    return False
+def apply_group_color(root, group_id, color) -> bool:
+    """Recolour one group's shapes, or every element for "entire_flag"; False if the group is missing"""
+    namespaces = {"svg": "http://www.w3.org/2000/svg"}
+    if group_id == "entire_flag":
+        for element in root.iter():
+            update_element_color(element, color)
+    else:
+        target_group = root.find(f".//svg:g[@id='{group_id}']", namespaces)
+        if target_group is None:
+            return False
+        for element in target_group.iter():
+            if element.tag.endswith(('path', 'rect', 'circle', 'ellipse', 'polygon', 'polyline', 'line')):
+                update_element_color(element, color)
+
+    # Only remove <style> blocks directly under root
+    for style_block in list(root.findall("svg:style", namespaces)):
+        root.remove(style_block)
+    return True
+
+def apply_shape_color(root, color):
+    """Recolour every shape, as single-color icons are edited"""
+    for element in root.iter():
+        if element.tag.endswith(('path', 'rect', 'circle', 'ellipse', 'polygon', 'polyline', 'line')):
+            update_element_color(element, color)
+
+def apply_default_shape_color(root, mode):
+    """Reset filled shapes to the single-color default for the mode"""
+    default_color = "#282828" if mode == "light" else "#D3D3D3"
+    for element in root.iter():
+        if element.tag.endswith(('path', 'rect', 'circle', 'ellipse', 'polygon', 'polyline', 'line')):
+            if element.get('fill') and element.get('fill') != 'none':
+                element.set('fill', default_color)
+
+def apply_greyscale_filter(root):
+    """Add the greyscale filter definition and point every shape at it"""
+    # Add greyscale filter definition if it doesn't exist
+    defs = root.find(".//{http://www.w3.org/2000/svg}defs")
+    if defs is None:
+        defs = ET.SubElement(root, "defs")
+    
+    # Check if greyscale filter already exists
+    existing_filter = defs.find(".//{http://www.w3.org/2000/svg}filter[@id='greyscale']")
+    if existing_filter is None:
+        filter_elem = ET.SubElement(defs, "filter", id="greyscale")
+        ET.SubElement(filter_elem, "feColorMatrix",
+                      type="matrix",
+                      values="0.299 0.587 0.114 0 0 0.299 0.587 0.114 0 0 0.299 0.587 0.114 0 0 0 0 0 1 0")
+    
+    for element in root.iter():
+        if element.tag.endswith(('path', 'rect', 'circle', 'ellipse', 'polygon', 'polyline', 'line')):
+            convert_to_greyscale(element)
+
+def restore_original(filepath):
+    """Write the first recorded version back as a new version; False if the file was never edited"""
+    data = versions.original(filepath)
+    if data is None:
+        return False
+    write_svg_bytes(filepath, data, label="revert")
+    return True
+
+# --- Asset Manifest ---
+# Persistent SQLite record of every SVG/PNG in the library. A boot only re-reads files
+# whose size or mtime changed, so restarts do not rescan and re-parse the whole tree.
+SVG_NS = "http://www.w3.org/2000/svg"
+MANIFEST_PATH = Path(os.getenv('ASSET_MANIFEST_PATH', str(BASE_DIR / "asset_manifest.sqlite3")))
+MANIFEST_SCHEMA_VERSION = 2
+MANIFEST_SUFFIXES = (".svg", ".png")
+ASSET_HASH_LENGTH = 20  # hex digits of sha256 used in content-addressed URLs
+
+SHAPE_TAGS = ('path', 'rect', 'circle', 'ellipse', 'polygon', 'polyline', 'line')
+
+def element_fill(element):
+    """The fill an element declares itself, from its style attribute or its fill attribute"""
+    match = re.search(r'fill\s*:\s*([^;]+)', element.get('style', ''))
+    if match:
+        return match.group(1).strip()
+    return element.get('fill')
+
+def svg_metadata(root) -> dict:
+    """Metadata the read endpoints need, taken from an already parsed SVG root element"""
+    # Leaf groups only: skip container groups like "Layer_2" that hold other groups with IDs
+    groups = []
+    fills = {}
+    for g in root.findall(f".//{{{SVG_NS}}}g"):
+        group_id = g.get("id")
+        if group_id and not any(child.tag.endswith('g') and child.get("id") for child in g):
+            groups.append(group_id)
+            colours = set()
+            for element in g.iter():
+                fill = element_fill(element)
+                if fill and (element is g or element.tag.endswith(SHAPE_TAGS) or element.tag.endswith('g')):
+                    colours.add(fill)
+            fills[group_id] = sorted(colours)
+
+    # Trees edited in memory may hold un-namespaced <defs>/<filter> until they are re-parsed
+    greyscale = any(
+        element.get("id") == "greyscale" and element.tag.rsplit('}', 1)[-1] == "filter"
+        for defs in root.iter() if defs.tag.rsplit('}', 1)[-1] == "defs"
+        for element in defs.iter()
+    )
+
+    return {"view_box": root.get("viewBox"), "groups": groups, "fills": fills, "greyscale": greyscale}
+
+def extract_svg_metadata(data: bytes) -> dict:
+    """Parse an SVG once and pull out what the listing endpoints need"""
+    return svg_metadata(ET.fromstring(data))
+
+class AssetManifest:
+    """SQLite (WAL) table of path, size, mtime, content hash and SVG metadata"""
+    def __init__(self, db_path: Path, roots: list):
+        # Drop roots nested inside another root so each file is walked once
+        roots = [Path(r) for r in roots]
+        self.roots = [r for r in roots if not any(r != o and self._is_under(r, o) for o in roots)]
+        self._lock = threading.Lock()
+        self._synced = False
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] != MANIFEST_SCHEMA_VERSION:
+            self._conn.execute("DROP TABLE IF EXISTS assets")
+            self._conn.execute(f"PRAGMA user_version={MANIFEST_SCHEMA_VERSION}")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS assets (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                sha256 TEXT NOT NULL,
+                view_box TEXT,
+                groups TEXT NOT NULL DEFAULT '[]',
+                fills TEXT NOT NULL DEFAULT '{}',
+                greyscale INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS assets_sha256 ON assets (sha256)")
+        self._conn.commit()
+
+    @staticmethod
+    def _is_under(path: Path, root: Path) -> bool:
+        try:
+            path.relative_to(root)
+            return True
+        except ValueError:
+            return False
+
+    @staticmethod
+    def key(path) -> str:
+        return Path(path).relative_to(BASE_DIR).as_posix()
+
+    @staticmethod
+    def _prefix_range(prefix: str) -> tuple:
+        # "0" sorts right after "/", so this range is exactly the paths below prefix
+        return (prefix + "/", prefix + "0")
+
+    def _row(self, path: Path, st, data: bytes, meta: dict) -> tuple:
+        return (self.key(path), st.st_size, st.st_mtime_ns, hashlib.sha256(data).hexdigest(),
+                meta["view_box"], json.dumps(meta["groups"]), json.dumps(meta["fills"]), int(meta["greyscale"]))
+
+    def _read_row(self, path: Path, st) -> tuple:
+        data = path.read_bytes()
+        meta = {"view_box": None, "groups": [], "fills": {}, "greyscale": False}
+        if path.suffix.lower() == ".svg":
+            try:
+                meta = extract_svg_metadata(data)
+            except ET.ParseError as e:
+                print(f"Warning: could not parse {path}: {e}")
+        return self._row(path, st, data, meta)
+
+    def _upsert(self, rows: list):
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO assets (path, size, mtime_ns, sha256, view_box, groups, fills, greyscale) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def record(self, path, data: bytes, meta: dict):
+        """Record a file the server just wrote, using metadata from the in-memory tree"""
+        path = Path(os.path.normpath(path))
+        row = self._row(path, path.stat(), data, meta)
+        with self._lock:
+            self._upsert([row])
+            self._conn.commit()
+        return self._to_dict(self._row_mapping(row))
+
+    @staticmethod
+    def _row_mapping(row: tuple) -> dict:
+        keys = ("path", "size", "mtime_ns", "sha256", "view_box", "groups", "fills", "greyscale")
+        return dict(zip(keys, row))
+
+    def sync(self, root: Path = None):
+        """Bring the manifest up to date, re-reading only files whose size or mtime changed"""
+        roots = [Path(root)] if root is not None else self.roots
+        changed, seen, known = [], set(), {}
+        with self._lock:
+            for r in roots:
+                for row in self._conn.execute(
+                        "SELECT path, size, mtime_ns FROM assets WHERE path > ? AND path < ?",
+                        self._prefix_range(self.key(r))):
+                    known[row["path"]] = (row["size"], row["mtime_ns"])
+
+        for r in roots:
+            for dirpath, _, filenames in os.walk(r):
+                for filename in filenames:
+                    if not filename.lower().endswith(MANIFEST_SUFFIXES):
+                        continue
+                    path = Path(dirpath) / filename
+                    st = path.stat()
+                    rel = self.key(path)
+                    seen.add(rel)
+                    if known.get(rel) != (st.st_size, st.st_mtime_ns):
+                        changed.append(self._read_row(path, st))
+
+        removed = [(rel,) for rel in known if rel not in seen]
+        with self._lock:
+            self._upsert(changed)
+            self._conn.executemany("DELETE FROM assets WHERE path = ?", removed)
+            self._conn.commit()
+            if root is None:
+                self._synced = True
+        return {"changed": len(changed), "removed": len(removed), "total": len(seen)}
+
+    def ensure_synced(self):
+        if not self._synced:
+            self.sync()
+
+    def refresh_path(self, path):
+        """Re-read one path after a write or a watcher event"""
+        path = Path(os.path.normpath(path))
+        if not any(self._is_under(path, r) for r in self.roots):
+            return
+        if path.is_dir():
+            self.sync(path)
+            return
+        rel = self.key(path)
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            with self._lock:
+                self._conn.execute("DELETE FROM assets WHERE path = ?", (rel,))
+                self._conn.execute("DELETE FROM assets WHERE path > ? AND path < ?", self._prefix_range(rel))
+                self._conn.commit()
+            return
+        if path.suffix.lower() in MANIFEST_SUFFIXES:
+            with self._lock:
+                known = self._conn.execute("SELECT size, mtime_ns FROM assets WHERE path = ?", (rel,)).fetchone()
+            if known is not None and (known["size"], known["mtime_ns"]) == (st.st_size, st.st_mtime_ns):
+                return
+            row = self._read_row(path, st)
+            with self._lock:
+                self._upsert([row])
+                self._conn.commit()
+
+    @staticmethod
+    def _to_dict(row) -> dict:
+        return {
+            "path": row["path"], "size": row["size"], "mtime_ns": row["mtime_ns"],
+            "sha256": row["sha256"], "view_box": row["view_box"],
+            "groups": json.loads(row["groups"]), "fills": json.loads(row["fills"]),
+            "greyscale": bool(row["greyscale"]),
+        }
+
+    def lookup(self, path) -> dict:
+        """Metadata for one file, re-read only if it changed on disk since it was recorded"""
+        self.ensure_synced()
+        path = Path(os.path.normpath(path))
+        if not any(self._is_under(path, r) for r in self.roots):
+            return None
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            return None
+        rel = self.key(path)
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM assets WHERE path = ?", (rel,)).fetchone()
+        if row is None or (row["size"], row["mtime_ns"]) != (st.st_size, st.st_mtime_ns):
+            if path.suffix.lower() not in MANIFEST_SUFFIXES:
+                return None
+            self.refresh_path(path)
+            with self._lock:
+                row = self._conn.execute("SELECT * FROM assets WHERE path = ?", (rel,)).fetchone()
+        return self._to_dict(row) if row is not None else None
+
+    def find_by_hash(self, digest: str) -> Path:
+        """Path of a current file whose content hash starts with digest"""
+        self.ensure_synced()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path FROM assets WHERE sha256 >= ? AND sha256 < ? LIMIT 8",
+                (digest, digest + "g")).fetchall()
+        for row in rows:
+            path = BASE_DIR / row["path"]
+            meta = self.lookup(path)
+            if meta is not None and meta["sha256"].startswith(digest):
+                return path
+        return None
+
+    def rows_under(self, root: Path) -> list:
+        """Every recorded file below root, with its path made relative (POSIX) to root"""
+        self.ensure_synced()
+        prefix = self.key(root)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM assets WHERE path > ? AND path < ? ORDER BY path",
+                self._prefix_range(prefix)).fetchall()
+        result = []
+        for row in rows:
+            entry = self._to_dict(row)
+            entry["path"] = entry["path"][len(prefix) + 1:]
+            result.append(entry)
+        return result
+
+manifest = AssetManifest(MANIFEST_PATH, [
+    ICON_DIR, ICON_DIR_LIGHT, ICON_DIR_DARK, COLORFUL_ICON_DIR,
+    SINGLE_COLOR_DIR_LIGHT, SINGLE_COLOR_DIR_DARK, FLAG_DIR, BCORE_DIR,
+])
+
+# --- Catalog Index ---
+# Listing endpoints answer from an in-memory snapshot of each collection instead of
+# walking the tree on every request. A collection is rescanned lazily on the next read
+# after the watcher (or a write endpoint) marks it dirty.
+CATALOG_WATCH_MODE = os.getenv('CATALOG_WATCH_MODE', 'auto').lower()  # "auto", "watchfiles", "poll" or "off"
+CATALOG_POLL_INTERVAL = float(os.getenv('CATALOG_POLL_INTERVAL', '2.0'))
+
+class CatalogCollection:
+    """A directory of assets listed either flat or one folder level deep"""
+    def __init__(self, name: str, root: Path, suffixes: tuple, nested: bool,
+                 asset_type: str = None, mode: str = None, url_prefix: str = None):
+        self.name = name
+        self.root = root
+        self.suffixes = suffixes
+        self.nested = nested
+        # Collections with an asset_type are exposed item by item through /v2/icons
+        self.asset_type = asset_type
+        self.mode = mode
+        self.url_prefix = url_prefix
+
+    def contains(self, path: Path) -> bool:
+        try:
+            Path(path).relative_to(self.root)
+            return True
+        except ValueError:
+            return False
+
+    def signature(self) -> tuple:
+        """Directory mtimes; they change whenever a file is added, removed or renamed"""
+        stamps = []
+        try:
+            stamps.append(self.root.stat().st_mtime_ns)
+            if self.nested:
+                for entry in os.scandir(self.root):
+                    if entry.is_dir():
+                        stamps.append((entry.name, entry.stat().st_mtime_ns))
+        except FileNotFoundError:
+            pass
+        return tuple(stamps)
+
+    def scan(self, manifest: AssetManifest) -> dict:
+        """Build a snapshot from the manifest: folder -> sorted file names, plus the derived views"""
+        files = {"Root": []}
+        if self.nested and self.root.exists():
+            for entry in os.scandir(self.root):
+                if entry.is_dir():
+                    files[entry.name] = []
+        items = []
+        for row in manifest.rows_under(self.root):
+            parts = row["path"].split("/")
+            if not parts[-1].lower().endswith(self.suffixes):
+                continue
+            if len(parts) == 1:
+                folder = "Root"
+            elif len(parts) == 2 and self.nested:
+                folder = parts[0]
+            else:
+                continue
+            files.setdefault(folder, []).append(parts[-1])
+            if self.asset_type:
+                items.append(self._item(folder, parts[-1], row))
+
+        stems = {folder: sorted(Path(name).stem for name in names) for folder, names in files.items()}
+        non_empty = {folder: names for folder, names in stems.items() if names}
+        # Sort folders by icon count (descending), then alphabetically for same count
+        folders = dict(sorted(non_empty.items(), key=lambda x: (-len(x[1]), x[0])))
+        all_stems = sorted({stem for names in stems.values() for stem in names})
+
+        items.sort(key=catalog_item_key)
+        by_folder = {}
+        for item in items:
+            by_folder.setdefault(item["folder"], []).append(item)
+        return {"files": files, "stems": stems, "folders": folders, "all_stems": all_stems,
+                "items": items, "by_folder": by_folder}
+
+    def _item(self, folder: str, filename: str, row: dict) -> dict:
+        rel = row["path"]
+        return {
+            "type": self.asset_type,
+            "mode": self.mode,
+            "folder": folder,
+            "name": Path(filename).stem,
+            "file": filename,
+            "hash": row["sha256"],
+            "size": row["size"],
+            "view_box": row["view_box"],
+            "groups": row["groups"],
+            "fills": row["fills"],
+            "greyscale": row["greyscale"],
+            "url": asset_url(row["sha256"], filename),
+            "static_url": f"{self.url_prefix}/{quote(rel)}",
+            # Internal: locate the file again without re-deriving the directory layout
+            "collection": self.name,
+            "rel": rel,
+        }
+
+def asset_url(sha256: str, filename: str) -> str:
+    """Immutable content-addressed URL; a recolor changes the hash and therefore the URL"""
+    return f"/a/{sha256[:ASSET_HASH_LENGTH]}{Path(filename).suffix.lower()}"
+
+def catalog_item_key(item: dict) -> tuple:
+    """Sort key for catalog items; cursors encode the key of the last item on a page"""
+    return (item["type"], item["mode"] or "", item["folder"], item["name"], item["file"])
+
+class CatalogIndex:
+    """Process-wide catalog of every listed collection, kept current by a watcher"""
+    def __init__(self, collections: list, manifest: AssetManifest):
+        self.collections = {c.name: c for c in collections}
+        self.manifest = manifest
+        self._snapshots = {}
+        self._dirty = set(self.collections)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher = None
+        self._version = 0
+        # Bumped on every invalidation; memoized path lookups are only valid within one generation
+        self.generation = 0
+
+    def get(self, name: str) -> dict:
+        if name in self._dirty:
+            with self._lock:
+                if name in self._dirty:
+                    self._dirty.discard(name)
+                    snapshot = self.collections[name].scan(self.manifest)
+                    # Every rebuild gets a new version, so cached views keyed on it go stale
+                    self._version += 1
+                    snapshot["version"] = self._version
+                    self._snapshots[name] = snapshot
+        return self._snapshots[name]
+
+    def versions(self, names) -> tuple:
+        return tuple(self.get(name)["version"] for name in names)
+
+    def build(self):
+        for name in self.collections:
+            self.get(name)
+
+    def invalidate(self, name: str = None):
+        with self._lock:
+            self.generation += 1
+            if name is None:
+                self._dirty.update(self.collections)
+            else:
+                self._dirty.add(name)
+
+    def invalidate_path(self, path, refresh: bool = True):
+        """Refresh path in the manifest and mark every collection containing it as stale"""
+        if refresh:
+            self.manifest.refresh_path(path)
+        for collection in self.collections.values():
+            if collection.contains(path):
+                self.invalidate(collection.name)
+
+    def watches(self, path) -> bool:
+        """Whether changes below path move the generation (a running watcher covers it)"""
+        return self._watcher is not None and any(c.contains(path) for c in self.collections.values())
+
+    def start_watcher(self, mode: str = CATALOG_WATCH_MODE):
+        if mode == "off" or self._watcher is not None:
+            return
+        target = self._poll
+        if mode in ("auto", "watchfiles"):
+            try:
+                import watchfiles  # noqa: F401
+                target = self._watch
+            except ImportError:
+                if mode == "watchfiles":
+                    print("Warning: watchfiles not available. Falling back to polling the catalog.")
+        self._stop.clear()
+        self._watcher = threading.Thread(target=target, name="catalog-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self):
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=5)
+        self._watcher = None
+
+    def _watch(self):
+        from watchfiles import watch
+        roots = [str(c.root) for c in self.collections.values() if c.root.exists()]
+        try:
+            for changes in watch(*roots, stop_event=self._stop):
+                for _, changed_path in changes:
+                    if changed_path.endswith(ATOMIC_TEMP_SUFFIX):
+                        continue  # in-flight atomic write; the rename is reported separately
+                    self.invalidate_path(Path(changed_path))
+        except Exception as e:
+            print(f"Catalog watcher failed, falling back to polling: {e}")
+            self._poll()
+
+    def _poll(self):
+        signatures = {name: c.signature() for name, c in self.collections.items()}
+        while not self._stop.wait(CATALOG_POLL_INTERVAL):
+            for name, collection in self.collections.items():
+                signature = collection.signature()
+                if signature != signatures[name]:
+                    signatures[name] = signature
+                    self.manifest.sync(collection.root)
+                    self.invalidate(name)
+
+catalog = CatalogIndex([
+    CatalogCollection("icons", ICON_DIR, (".svg",), nested=True),
+    CatalogCollection("icons-light", ICON_DIR_LIGHT, (".svg",), nested=True,
+                      asset_type="icon", mode="light", url_prefix="/static-icons-light"),
+    CatalogCollection("icons-dark", ICON_DIR_DARK, (".svg",), nested=True,
+                      asset_type="icon", mode="dark", url_prefix="/static-icons-dark"),
+    CatalogCollection("colorful-icons", COLORFUL_ICON_DIR, (".svg",), nested=True,
+                      asset_type="colorful-icon", url_prefix="/colorful-icons"),
+    CatalogCollection("single-color-light", SINGLE_COLOR_DIR_LIGHT, (".svg", ".png"), nested=False,
+                      asset_type="single-color", mode="light", url_prefix="/single-color-files-light"),
+    CatalogCollection("single-color-dark", SINGLE_COLOR_DIR_DARK, (".svg", ".png"), nested=False,
+                      asset_type="single-color", mode="dark", url_prefix="/single-color-files-dark"),
+    CatalogCollection("flags", FLAG_DIR, (".svg",), nested=False,
+                      asset_type="flag", url_prefix="/flags"),
+    CatalogCollection("bcore", BCORE_DIR, (".svg", ".png"), nested=True),
+], manifest)
+
+# --- Asset Resolution ---
+# Single mapping from (type, folder, name, mode) to a file on disk, shared by every route
+# and static mount. Hits and misses are memoized until the catalog generation changes
+# (any watcher event or write), so repeated 404s from stale clients never touch the disk.
+# Misses below roots the watcher does not cover (thumbnails, infographics) only live for
+# RESOLVER_MISS_TTL seconds, so files added there are picked up without a restart.
+ASSET_TYPES = ("icon", "colorful-icon", "single-color", "flag", "bcore-logo", "bcore")
+ASSET_MODES = ("light", "dark")
+RESOLVER_CACHE_SIZE = int(os.getenv('RESOLVER_CACHE_SIZE', '20000'))
+RESOLVER_MISS_TTL = float(os.getenv('RESOLVER_MISS_TTL', '5'))
+BCORE_MEDIA_TYPES = {
+    ".mp4": "video/mp4",
+    ".mov": "video/quicktime",
+    ".avi": "video/x-msvideo",
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".gif": "image/gif",
+    ".svg": "image/svg+xml",
+    ".pptx": "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+    ".ppt": "application/vnd.ms-powerpoint",
+    ".pdf": "application/pdf",
+    ".docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    ".doc": "application/msword",
+}
+
+class InvalidAssetRequest(ValueError):
+    """Raised for an unknown type or mode, or a folder/name that escapes its directory"""
+
+class AssetHandle:
+    """A resolved asset: where it lives and how to serve it"""
+    def __init__(self, path: Path, asset_type: str, folder: str, name: str, mode: str):
+        self.path = path
+        self.type = asset_type
+        self.folder = folder
+        self.name = name
+        self.mode = mode
+        self.media_type = BCORE_MEDIA_TYPES.get(path.suffix.lower(), "application/octet-stream")
+
+class AssetResolver:
+    """Memoized asset lookups, invalidated whenever the catalog generation moves"""
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._generation = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _segment(value: str, allow_nested: bool = False) -> str:
+        parts = value.replace("\\", "/").split("/")
+        if not value or any(part in ("", ".", "..") for part in parts) or (len(parts) > 1 and not allow_nested):
+            raise InvalidAssetRequest(f"Invalid name: {value}")
+        return value
+
+    def directory(self, asset_type: str, folder: str = "Root", mode: str = None) -> Path:
+        """Directory holding assets of a type/folder/mode; mode None is the legacy unsplit icon tree"""
+        if asset_type not in ASSET_TYPES:
+            raise InvalidAssetRequest("Invalid type")
+        if mode is not None and mode not in ASSET_MODES:
+            raise InvalidAssetRequest("Invalid mode")
+        folder = folder or "Root"
+        if folder != "Root":
+            self._segment(folder)
+        if asset_type == "icon":
+            if folder == "SingleColor" and mode is not None:
+                return SINGLE_COLOR_DIR_DARK if mode == "dark" else SINGLE_COLOR_DIR_LIGHT
+            base_dir = ICON_DIR if mode is None else (ICON_DIR_DARK if mode == "dark" else ICON_DIR_LIGHT)
+            return base_dir if folder == "Root" else base_dir / folder
+        if asset_type == "colorful-icon":
+            return COLORFUL_ICON_DIR if folder == "Root" else COLORFUL_ICON_DIR / folder
+        if asset_type == "single-color":
+            return SINGLE_COLOR_DIR_DARK if mode == "dark" else SINGLE_COLOR_DIR_LIGHT
+        if asset_type == "flag":
+            return FLAG_DIR
+        if asset_type == "bcore-logo":
+            return BCORE_DIR / "Logos"
+        return BCORE_DIR
+
+    def _bcore_path(self, name: str) -> Path:
+        lower = name.lower()
+        if lower.endswith(('.mp4', '.mov', '.avi')):
+            return BCORE_DIR / "Videos" / name
+        if lower.endswith('.svg'):
+            return BCORE_DIR / "Logos" / name
+        if lower.endswith(('.png', '.jpg', '.jpeg', '.gif')):
+            # Preview images live in Branding; everything else in Images
+            branding_preview_path = BCORE_DIR / "Branding" / name
+            return branding_preview_path if branding_preview_path.exists() else BCORE_DIR / "Images" / name
+        if lower.endswith(('.pptx', '.ppt', '.pdf', '.docx', '.doc')):
+            return BCORE_DIR / "Branding" / name
+        return BCORE_DIR / name
+
+    def _memo(self, key, compute, watched: bool = True):
+        generation = catalog.generation
+        with self._lock:
+            if self._generation != generation:
+                self._entries.clear()
+                self._generation = generation
+            entry = self._entries.get(key)
+            if entry is not None and (entry[1] is None or entry[1] > time.monotonic()):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        value = compute()
+        # Nothing moves the generation when a file appears in an unwatched root
+        expires = time.monotonic() + RESOLVER_MISS_TTL if value is None and not watched else None
+        with self._lock:
+            if self._generation == generation:
+                self._entries[key] = (value, expires)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    def resolve(self, asset_type: str, folder: str, name: str, mode: str = None) -> AssetHandle:
+        """The asset's handle, or None if it does not exist; raises InvalidAssetRequest for bad input"""
+        directory = self.directory(asset_type, folder, mode)
+        self._segment(name, allow_nested=asset_type == "bcore")
+
+        def compute():
+            path = self._bcore_path(name) if asset_type == "bcore" else directory / name
+            if not path.is_file():
+                return None
+            return AssetHandle(path, asset_type, folder or "Root", name, mode)
+        return self._memo((asset_type, folder, name, mode), compute, catalog.watches(directory))
+
+    def resolve_static(self, directory, path: str) -> Path:
+        """File below a static mount directory, or None"""
+        def compute():
+            root = os.path.realpath(directory)
+            full_path = os.path.realpath(os.path.join(root, path))
+            if os.path.commonpath([full_path, root]) != root or not os.path.isfile(full_path):
+                return None
+            return Path(full_path)
+        return self._memo(("static", str(directory), path), compute, catalog.watches(directory))
+
+    def forget(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+asset_resolver = AssetResolver(RESOLVER_CACHE_SIZE)
+
+# --- Asset Byte Cache ---
+# Raw file bytes for the SVG/flag serving and export routes, bounded by a memory budget
+# with LRU eviction. Entries are validated against (size, mtime) on every hit and
+# replaced directly by the write endpoints.
+ASSET_CACHE_BYTES = int(os.getenv('ASSET_CACHE_BYTES', str(64 * 1024 * 1024)))
+
+class ByteCache:
+    """LRU cache of file contents keyed by path, bounded by total bytes"""
+    def __init__(self, budget: int):
+        self.budget = budget
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path) -> bytes:
+        """File contents from memory if still current, otherwise from disk (raises FileNotFoundError)"""
+        key = str(path)
+        st = os.stat(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == (st.st_size, st.st_mtime_ns):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        with open(key, 'rb') as f:
+            data = f.read()
+        self.put(key, data, st)
+        return data
+
+    def put(self, path, data: bytes, st=None):
+        key = str(path)
+        if st is None:
+            st = os.stat(key)
+        with self._lock:
+            self._discard(key)
+            if len(data) > self.budget:
+                return
+            self._entries[key] = ((st.st_size, st.st_mtime_ns), data)
+            self.size += len(data)
+            while self.size > self.budget:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def invalidate(self, path):
+        with self._lock:
+            self._discard(str(path))
+
+    def _discard(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "entries": len(self._entries), "bytes": self.size, "budget": self.budget}
+
+asset_cache = ByteCache(ASSET_CACHE_BYTES)
+
+class VariantCache:
+    """LRU of derived bytes (compressed, minified, rendered...) keyed by content hash and parameters"""
+    def __init__(self, budget: int, weigh=len):
+        self.budget = budget
+        self.weigh = weigh  # cost of an entry against the budget
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return data
+            self.misses += 1
+            return None
+
+    def put(self, key, data: bytes):
+        with self._lock:
+            if key not in self._entries and self.weigh(data) <= self.budget:
+                self._entries[key] = data
+                self.size += self.weigh(data)
+                while self.size > self.budget:
+                    _, evicted = self._entries.popitem(last=False)
+                    self.size -= self.weigh(evicted)
+                    self.evictions += 1
+
+    def get_or_build(self, key, build) -> bytes:
+        data = self.get(key)
+        if data is None:
+            data = build()
+            self.put(key, data)
+        return data
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "entries": len(self._entries), "bytes": self.size, "budget": self.budget}
+
+# --- Precompressed Variants ---
+# SVG responses are sent gzip- or brotli-encoded when the client accepts it. Each variant
+# is compressed once per content hash at maximum level and then served from memory. Only
+# small gzip variants are built inline; brotli and large bodies are compressed on the io
+# pool, and requests get the best variant that is ready (or identity) until then.
+ENCODED_CACHE_BYTES = int(os.getenv('ENCODED_CACHE_BYTES', str(32 * 1024 * 1024)))
+COMPRESS_MIN_BYTES = 256
+COMPRESS_INLINE_MAX_BYTES = int(os.getenv('COMPRESS_INLINE_MAX_BYTES', str(64 * 1024)))
+COMPRESSIBLE_MEDIA_TYPES = ("image/svg+xml", "text/css", "application/x-ndjson", "application/json")
+
+encoded_cache = VariantCache(ENCODED_CACHE_BYTES)
+
+def negotiate_encodings(request: Request) -> list:
+    """Content codings the client accepts, best first: "br", then "gzip"; empty for identity only"""
+    accepted = {}
+    for part in request.headers.get("accept-encoding", "").split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        match = re.search(r'q\s*=\s*([0-9.]+)', params)
+        if match:
+            try:
+                quality = float(match.group(1))
+            except ValueError:
+                quality = 0.0
+        if coding:
+            accepted[coding.lower()] = quality
+    return [coding for coding in (("br", "gzip") if BROTLI_AVAILABLE else ("gzip",))
+            if accepted.get(coding, accepted.get("*", 0.0)) > 0]
+
+def compress_bytes(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=11, mode=brotli.MODE_TEXT)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+def asset_digest(path: Path, data: bytes) -> str:
+    meta = manifest.lookup(path)
+    if meta is not None:
+        return meta["sha256"][:ASSET_HASH_LENGTH]
+    return hashlib.blake2b(data, digest_size=10).hexdigest()
+
+compressing = set()
+compressing_lock = threading.Lock()
+
+def schedule_compression(digest: str, data: bytes, encoding: str):
+    """Build one encoded variant on the io pool unless it is already being built"""
+    key = (digest, encoding)
+    with compressing_lock:
+        if key in compressing:
+            return
+        compressing.add(key)
+
+    def build():
+        try:
+            encoded_cache.put(key, compress_bytes(data, encoding))
+        finally:
+            with compressing_lock:
+                compressing.discard(key)
+    io_pool.submit(build)
+
+def ready_encoding(data: bytes, digest: str, encodings: list) -> tuple:
+    """(encoding, bytes) of the best accepted variant available now; missing ones are scheduled"""
+    for encoding in encodings:
+        encoded = encoded_cache.get((digest, encoding))
+        if encoded is not None:
+            return encoding, encoded
+        if encoding == "gzip" and len(data) <= COMPRESS_INLINE_MAX_BYTES:
+            encoded = compress_bytes(data, encoding)
+            encoded_cache.put((digest, encoding), encoded)
+            return encoding, encoded
+        schedule_compression(digest, data, encoding)
+    return None, data
+
+def encoded_bytes_response(request: Request, data: bytes, digest: str, media_type: str, headers: dict) -> Response:
+    """Serve bytes identified by digest, compressed once per digest when the client accepts it"""
+    encoding = None
+    if media_type in COMPRESSIBLE_MEDIA_TYPES and len(data) >= COMPRESS_MIN_BYTES:
+        encoding, data = ready_encoding(data, digest, negotiate_encodings(request))
+
+    headers = {**headers, "Vary": "Accept-Encoding"}
+    headers["ETag"] = f'"{digest}-{encoding}"' if encoding else f'"{digest}"'
+    if etag_matches(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=data, media_type=media_type, headers=headers)
+
+def encoded_asset_response(request: Request, path: Path, media_type: str, headers: dict) -> Response:
+    """Serve a file's bytes, compressed per content hash when the client accepts it"""
+    data = asset_cache.get(path)
+    return encoded_bytes_response(request, data, asset_digest(path, data), media_type, headers)
+
+# --- Worker Pools ---
+# Handlers stay on the event loop only for cheap work. Blocking file and network I/O runs
+# on bounded thread pools, XML edits on the edit pool (they must update this process's
+# caches), and rasterization on process pools. Every pool counts what is running and
+# queued so saturation shows up in /pool-stats before it shows up as latency.
+IO_WORKERS = int(os.getenv('IO_WORKERS', '8'))
+EDIT_WORKERS = int(os.getenv('EDIT_WORKERS', str(min(8, (os.cpu_count() or 1) + 2))))
+CPU_WORKERS = int(os.getenv('CPU_WORKERS', str(os.cpu_count() or 1)))
+MAIL_WORKERS = int(os.getenv('MAIL_WORKERS', '2'))
+# PNG conversions one /export-zip request may have in flight, so a large export cannot fill the cpu pool alone
+EXPORT_RASTER_CONCURRENCY = int(os.getenv('EXPORT_RASTER_CONCURRENCY', str(max(1, CPU_WORKERS // 2))))
+# Entries one /export-zip request reads ahead of the one being written, bounding what it holds in memory
+EXPORT_LOOKAHEAD = int(os.getenv('EXPORT_LOOKAHEAD', str(EXPORT_RASTER_CONCURRENCY * 4)))
+
+worker_pools = {}
+
+class WorkerPool:
+    """Lazily started thread or process executor with queue-depth accounting"""
+    def __init__(self, name: str, workers: int, processes: bool = False):
+        self.name = name
+        self.workers = max(1, workers)
+        self.processes = processes
+        self.pending = 0
+        self.peak_pending = 0
+        self.completed = 0
+        self.failed = 0
+        self._executor = None
+        self._lock = threading.Lock()
+        worker_pools[name] = self
+
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                if self.processes:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=self.name)
+            return self._executor
+
+    def submit(self, fn, *args):
+        """Schedule fn(*args); returns a concurrent.futures.Future"""
+        executor = self.executor()
+        with self._lock:
+            self.pending += 1
+            self.peak_pending = max(self.peak_pending, self.pending)
+        try:
+            future = executor.submit(fn, *args)
+        except Exception:
+            self._finished(None)
+            raise
+        future.add_done_callback(self._finished)
+        return future
+
+    def _finished(self, future):
+        with self._lock:
+            self.pending -= 1
+            if future is None or future.cancelled() or future.exception() is not None:
+                self.failed += 1
+            else:
+                self.completed += 1
+
+    async def run(self, fn, *args):
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"kind": "process" if self.processes else "thread", "workers": self.workers,
+                    "running": min(self.pending, self.workers), "queued": max(0, self.pending - self.workers),
+                    "peak_pending": self.peak_pending, "completed": self.completed, "failed": self.failed}
+
+io_pool = WorkerPool("io", IO_WORKERS)
+edit_pool = WorkerPool("edit", EDIT_WORKERS)
+cpu_pool = WorkerPool("cpu", CPU_WORKERS, processes=True)
+mail_pool = WorkerPool("mail", MAIL_WORKERS)
+
+@app.on_event("shutdown")
+async def stop_worker_pools():
+    for pool in worker_pools.values():
+        pool.shutdown()
+
+@app.get("/pool-stats")
+async def get_pool_stats():
+    """Running and queued tasks per worker pool"""
+    return {name: pool.stats() for name, pool in worker_pools.items()}
+
+def rasterize_svg(svg_data: bytes, width: int = None, height: int = None, scale: float = 1.0,
+                  background: str = None) -> bytes:
+    """SVG to PNG; module-level so it can run in a worker process"""
+    return cairosvg.svg2png(bytestring=svg_data, output_width=width, output_height=height, scale=scale,
+                            background_color=background)
+
+def edit_svg_file(filepath: Path, edit) -> bool:
+    """Parse a file, apply edit(root) and write it back unless edit returns False"""
+    ET.register_namespace('', "http://www.w3.org/2000/svg")
+    tree = ET.parse(filepath)
+    if edit(tree.getroot()) is False:
+        return False
+    write_svg_tree(tree, filepath)
+    return True
+
+# --- Streaming ZIP ---
+# /export-zip writes the archive as it goes: each entry is compressed on the io pool
+# (zlib releases the GIL, so entries compress in parallel) and emitted as local header
+# plus data once it and the entries before it are ready. Only the central directory is
+# held until the end. Already-compressed formats and entries deflate cannot shrink are
+# stored. No ZIP64: archives are limited to 4 GiB and 65535 entries.
+ZIP_DEFLATE_LEVEL = int(os.getenv('ZIP_DEFLATE_LEVEL', '6'))
+ZIP_STORED_EXTENSIONS = (".png", ".webp", ".jpg", ".jpeg", ".gif", ".ico", ".zip", ".gz", ".br")
+ZIP_MIN_SAVING = 0.05  # deflated entries must be at least this much smaller, else they are stored
+ZIP_COMPRESS_WINDOW = int(os.getenv('ZIP_COMPRESS_WINDOW', str(2 * IO_WORKERS)))
+
+def compress_zip_entry(filename: str, data: bytes) -> tuple:
+    """(method, crc32, payload) for one entry; runs on a worker thread"""
+    crc = zlib.crc32(data)
+    if not filename.lower().endswith(ZIP_STORED_EXTENSIONS) and data:
+        compressor = zlib.compressobj(ZIP_DEFLATE_LEVEL, zlib.DEFLATED, -15)
+        deflated = compressor.compress(data) + compressor.flush()
+        if len(deflated) <= len(data) * (1 - ZIP_MIN_SAVING):
+            return zipfile.ZIP_DEFLATED, crc, deflated
+    return zipfile.ZIP_STORED, crc, data
+
+class ZipStream:
+    """Incremental ZIP encoder: entry() returns the bytes for one member, finish() the directory"""
+    def __init__(self):
+        self.offset = 0
+        self._directory = []
+        now = datetime.now()
+        self._dos_time = (now.hour << 11) | (now.minute << 5) | (now.second // 2)
+        self._dos_date = ((now.year - 1980) << 9) | (now.month << 5) | now.day
+
+    def entry(self, filename: str, method: int, crc: int, size: int, payload: bytes) -> bytes:
+        name = filename.encode('utf-8')
+        fields = (20, 0x800, method, self._dos_time, self._dos_date, crc, len(payload), size)
+        header = struct.pack("<4s5H3L2H", b"PK\x03\x04", *fields, len(name), 0) + name
+        self._directory.append((fields, name, self.offset))
+        self.offset += len(header) + len(payload)
+        return header + payload
+
+    def finish(self) -> bytes:
+        directory = b"".join(
+            struct.pack("<4s6H3L5H2L", b"PK\x01\x02", 20, *fields, len(name), 0, 0, 0, 0, 0, offset) + name
+            for fields, name, offset in self._directory)
+        end = struct.pack("<4s4H2LH", b"PK\x05\x06", 0, 0, len(self._directory), len(self._directory),
+                          len(directory), self.offset, 0)
+        return directory + end
+
+# --- Atomic Writes ---
+# Files are replaced, never rewritten in place: data goes to a temp file in the same
+# directory, is fsynced, and is renamed over the target. Static mounts and caches therefore
+# always read a complete file. Mutations of one path are serialized by a per-path asyncio
+# lock, while edits to different files proceed in parallel and readers never wait.
+ATOMIC_TEMP_SUFFIX = ".tmp"
+
+def atomic_write_bytes(path: Path, data: bytes, durable: bool = True):
+    """Replace path with data so readers see the old or the new file, never a partial one"""
+    path = Path(path)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=ATOMIC_TEMP_SUFFIX)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            if durable:
+                f.flush()
+                os.fsync(f.fileno())
+        try:
+            os.chmod(tmp, stat.S_IMODE(path.stat().st_mode))
+        except FileNotFoundError:
+            os.chmod(tmp, 0o644)  # mkstemp creates 0600, which static serving may not be able to read
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(tmp)
+        raise
+    if durable:
+        # Persist the rename itself; not every platform can open a directory
+        with contextlib.suppress(OSError):
+            dir_fd = os.open(path.parent, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+
+class PathLocks:
+    """One asyncio.Lock per file path, dropped again once nobody holds or awaits it"""
+    def __init__(self):
+        self._locks = {}
+
+    @contextlib.asynccontextmanager
+    async def hold(self, path):
+        key = os.path.normcase(os.path.abspath(path))
+        entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+
+    def stats(self) -> dict:
+        return {"held": sum(1 for lock, _ in self._locks.values() if lock.locked()),
+                "waiting": sum(max(count - 1, 0) for _, count in self._locks.values())}
+
+file_locks = PathLocks()
+
+def write_svg_bytes(filepath: Path, data: bytes, meta: dict = None, label: str = "edit",
+                    record_version: bool = True) -> dict:
+    """Write an SVG and update its manifest entry and version history in the same step"""
+    if record_version:
+        versions.ensure_original(filepath)
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    atomic_write_bytes(filepath, data)
+    if record_version:
+        versions.commit(filepath, data, label)
+    asset_cache.put(filepath, data)
+    if meta is None:
+        meta = extract_svg_metadata(data)
+    entry = manifest.record(filepath, data, meta)
+    catalog.invalidate_path(filepath, refresh=False)
+    return entry
+
+def write_svg_tree(tree, filepath: Path, label: str = "edit") -> dict:
+    """Serialize an edited tree and write it; metadata comes from the tree, not a re-parse"""
+    buffer = io.BytesIO()
+    tree.write(buffer, encoding='utf-8', xml_declaration=True)
+    return write_svg_bytes(filepath, buffer.getvalue(), svg_metadata(tree.getroot()), label)
+
+# --- Version History ---
+# Every write is recorded in a content-addressed version store outside the served trees:
+# deduplicated blobs under VERSION_STORE_DIR/blobs and a SQLite index of (path, seq) ->
+# sha256 with a head pointer per asset. Undo, redo and restore move the head and write
+# one blob back, so they cost the same regardless of how much history an asset has.
+VERSION_STORE_DIR = Path(os.getenv('VERSION_STORE_DIR', str(BASE_DIR / ".versions")))
+VERSION_KEEP = int(os.getenv('VERSION_KEEP', '50'))  # versions kept per asset by garbage collection
+# Legacy .svg.backup files are adopted as an asset's original the first time its history is
+# needed; set this to import all of them at startup instead. Backup files are never deleted.
+VERSION_IMPORT_BACKUPS = os.getenv('VERSION_IMPORT_BACKUPS', 'false').lower() == 'true'
+LEGACY_BACKUP_SUFFIX = '.svg.backup'
+
+class VersionStore:
+    """Deduplicated blob directory plus a per-asset version index with undo/redo head"""
+    def __init__(self, root: Path):
+        self.blob_dir = root / "blobs"
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(root / "index.sqlite3"), check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS versions (
+                path TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                sha256 TEXT NOT NULL,
+                created REAL NOT NULL,
+                label TEXT NOT NULL,
+                PRIMARY KEY (path, seq)
+            )
+        """)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS heads (path TEXT PRIMARY KEY, seq INTEGER NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS versions_sha256 ON versions (sha256)")
+        self._conn.commit()
+
+    def _blob_path(self, sha256: str) -> Path:
+        return self.blob_dir / sha256[:2] / sha256
+
+    def _put_blob(self, data: bytes) -> str:
+        sha256 = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(sha256)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            atomic_write_bytes(path, data)
+        return sha256
+
+    def _head(self, key: str) -> int:
+        row = self._conn.execute("SELECT seq FROM heads WHERE path = ?", (key,)).fetchone()
+        return row[0] if row is not None else 0
+
+    def _append(self, key: str, data: bytes, label: str, created: float = None):
+        """Add a version after the head, dropping any redo tail; unchanged content is not recorded"""
+        sha256 = self._put_blob(data)
+        head = self._head(key)
+        current = self._conn.execute("SELECT sha256 FROM versions WHERE path = ? AND seq = ?", (key, head)).fetchone()
+        if current is not None and current[0] == sha256:
+            return head
+        self._conn.execute("DELETE FROM versions WHERE path = ? AND seq > ?", (key, head))
+        self._conn.execute("INSERT INTO versions (path, seq, sha256, created, label) VALUES (?, ?, ?, ?, ?)",
+                           (key, head + 1, sha256, created or time.time(), label))
+        self._conn.execute("INSERT OR REPLACE INTO heads (path, seq) VALUES (?, ?)", (key, head + 1))
+        return head + 1
+
+    def ensure_original(self, path: Path):
+        """Snapshot the file as version 1 if it has no history yet, preferring a legacy .svg.backup"""
+        key = manifest.key(path)
+        with self._lock:
+            if self._head(key):
+                return
+            try:
+                current = path.read_bytes()
+            except FileNotFoundError:
+                return
+            backup_path = path.with_suffix(LEGACY_BACKUP_SUFFIX)
+            if backup_path.exists():
+                self._append(key, backup_path.read_bytes(), "original", backup_path.stat().st_mtime)
+                self._append(key, current, "imported")
+            else:
+                self._append(key, current, "original")
+            self._conn.commit()
+
+    def commit(self, path: Path, data: bytes, label: str = "edit") -> int:
+        with self._lock:
+            seq = self._append(manifest.key(path), data, label)
+            self._conn.commit()
+        return seq
+
+    def history(self, path: Path) -> dict:
+        key = manifest.key(path)
+        with self._lock:
+            head = self._head(key)
+            rows = self._conn.execute("SELECT seq, sha256, created, label FROM versions WHERE path = ? ORDER BY seq",
+                                      (key,)).fetchall()
+        return {"path": key, "head": head,
+                "versions": [{"version": r["seq"], "hash": r["sha256"][:ASSET_HASH_LENGTH], "created": r["created"],
+                              "label": r["label"]} for r in rows]}
+
+    def checkout(self, path: Path, seq: int) -> bytes:
+        """Move the head to seq and return that version's bytes; None if it does not exist"""
+        key = manifest.key(path)
+        with self._lock:
+            row = self._conn.execute("SELECT sha256 FROM versions WHERE path = ? AND seq = ?", (key, seq)).fetchone()
+            if row is None:
+                return None
+            data = self._blob_path(row[0]).read_bytes()
+            self._conn.execute("INSERT OR REPLACE INTO heads (path, seq) VALUES (?, ?)", (key, seq))
+            self._conn.commit()
+        return data
+
+    def head(self, path: Path) -> int:
+        with self._lock:
+            return self._head(manifest.key(path))
+
+    def step(self, path: Path, direction: int) -> int:
+        """The existing version just before (-1) or after (+1) the head, or None"""
+        key = manifest.key(path)
+        query = ("SELECT MAX(seq) FROM versions WHERE path = ? AND seq < ?" if direction < 0
+                 else "SELECT MIN(seq) FROM versions WHERE path = ? AND seq > ?")
+        with self._lock:
+            return self._conn.execute(query, (key, self._head(key))).fetchone()[0]
+
+    def original(self, path: Path) -> bytes:
+        """Bytes of version 1, or None when the file was never edited"""
+        if path.with_suffix(LEGACY_BACKUP_SUFFIX).exists():
+            self.ensure_original(path)
+        with self._lock:
+            row = self._conn.execute("SELECT sha256 FROM versions WHERE path = ? AND seq = 1",
+                                     (manifest.key(path),)).fetchone()
+        return self._blob_path(row[0]).read_bytes() if row is not None else None
+
+    def version_at(self, path: Path, timestamp: float) -> int:
+        """Latest version created at or before timestamp, falling back to the original"""
+        with self._lock:
+            row = self._conn.execute("SELECT MAX(seq) FROM versions WHERE path = ? AND created <= ?",
+                                     (manifest.key(path), timestamp)).fetchone()
+        return row[0] or 1
+
+    def paths_under(self, directory: Path) -> list:
+        low, high = AssetManifest._prefix_range(manifest.key(directory))
+        with self._lock:
+            rows = self._conn.execute("SELECT path FROM heads WHERE path > ? AND path < ? ORDER BY path",
+                                      (low, high)).fetchall()
+        return [BASE_DIR / r[0] for r in rows]
+
+    def gc(self, keep: int = VERSION_KEEP) -> dict:
+        """Trim each asset to its original, its head and the newest `keep` versions, then drop unreferenced blobs"""
+        with self._lock:
+            trimmed = self._conn.execute("""
+                DELETE FROM versions WHERE seq > 1
+                AND seq <= (SELECT MAX(v.seq) FROM versions v WHERE v.path = versions.path) - ?
+                AND seq != (SELECT h.seq FROM heads h WHERE h.path = versions.path)
+            """, (keep,)).rowcount
+            self._conn.commit()
+            referenced = {r[0] for r in self._conn.execute("SELECT DISTINCT sha256 FROM versions")}
+        removed = 0
+        for blob in self.blob_dir.glob("*/*"):
+            if blob.name in referenced or blob.name.endswith(ATOMIC_TEMP_SUFFIX):
+                continue
+            # Blobs are written under the lock, so re-check there: a commit since the
+            # snapshot may have pointed a new version at this blob
+            with self._lock:
+                if self._conn.execute("SELECT 1 FROM versions WHERE sha256 = ? LIMIT 1", (blob.name,)).fetchone():
+                    continue
+                blob.unlink(missing_ok=True)
+            removed += 1
+        return {"versions_trimmed": trimmed, "blobs_removed": removed, "blobs_kept": len(referenced)}
+
+    def import_backups(self, roots: list) -> int:
+        """Record every legacy .svg.backup as its asset's original version; the files are left in place"""
+        imported = 0
+        for root in roots:
+            if not root.exists():
+                continue
+            for backup_path in root.rglob(f"*{LEGACY_BACKUP_SUFFIX}"):
+                target = backup_path.with_suffix("")
+                if target.exists() and not self.head(target):
+                    self.ensure_original(target)
+                    imported += 1
+        return imported
+
+versions = VersionStore(VERSION_STORE_DIR)
+
+@app.on_event("startup")
+async def import_legacy_backups():
+    if VERSION_IMPORT_BACKUPS:
+        imported = versions.import_backups(manifest.roots)
+        if imported:
+            print(f"Imported {imported} .svg.backup files into the version store")
+
+def restore_version(filepath: Path, seq: int) -> dict:
+    """Write version seq back to the file without recording a new version"""
+    data = versions.checkout(filepath, seq)
+    if data is None:
+        raise HTTPException(status_code=404, detail=f"Version {seq} not found")
+    entry = write_svg_bytes(filepath, data, record_version=False)
+    return {"version": seq, "hash": entry["sha256"][:ASSET_HASH_LENGTH], "url": asset_url(entry["sha256"], filepath.name)}
+
+def resolve_versioned_asset(type: str, folder: str, icon_name: str, mode: str) -> Path:
+    try:
+        asset = asset_resolver.resolve(type, folder, icon_name, mode)
+    except InvalidAssetRequest as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if asset is None or asset.path.suffix.lower() != ".svg":
+        raise HTTPException(status_code=404, detail="File not found")
+    return asset.path
+
+class FolderRestoreRequest(BaseModel):
+    type: str
+    folder: str = "Root"
+    mode: str = None
+    at: str  # ISO 8601 timestamp or seconds since the epoch
+
+@app.get("/versions/{type}/{folder_name}/{icon_name}")
+async def get_versions(type: str, folder_name: str, icon_name: str, mode: str = None):
+    """Version list and current head of one asset"""
+    return await io_pool.run(versions.history, resolve_versioned_asset(type, folder_name, icon_name, mode))
+
+@app.post("/versions/{type}/{folder_name}/{icon_name}/{action}")
+async def change_version(type: str, folder_name: str, icon_name: str, action: str,
+                         mode: str = None, version: int = None):
+    """undo, redo, or restore?version=N; the file is rewritten from the stored blob"""
+    filepath = resolve_versioned_asset(type, folder_name, icon_name, mode)
+    async with file_locks.hold(filepath):
+        if action in ("undo", "redo"):
+            target = await io_pool.run(versions.step, filepath, -1 if action == "undo" else 1)
+            if target is None:
+                raise HTTPException(status_code=409, detail=f"Nothing to {action}")
+        elif action == "restore" and version is not None:
+            target = version
+        else:
+            raise HTTPException(status_code=400, detail="Action must be undo, redo or restore?version=N")
+        return await edit_pool.run(restore_version, filepath, target)
+
+@app.post("/versions/restore-folder")
+async def restore_folder(req: FolderRestoreRequest):
+    """Put every edited file in a folder back to its state at a point in time"""
+    try:
+        timestamp = float(req.at)
+    except ValueError:
+        try:
+            timestamp = datetime.fromisoformat(req.at).timestamp()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="at must be ISO 8601 or seconds since the epoch")
+    try:
+        directory = asset_resolver.directory(req.type, req.folder, req.mode)
+    except InvalidAssetRequest as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    restored = []
+    for filepath in await io_pool.run(versions.paths_under, directory):
+        if filepath.parent != directory or not await io_pool.run(filepath.exists):
+            continue
+        async with file_locks.hold(filepath):
+            target = await io_pool.run(versions.version_at, filepath, timestamp)
+            if target != await io_pool.run(versions.head, filepath):
+                restored.append({"file": manifest.key(filepath), **await edit_pool.run(restore_version, filepath, target)})
+    return {"restored": restored, "count": len(restored)}
+
+@app.post("/versions/gc")
+async def collect_versions(keep: int = Query(VERSION_KEEP, ge=1)):
+    """Trim old versions and delete blobs nothing refers to any more"""
+    return await io_pool.run(versions.gc, keep)
+
+@app.on_event("startup")
+async def start_catalog():
+    print(f"Asset manifest synced: {manifest.sync()}")
+    catalog.build()
+    search_index.ensure_current()
+    catalog.start_watcher()
+
+@app.on_event("shutdown")
+async def stop_catalog():
+    catalog.stop_watcher()
+
+# --- Catalog View Cache ---
+# Catalog views are serialized once per catalog version and served as raw bytes with a
+# strong ETag (a digest of those bytes), so unchanged views cost neither recomputation
+# nor re-encoding, and If-None-Match revalidations return 304 with no body.
+CATALOG_VIEW_CACHE_SIZE = int(os.getenv('CATALOG_VIEW_CACHE_SIZE', '512'))
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+def serialize_json(payload) -> bytes:
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode('utf-8')
+
+def negotiate_catalog_format(request: Request) -> str:
+    accept = request.headers.get("accept", "")
+    if MSGPACK_AVAILABLE and any(media_type in accept for media_type in MSGPACK_MEDIA_TYPES):
+        return "msgpack"
+    return "json"
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+class CatalogViewCache:
+    """LRU of serialized catalog views keyed by (view, format) and stamped with catalog versions"""
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, stamp):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != stamp:
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, stamp, etag: str, body: bytes):
+        with self._lock:
+            self._entries[key] = (stamp, etag, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+catalog_views = CatalogViewCache(CATALOG_VIEW_CACHE_SIZE)
+
+async def catalog_response(request: Request, view_key, collections: list, build) -> Response:
+    """Serve a catalog view from its cached bytes, or 304 if the client already has them"""
+    fmt = negotiate_catalog_format(request)
+    # Stale snapshots are rescanned inside catalog.get, so both run on the io pool
+    stamp = await io_pool.run(catalog.versions, collections)
+    key = (view_key, fmt)
+    entry = catalog_views.get(key, stamp)
+    if entry is None:
+        payload = await io_pool.run(build)
+        body = msgpack.packb(payload, use_bin_type=True) if fmt == "msgpack" else serialize_json(payload)
+        etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+        catalog_views.put(key, stamp, etag, body)
+    else:
+        _, etag, body = entry
+
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    media_type = MSGPACK_MEDIA_TYPES[0] if fmt == "msgpack" else "application/json"
+    return Response(content=body, media_type=media_type, headers=headers)
 
 @app.get("/")
 async def root():
@@ -415,63 +1941,41 @@ async def test():
     return {"message": "Test endpoint working!", "debug": "Backend is responding"}
 
 @app.get("/icons")
-async def get_icons():
-    # Get all folders and files in the ICON_DIR
-    folders = {}
-    
-    # Get folders
-    for folder_path in ICON_DIR.iterdir():
-        if folder_path.is_dir():
-            folder_name = folder_path.name
-            # Get all SVG files in this folder
-            svg_files = [f.stem for f in folder_path.glob("*.svg")]
-            if svg_files:  # Only include folders that have SVG files
-                folders[folder_name] = svg_files
-    
-    # Get SVG files in the root directory (not in folders)
-    root_svgs = [f.stem for f in ICON_DIR.glob("*.svg")]
-    if root_svgs:
-        folders["Root"] = root_svgs
-    
-    # Sort folders by icon count (descending), then alphabetically for same count
-    sorted_folders = dict(sorted(folders.items(), key=lambda x: (-len(x[1]), x[0])))
-    
-    return {"folders": sorted_folders}
+async def get_icons(request: Request):
+    return await catalog_response(request, "icons", ["icons"],
+                            lambda: {"folders": catalog.get("icons")["folders"]})
 
 @app.get("/icons/{folder_name}")
-async def get_icons_from_folder(folder_name: str):
-    if folder_name == "Root":
-        # Get icons from root directory
-        icons = [f.stem for f in ICON_DIR.glob("*.svg")]
-    else:
-        # Get icons from specific folder
-        folder_path = ICON_DIR / folder_name
-        if not folder_path.exists() or not folder_path.is_dir():
+async def get_icons_from_folder(folder_name: str, request: Request):
+    def build():
+        icons = catalog.get("icons")["stems"].get(folder_name)
+        if icons is None:
             return {"error": "Folder not found"}
-        
-        icons = [f.stem for f in folder_path.glob("*.svg")]
-    
-    # Sort icons alphabetically
-    icons.sort()
-    
-    return {"icons": icons}
+        return {"icons": icons}
+    return await catalog_response(request, ("icons", folder_name), ["icons"], build)
 
 @app.get("/flags")
-async def get_flags():
-    flags = [f.name for f in FLAG_DIR.glob("*.svg")]
-    return {"flags": flags}
+async def get_flags(request: Request):
+    return await catalog_response(request, "flags", ["flags"],
+                            lambda: {"flags": catalog.get("flags")["files"]["Root"]})
 
 @app.get("/flags/{flag_name}")
 async def get_flag(flag_name: str, request: Request):
     """Serve flag files with proper CORS headers"""
-    file_path = FLAG_DIR / flag_name
-    if not file_path.exists():
+    try:
+        asset = asset_resolver.resolve("flag", "Root", flag_name)
+    except InvalidAssetRequest:
+        asset = None
+    if asset is None:
         return Response(status_code=404, content="Flag not found")
+    file_path = asset.path
     
-    return FileResponse(
+    return await io_pool.run(
+        encoded_asset_response,
+        request,
         file_path,
-        media_type="image/svg+xml",
-        headers={
+        "image/svg+xml",
+        {
             "Access-Control-Allow-Origin": "*",
             "Access-Control-Allow-Methods": "GET, OPTIONS",
             "Access-Control-Allow-Headers": "*"
@@ -489,47 +1993,22 @@ def convert_svg_to_png_alternative(svg_content):
         raise Exception(f"Failed to convert SVG: {str(e)}")
 
 @app.post("/export-png")
-async def export_png(req: ExportPngRequest):
+async def export_png(req: ExportPngRequest, request: Request):
+    mode = getattr(req, 'mode', 'light')
+    session = request_session(request)
+    try:
+        asset = asset_resolver.resolve(req.type, req.folder, req.icon_name, mode)
+    except InvalidAssetRequest as e:
+        return {"error": str(e)}
+    if asset is None:
+        return {"error": "File not found"}
+    filepath = asset.path
+
     # Check if Cairo is available, if not use alternative method
     if not CAIRO_AVAILABLE:
-        # Use alternative method without Cairo
-        mode = getattr(req, 'mode', 'light')
-        
-        if req.type == "icon":
-            if req.folder == "Root":
-                if mode == "dark":
-                    filepath = ICON_DIR_DARK / req.icon_name
-                else:
-                    filepath = ICON_DIR_LIGHT / req.icon_name
-            elif req.folder == "SingleColor":
-                if mode == "dark":
-                    filepath = SINGLE_COLOR_DIR_DARK / req.icon_name
-                else:
-                    filepath = SINGLE_COLOR_DIR_LIGHT / req.icon_name
-            else:
-                if mode == "dark":
-                    filepath = ICON_DIR_DARK / req.folder / req.icon_name
-                else:
-                    filepath = ICON_DIR_LIGHT / req.folder / req.icon_name
-        elif req.type == "colorful-icon":
-            if req.folder == "Root":
-                filepath = COLORFUL_ICON_DIR / req.icon_name
-            else:
-                filepath = COLORFUL_ICON_DIR / req.folder / req.icon_name
-        elif req.type == "flag":
-            filepath = FLAG_DIR / req.icon_name
-        elif req.type == "bcore-logo":
-            filepath = BASE_DIR / "frontend" / "public" / "Bcore_Images_Video" / "Logos" / req.icon_name
-        else:
-            return {"error": "Invalid type"}
-        
-        if not filepath.exists():
-            return {"error": "File not found"}
-
         try:
-            # Read the SVG file
-            with open(filepath, 'r', encoding='utf-8') as f:
-                svg_content = f.read()
+            # Read the SVG file as this session sees it
+            svg_content, _ = await io_pool.run(workspace_svg, session, filepath)
             
             # Return SVG content for frontend conversion
             return Response(
@@ -539,54 +2018,16 @@ async def export_png(req: ExportPngRequest):
             )
         except Exception as e:
             return {"error": f"Failed to export SVG: {str(e)}"}
-    
-    # Original Cairo-based method
-    mode = getattr(req, 'mode', 'light')
-    
-    if req.type == "icon":
-        if req.folder == "Root":
-            if mode == "dark":
-                filepath = ICON_DIR_DARK / req.icon_name
-            else:
-                filepath = ICON_DIR_LIGHT / req.icon_name
-        elif req.folder == "SingleColor":
-            if mode == "dark":
-                filepath = SINGLE_COLOR_DIR_DARK / req.icon_name
-            else:
-                filepath = SINGLE_COLOR_DIR_LIGHT / req.icon_name
-        else:
-            if mode == "dark":
-                filepath = ICON_DIR_DARK / req.folder / req.icon_name
-            else:
-                filepath = ICON_DIR_LIGHT / req.folder / req.icon_name
-    elif req.type == "colorful-icon":
-        if req.folder == "Root":
-            filepath = COLORFUL_ICON_DIR / req.icon_name
-        else:
-            filepath = COLORFUL_ICON_DIR / req.folder / req.icon_name
-    elif req.type == "flag":
-        filepath = FLAG_DIR / req.icon_name
-    elif req.type == "bcore-logo":
-        # Use absolute path to ensure correct resolution
-        base_dir = Path(__file__).parent.absolute()
-        filepath = base_dir / "bcore_files" / "Logos" / req.icon_name
-        print(f"[DEBUG] PNG export - BCORE logo path: {filepath}")
-        print(f"[DEBUG] PNG export - File exists: {filepath.exists()}")
-    else:
-        return {"error": "Invalid type"}
-    
-    if not filepath.exists():
-        return {"error": "File not found"}
 
+    # Original Cairo-based method
     try:
-        # Read the SVG file
-        with open(filepath, 'r', encoding='utf-8') as f:
-            svg_content = f.read()
+        # Read the SVG file as this session sees it
+        svg_content, digest = await io_pool.run(workspace_svg, session, filepath)
         
         print(f"[DEBUG] PNG export - SVG content length: {len(svg_content)}")
         
-        # Convert SVG to PNG
-        png_data = cairosvg.svg2png(bytestring=svg_content.encode('utf-8'))
+        # Convert SVG to PNG in a worker process, or reuse an earlier render of the same bytes
+        png_data = await cached_png(svg_content, digest, mode, raster_options(req))
         
         print(f"[DEBUG] PNG export - PNG data length: {len(png_data)}")
         
@@ -605,53 +2046,24 @@ async def export_png(req: ExportPngRequest):
         return {"error": f"Failed to convert to PNG: {str(e)}"}
 
 @app.post("/export-svg")
-async def export_svg(req: ExportPngRequest):  # Reuse the same request model
+async def export_svg(req: ExportPngRequest, request: Request):  # Reuse the same request model
     print(f"[DEBUG] Export SVG request received: {req}")
     # Get the mode from the request, default to light
     mode = getattr(req, 'mode', 'light')
+    session = request_session(request)
     print(f"[DEBUG] Mode: {mode}, Type: {req.type}, Icon name: {req.icon_name}")
     
-    if req.type == "icon":
-        if req.folder == "Root":
-            if mode == "dark":
-                filepath = ICON_DIR_DARK / req.icon_name
-            else:
-                filepath = ICON_DIR_LIGHT / req.icon_name
-        elif req.folder == "SingleColor":
-            if mode == "dark":
-                filepath = SINGLE_COLOR_DIR_DARK / req.icon_name
-            else:
-                filepath = SINGLE_COLOR_DIR_LIGHT / req.icon_name
-        else:
-            if mode == "dark":
-                filepath = ICON_DIR_DARK / req.folder / req.icon_name
-            else:
-                filepath = ICON_DIR_LIGHT / req.folder / req.icon_name
-    elif req.type == "colorful-icon":
-        if req.folder == "Root":
-            filepath = COLORFUL_ICON_DIR / req.icon_name
-        else:
-            filepath = COLORFUL_ICON_DIR / req.folder / req.icon_name
-    elif req.type == "flag":
-        filepath = FLAG_DIR / req.icon_name
-    elif req.type == "bcore-logo":
-        # Use absolute path to ensure correct resolution
-        base_dir = Path(__file__).parent.absolute()
-        filepath = base_dir / "bcore_files" / "Logos" / req.icon_name
-        print(f"[DEBUG] Base directory: {base_dir}")
-        print(f"[DEBUG] BCORE logo path: {filepath}")
-        print(f"[DEBUG] File exists: {filepath.exists()}")
-        print(f"[DEBUG] Current working directory: {Path.cwd()}")
-    else:
-        return {"error": "Invalid type"}
-    
-    if not filepath.exists():
+    try:
+        asset = asset_resolver.resolve(req.type, req.folder, req.icon_name, mode)
+    except InvalidAssetRequest as e:
+        return {"error": str(e)}
+    if asset is None:
         return {"error": "File not found"}
+    filepath = asset.path
 
     try:
         # Read the SVG file
-        with open(filepath, 'r', encoding='utf-8') as f:
-            svg_content = f.read()
+        svg_content = (await io_pool.run(workspace_svg, session, filepath))[0].decode('utf-8')
         
         print(f"[DEBUG] SVG content length: {len(svg_content)}")
         print(f"[DEBUG] SVG content preview: {svg_content[:200]}...")
@@ -663,382 +2075,1498 @@ async def export_svg(req: ExportPngRequest):  # Reuse the same request model
         return {"error": f"Failed to export SVG: {str(e)}"}
 
 @app.post("/download-svg")
-async def download_svg(req: ExportPngRequest):  # Reuse the same request model
+async def download_svg(req: ExportPngRequest, request: Request):  # Reuse the same request model
     # Get the mode from the request, default to light
     mode = getattr(req, 'mode', 'light')
+    session = request_session(request)
+    if req.type not in ("icon", "colorful-icon", "flag"):
+        return {"error": "Invalid type"}
     
-    if req.type == "icon":
-        if req.folder == "Root":
-            if mode == "dark":
-                filepath = ICON_DIR_DARK / req.icon_name
+    try:
+        asset = asset_resolver.resolve(req.type, req.folder, req.icon_name, mode)
+    except InvalidAssetRequest as e:
+        return {"error": str(e)}
+    if asset is None:
+        return {"error": "File not found"}
+    filepath = asset.path
+
+    try:
+        # Return the SVG content as a downloadable file
+        return Response(
+            content=(await io_pool.run(workspace_svg, session, filepath))[0],
+            media_type="image/svg+xml",
+            headers={
+                "Content-Disposition": f"attachment; filename={req.icon_name}",
+                "Access-Control-Allow-Origin": "*",
+                "Access-Control-Allow-Methods": "POST, OPTIONS",
+                "Access-Control-Allow-Headers": "*"
+            }
+        )
+    except Exception as e:
+        return {"error": f"Failed to download SVG: {str(e)}"}
+
+async def export_zip_entries(req: ZipExportRequest, session: str):
+    """Yield (filename, bytes) in request order as each is ready; PNGs rasterize on the cpu pool as sources are read"""
+    mode = getattr(req, 'mode', 'light')
+    options = raster_options(req)
+    limit = asyncio.Semaphore(EXPORT_RASTER_CONCURRENCY)
+
+    async def rasterize(svg_data: bytes, digest: str, item_mode: str) -> bytes:
+        async with limit:
+            return await cached_png(svg_data, digest, item_mode, options)
+
+    async def settle(item_name: str, job):
+        if isinstance(job, bytes):
+            return job
+        try:
+            return await job
+        except Exception as e:
+            print(f"Error processing {item_name}: {e}")
+            return None
+
+    pending = deque()
+    seen = set()
+    try:
+        for item in req.items:
+            if isinstance(item, str):
+                item = ZipExportItem(name=item)
+            item_type, folder, item_mode = item.type or req.type, item.folder or req.folder, item.mode or mode
+            # Items outside the request's type/folder/mode get a directory for each part that differs
+            prefix = "".join(f"{part}/" for part, default in
+                             ((item_type, req.type), (folder, req.folder), (item_mode, mode)) if part != default)
+            item_name = prefix + item.name
+            try:
+                asset = asset_resolver.resolve(item_type, folder, f"{item.name}.svg", item_mode)
+                if asset is None or item_name in seen:
+                    continue
+                seen.add(item_name)
+                svg_data, digest = await io_pool.run(workspace_svg, session, asset.path)
+            except Exception as e:
+                print(f"Error processing {item_name}: {e}")
+                continue
+            if req.format == "png" and CAIRO_AVAILABLE:
+                pending.append((item_name, f"{item_name}.png", asyncio.ensure_future(rasterize(svg_data, digest, item_mode))))
             else:
-                filepath = ICON_DIR_LIGHT / req.icon_name
-        elif req.folder == "SingleColor":
-            if mode == "dark":
-                filepath = SINGLE_COLOR_DIR_DARK / req.icon_name
+                # SVG export, or the SVG fallback when PNG conversion is not available
+                pending.append((item_name, f"{item_name}.svg", svg_data))
+
+            # Write whatever is ready at the head, and wait on it once the window is full
+            while pending and (len(pending) > EXPORT_LOOKAHEAD or isinstance(pending[0][2], bytes)
+                               or pending[0][2].done()):
+                item_name, filename, job = pending.popleft()
+                data = await settle(item_name, job)
+                if data is not None:
+                    yield filename, data
+
+        while pending:
+            item_name, filename, job = pending.popleft()
+            data = await settle(item_name, job)
+            if data is not None:
+                yield filename, data
+    finally:
+        for _, _, job in pending:
+            if isinstance(job, asyncio.Future):
+                job.cancel()
+
+async def stream_export_zip(req: ZipExportRequest, session: str):
+    """Archive bytes for /export-zip, emitted entry by entry"""
+    archive = ZipStream()
+    pending = deque()  # (filename, size, compression future) in entry order
+
+    def emit(filename, size, future) -> bytes:
+        method, crc, payload = future.result()
+        return archive.entry(filename, method, crc, size, payload)
+
+    try:
+        async for filename, data in export_zip_entries(req, session):
+            if len(pending) >= ZIP_COMPRESS_WINDOW:
+                await asyncio.wrap_future(pending[0][2])
+            pending.append((filename, len(data), io_pool.submit(compress_zip_entry, filename, data)))
+            while pending and pending[0][2].done():
+                yield emit(*pending.popleft())
+        while pending:
+            await asyncio.wrap_future(pending[0][2])
+            yield emit(*pending.popleft())
+        yield archive.finish()
+    finally:
+        for _, _, future in pending:
+            future.cancel()
+
+@app.post("/export-zip")
+async def export_zip(req: ZipExportRequest, request: Request):
+    """Export multiple icons as a ZIP file, streamed while it is being built"""
+    session = request_session(request)
+    try:
+        raster_options(req)  # reject bad PNG options before the response starts
+        
+        # Create a meaningful filename
+        folder_name = req.folder if req.folder != "Root" else "icons"
+        zip_filename = f"{folder_name}_{req.type}_{req.format}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+        
+        return StreamingResponse(
+            stream_export_zip(req, session),
+            media_type="application/zip",
+            headers={"Content-Disposition": f"attachment; filename={zip_filename}"}
+        )
+        
+    except Exception as e:
+        return {"error": f"Failed to create ZIP: {str(e)}"}
+
+@app.get("/groups/{type}/{folder_name}/{icon_name}")
+async def get_groups(type: str, folder_name: str, icon_name: str):
+    if type not in ("icon", "flag"):
+        return {"groups": []}
+    try:
+        asset = asset_resolver.resolve(type, folder_name, icon_name, None)
+    except InvalidAssetRequest:
+        return {"groups": []}
+    if asset is None:
+        return {"groups": []}
+    filepath = asset.path
+    
+    meta = await io_pool.run(manifest.lookup, filepath)
+    if meta is None:
+        return {"groups": []}
+    return {"groups": meta["groups"], "fills": meta["fills"]}
+
+@app.get("/svg/{type}/{folder_name}/{icon_name}")
+async def get_svg_with_cors(type: str, folder_name: str, icon_name: str, request: Request,
+                            variant: str = None, precision: int = None):
+    """Serve SVG files with proper CORS headers for frontend fetch requests"""
+    try:
+        # Anything that is not an icon is looked up among the flags
+        asset_type = type if type in ("icon", "colorful-icon") else "flag"
+        try:
+            asset = asset_resolver.resolve(asset_type, folder_name, icon_name, None)
+        except InvalidAssetRequest:
+            asset = None
+        if asset is None:
+            return {"error": "File not found"}
+        file_path = asset.path
+        
+        session = request_session(request)
+        edits = await io_pool.run(workspaces.get, session, file_path) if session is not None else None
+        if edits is not None:
+            if variant is not None:
+                raise HTTPException(status_code=400, detail="Variants are not available for workspace edits")
+            data, digest = await io_pool.run(edited_svg, file_path, edits["colors"], edits["greyscale"])
+        else:
+            data, digest = await io_pool.run(svg_variant, file_path, variant, precision)
+        
+        # Return with proper headers
+        return encoded_bytes_response(
+            request,
+            data,
+            digest,
+            "image/svg+xml",
+            {
+                "Access-Control-Allow-Origin": "*",
+                "Access-Control-Allow-Methods": "GET, OPTIONS",
+                "Access-Control-Allow-Headers": "*"
+            }
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error serving SVG: {e}")
+        return {"error": "Failed to serve SVG"}
+
+@app.post("/update_color")
+async def update_color(req: UpdateColorRequest, request: Request):
+    session = request_session(request)
+    try:
+        print(f"DEBUG: update_color called with {req}", flush=True)
+        print("DEBUG: Starting function execution...", flush=True)
+        
+        # "icons" addresses the legacy unsplit tree; other types use the mode-specific directories
+        if req.type not in ("icon", "icons", "flag"):
+            print("DEBUG: Invalid type", flush=True)
+            return {"error": "Invalid type"}
+        try:
+            if req.type == "icons":
+                asset = asset_resolver.resolve("icon", req.folder, req.icon_name, None)
             else:
-                filepath = SINGLE_COLOR_DIR_LIGHT / req.icon_name
+                asset = asset_resolver.resolve(req.type, req.folder, req.icon_name, req.mode)
+        except InvalidAssetRequest as e:
+            return {"error": str(e)}
+        filepath = asset.path if asset is not None else None
+        
+        print(f"DEBUG: Filepath: {filepath}", flush=True)
+        
+        if filepath is None:
+            print(f"DEBUG: File not found: {req.icon_name}", flush=True)
+            return {"error": "File not found"}
+
+        if session is not None:
+            # A whole-file recolour supersedes the session's earlier group colours
+            return await io_pool.run(workspace_color_edit, session, filepath, req.group_id, req.color,
+                                     req.group_id == ENTIRE_SVG_GROUP)
+
+        async with file_locks.hold(filepath):
+            # Parse, recolour and write back on the edit pool, off the event loop
+            print(f"DEBUG: Updating group '{req.group_id}' with color {req.color}", flush=True)
+            updated = await edit_pool.run(edit_svg_file, filepath,
+                                          lambda root: apply_group_color(root, req.group_id, req.color))
+            if not updated:
+                print(f"DEBUG: Group '{req.group_id}' not found!", flush=True)
+                return {"error": "Group not found"}
+            print(f"DEBUG: File written successfully", flush=True)
+        
+            return {"status": "Color updated"}
+    except Exception as e:
+        print(f"DEBUG: Exception in update_color: {e}", flush=True)
+        import traceback
+        print(f"DEBUG: Traceback: {traceback.format_exc()}", flush=True)
+        return {"error": f"Internal server error: {str(e)}"}
+
+@app.get("/colorful-icons")
+async def get_colorful_icons(request: Request):
+    return await catalog_response(request, "colorful-icons", ["colorful-icons"],
+                            lambda: {"folders": catalog.get("colorful-icons")["folders"]})
+
+@app.get("/single-color")
+async def get_single_color_icons(request: Request):
+    def build():
+        # Unique icon names across both light and dark mode directories
+        all_files = set(catalog.get("single-color-light")["all_stems"])
+        all_files.update(catalog.get("single-color-dark")["all_stems"])
+        return {"icons": sorted(all_files)}
+    return await catalog_response(request, "single-color", ["single-color-light", "single-color-dark"], build)
+
+# --- Catalog API v2 ---
+CATALOG_FIELDS = ("type", "mode", "folder", "name", "file", "hash", "size", "view_box", "groups", "fills", "greyscale", "url", "static_url")
+CATALOG_PAGE_LIMIT = int(os.getenv('CATALOG_PAGE_LIMIT', '500'))
+
+def encode_cursor(key: tuple) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode('utf-8')).decode('ascii').rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        key = tuple(json.loads(base64.urlsafe_b64decode(padded.encode('ascii'))))
+        if len(key) != 5 or not all(isinstance(part, str) for part in key):
+            raise ValueError("malformed key")
+        return key
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def catalog_collections_for(asset_type: str = None, mode: str = None) -> list:
+    """Item collections matching the filters, ordered so their items concatenate in key order"""
+    collections = [
+        c for c in catalog.collections.values()
+        if c.asset_type and (asset_type is None or c.asset_type == asset_type)
+        and (mode is None or c.mode is None or c.mode == mode)
+    ]
+    return sorted(collections, key=lambda c: (c.asset_type, c.mode or ""))
+
+@app.get("/v2/icons")
+async def list_catalog(
+    request: Request,
+    type: str = None,
+    folder: str = None,
+    mode: str = None,
+    q: str = None,
+    limit: int = Query(100, ge=1),
+    cursor: str = None,
+    fields: str = None,
+):
+    """Cursor-paginated catalog listing with optional filters and sparse fieldsets"""
+    collections = catalog_collections_for(type, mode)
+    if type is not None and not collections:
+        raise HTTPException(status_code=400, detail=f"Unknown type: {type}")
+    if mode is not None and mode not in ("light", "dark"):
+        raise HTTPException(status_code=400, detail=f"Unknown mode: {mode}")
+
+    selected = CATALOG_FIELDS
+    if fields:
+        selected = tuple(f.strip() for f in fields.split(",") if f.strip())
+        unknown = [f for f in selected if f not in CATALOG_FIELDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+
+    limit = min(limit, CATALOG_PAGE_LIMIT)
+    after = decode_cursor(cursor) if cursor else None
+    needle = q.lower() if q else None
+
+    def build():
+        page = []
+        has_more = False
+        for collection in collections:
+            snapshot = catalog.get(collection.name)
+            items = snapshot["by_folder"].get(folder, []) if folder is not None else snapshot["items"]
+            start = 0
+            if after is not None:
+                start = bisect.bisect_right(items, after, key=catalog_item_key)
+            for item in items[start:]:
+                if needle and needle not in item["name"].lower():
+                    continue
+                if len(page) == limit:
+                    has_more = True
+                    break
+                page.append(item)
+            if has_more:
+                break
+
+        next_cursor = encode_cursor(catalog_item_key(page[-1])) if has_more else None
+        return {
+            "items": [{f: item[f] for f in selected} for item in page],
+            "next_cursor": next_cursor,
+        }
+
+    view_key = ("v2", type, folder, mode, needle, limit, after, selected)
+    return await catalog_response(request, view_key, [c.name for c in collections], build)
+
+def folder_exists(collections: list, folder_name: str) -> bool:
+    """Whether any of the collections has the folder"""
+    return any(folder_name in catalog.get(c.name)["files"] for c in collections)
+
+def folder_variants(collections: list, folder_name: str) -> dict:
+    """name -> {mode: catalog item} for one folder across the light/dark collections of a type"""
+    entries = {}
+    for collection in collections:
+        for item in catalog.get(collection.name)["by_folder"].get(folder_name, []):
+            entries.setdefault(item["name"], {})[collection.mode or "light"] = item
+            if collection.mode is None:
+                # Mode-independent assets render the same file in both modes
+                entries[item["name"]]["dark"] = item
+    return entries
+
+def pick_variant(variants: dict, mode: str) -> dict:
+    return variants.get(mode) or variants.get("dark" if mode == "light" else "light")
+
+def catalog_item_path(item: dict) -> Path:
+    return catalog.collections[item["collection"]].root / item["rel"]
+
+@app.get("/gallery/{type}/{folder_name}")
+async def get_gallery(type: str, folder_name: str, request: Request, mode: str = "light"):
+    """Everything needed to render a folder in one response: modes, groups, greyscale, viewBox, hash"""
+    if mode not in ("light", "dark"):
+        raise HTTPException(status_code=400, detail=f"Unknown mode: {mode}")
+    collections = catalog_collections_for(type)
+    if not collections:
+        raise HTTPException(status_code=400, detail=f"Unknown type: {type}")
+
+    def build():
+        entries = folder_variants(collections, folder_name)
+        icons = []
+        for name in sorted(entries):
+            variants = entries[name]
+            primary = pick_variant(variants, mode)
+            icons.append({
+                "name": name,
+                "file": primary["file"],
+                "modes": {m: m in variants for m in ("light", "dark")},
+                "groups": primary["groups"],
+                "greyscale": primary["greyscale"],
+                "view_box": primary["view_box"],
+                "hash": primary["hash"],
+                "url": primary["url"],
+                "static_url": primary["static_url"],
+                "variants": {m: {"hash": v["hash"], "url": v["url"], "static_url": v["static_url"]}
+                             for m, v in variants.items()},
+            })
+        return {"type": type, "folder": folder_name, "mode": mode, "icons": icons}
+
+    if not await io_pool.run(folder_exists, collections, folder_name):
+        raise HTTPException(status_code=404, detail="Folder not found")
+    return await catalog_response(request, ("gallery", type, folder_name, mode), [c.name for c in collections], build)
+
+# --- SVG Minification ---
+# A served "min" representation of each SVG: editor metadata stripped, numbers rounded
+# to SVG_MIN_PRECISION decimals, path data compacted and repeated paths collapsed into
+# <use>. The files on disk are never touched, so editing keeps working on the originals.
+SVG_MIN_PRECISION = int(os.getenv('SVG_MIN_PRECISION', '3'))
+DERIVED_CACHE_BYTES = int(os.getenv('DERIVED_CACHE_BYTES', str(32 * 1024 * 1024)))
+XLINK_NS = "http://www.w3.org/1999/xlink"
+KEEP_NAMESPACES = ("", SVG_NS, XLINK_NS, "http://www.w3.org/XML/1998/namespace")
+TEXT_TAGS = ("text", "tspan", "textPath", "title", "desc")
+NUMERIC_ATTRIBUTES = ("x", "y", "x1", "y1", "x2", "y2", "cx", "cy", "r", "rx", "ry", "width", "height")
+PATH_ARITY = {"m": 2, "l": 2, "t": 2, "h": 1, "v": 1, "c": 6, "s": 4, "q": 4, "a": 7, "z": 0}
+PATH_NUMBER_RE = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+REUSE_MIN_PATH_LENGTH = 32
+
+derived_cache = VariantCache(DERIVED_CACHE_BYTES)
+
+def format_number(value: float, precision: int) -> str:
+    """Shortest decimal text for value rounded to precision (".5" rather than "0.500")"""
+    text = f"{round(value, precision):.{precision}f}".rstrip("0").rstrip(".")
+    if text in ("", "-0"):
+        return "0"
+    if text.startswith("0."):
+        return text[1:]
+    if text.startswith("-0."):
+        return "-" + text[2:]
+    return text
+
+def parse_path_data(d: str) -> list:
+    """Split path data into (command, [numbers]) segments; arc flags may be written unseparated"""
+    segments = []
+    command, args, pos = None, [], 0
+    while pos < len(d):
+        ch = d[pos]
+        if ch in " ,\t\n\r":
+            pos += 1
+        elif ch.lower() in PATH_ARITY:
+            if command is not None:
+                segments.append((command, args))
+            command, args = ch, []
+            pos += 1
+        elif command in ("A", "a") and len(args) % 7 in (3, 4) and ch in "01":
+            args.append(float(ch))
+            pos += 1
+        else:
+            match = PATH_NUMBER_RE.match(d, pos)
+            if match is None or command is None:
+                raise ValueError(f"Invalid path data near {d[pos:pos + 10]!r}")
+            args.append(float(match.group()))
+            pos = match.end()
+    if command is not None:
+        segments.append((command, args))
+    return segments
+
+def compact_path_data(d: str, precision: int) -> str:
+    out = []
+    previous_command = None
+    last_number = None
+    for command, args in parse_path_data(d):
+        arity = PATH_ARITY[command.lower()]
+        if arity and len(args) % arity:
+            return d  # malformed; leave it exactly as authored
+        # A repeated command letter is implicit, except moveto whose repeats mean lineto
+        if command != previous_command or command in ("M", "m") or arity == 0:
+            out.append(command)
+            last_number = None
+        for value in args:
+            text = format_number(value, precision)
+            if last_number is not None and not text.startswith("-") and not (
+                    text.startswith(".") and ("." in last_number or "e" in last_number)):
+                out.append(" ")
+            out.append(text)
+            last_number = text
+        previous_command = command
+    return "".join(out)
+
+def compact_number_list(value: str, precision: int) -> str:
+    return PATH_NUMBER_RE.sub(lambda m: format_number(float(m.group()), precision), value)
+
+def minify_svg(data: bytes, precision: int = SVG_MIN_PRECISION) -> bytes:
+    """Minified copy of an SVG document; the input bytes are left untouched"""
+    ET.register_namespace('', SVG_NS)
+    ET.register_namespace('xlink', XLINK_NS)
+    root = ET.fromstring(data)
+    has_stylesheet = root.find(f".//{{{SVG_NS}}}style") is not None
+
+    referenced = set(re.findall(rb'url\(\s*#([^)\s]+)\s*\)', data))
+    referenced.update(re.findall(rb'href="#([^"]+)"', data))
+    referenced = {ref.decode('utf-8', 'replace') for ref in referenced}
+
+    parents = {}
+    for parent in root.iter():
+        for child in list(parent):
+            namespace = child.tag[1:].split("}")[0] if isinstance(child.tag, str) and child.tag.startswith("{") else ""
+            if not isinstance(child.tag, str) or namespace not in KEEP_NAMESPACES or child.tag.endswith("metadata"):
+                parent.remove(child)
+                continue
+            parents[child] = parent
+
+    for element in root.iter():
+        local = element.tag.split("}")[-1]
+        for attribute in list(element.attrib):
+            namespace = attribute[1:].split("}")[0] if attribute.startswith("{") else ""
+            if namespace not in KEEP_NAMESPACES or attribute.startswith("data-"):
+                del element.attrib[attribute]
+        element_id = element.get("id")
+        # Illustrator mangles layer names into ids like "_Ñëîé_1"; drop them unless referenced
+        if element_id and not element_id.isascii() and element_id not in referenced:
+            del element.attrib["id"]
+        if "d" in element.attrib:
+            element.set("d", compact_path_data(element.get("d"), precision))
+        if "points" in element.attrib:
+            element.set("points", " ".join(compact_number_list(element.get("points"), precision).split()))
+        for attribute in NUMERIC_ATTRIBUTES:
+            value = element.get(attribute)
+            if value and PATH_NUMBER_RE.fullmatch(value.strip()):
+                element.set(attribute, format_number(float(value), precision))
+        if local == "style" and element.text:
+            element.text = re.sub(r'\s*([{};:,])\s*', r'\1', " ".join(element.text.split()))
+        if local not in TEXT_TAGS:
+            if element.text is not None and not element.text.strip():
+                element.text = None
+            if element.tail is not None and not element.tail.strip():
+                element.tail = None
+
+    if not has_stylesheet:
+        collapse_repeated_paths(root, parents)
+    # ElementTree writes empty elements as "<path ... />"; attribute values never hold a raw ">"
+    return ET.tostring(root, encoding='unicode').replace(" />", "/>").encode('utf-8')
+
+def collapse_repeated_paths(root, parents: dict):
+    """Move path data used more than once into <defs> and reference it with <use>"""
+    excluded = ("defs", "clipPath", "mask", "pattern", "symbol", "marker")
+    by_data = {}
+    for element in root.iter(f"{{{SVG_NS}}}path"):
+        ancestor, skip = parents.get(element), False
+        while ancestor is not None:
+            if ancestor.tag.split("}")[-1] in excluded:
+                skip = True
+                break
+            ancestor = parents.get(ancestor)
+        if not skip and "id" not in element.attrib and len(element.get("d", "")) >= REUSE_MIN_PATH_LENGTH:
+            by_data.setdefault(element.get("d"), []).append(element)
+
+    repeated = [(d, elements) for d, elements in by_data.items() if len(elements) > 1]
+    if not repeated:
+        return
+    defs = root.find(f"{{{SVG_NS}}}defs")
+    if defs is None:
+        defs = ET.Element(f"{{{SVG_NS}}}defs")
+        root.insert(0, defs)
+    used_ids = {element.get("id") for element in root.iter() if element.get("id")}
+    counter = 0
+    for d, elements in repeated:
+        while f"u{counter}" in used_ids:
+            counter += 1
+        ref_id = f"u{counter}"
+        used_ids.add(ref_id)
+        ET.SubElement(defs, f"{{{SVG_NS}}}path", {"id": ref_id, "d": d})
+        for element in elements:
+            parent = parents[element]
+            attributes = {k: v for k, v in element.attrib.items() if k != "d"}
+            use = ET.Element(f"{{{SVG_NS}}}use", {"href": f"#{ref_id}", **attributes})
+            use.tail = element.tail
+            parent.insert(list(parent).index(element), use)
+            parent.remove(element)
+
+def svg_variant(path: Path, variant: str = None, precision: int = None) -> tuple:
+    """(bytes, digest) of an SVG file or one of its served variants"""
+    data = asset_cache.get(path)
+    digest = asset_digest(path, data)
+    if variant is None:
+        return data, digest
+    if variant == "min":
+        precision = SVG_MIN_PRECISION if precision is None else max(0, min(precision, 6))
+        key = (digest, "min", precision)
+        return derived_cache.get_or_build(key, lambda: minify_svg(data, precision)), f"{digest}-min{precision}"
+    if variant == "greyscale":
+        # Luma-converted paint baked into the markup; the file on disk is left as is
+        return derived_cache.get_or_build((digest, "greyscale"), lambda: greyscale_svg_bytes(data)), f"{digest}-grey"
+    raise HTTPException(status_code=400, detail=f"Unknown variant: {variant}")
+
+MIN_SIZE_CACHE_ENTRIES = int(os.getenv('MIN_SIZE_CACHE_ENTRIES', '100000'))
+MIN_REPORT_CACHE_BYTES = int(os.getenv('MIN_REPORT_CACHE_BYTES', str(8 * 1024 * 1024)))
+
+# (sha256, precision) -> (minified length,), the length None if the file does not parse
+minified_sizes = VariantCache(MIN_SIZE_CACHE_ENTRIES, weigh=lambda entry: 1)
+# (catalog generation, type, folder, mode, precision) -> report JSON; old generations age out
+min_reports = VariantCache(MIN_REPORT_CACHE_BYTES)
+
+def minified_lengths(paths: list, precision: int) -> list:
+    """Minified size of each file, None where it cannot be minified; runs in a worker process"""
+    lengths = []
+    for path in paths:
+        try:
+            lengths.append(len(minify_svg(Path(path).read_bytes(), precision)))
+        except (ET.ParseError, OSError) as e:
+            print(f"Warning: could not minify {path}: {e}")
+            lengths.append(None)
+    return lengths
+
+@app.get("/min-report")
+async def get_min_report(type: str = None, folder: str = None, mode: str = None, precision: int = None):
+    """Size reduction of the minified representation over the matching catalog items"""
+    precision = SVG_MIN_PRECISION if precision is None else max(0, min(precision, 6))
+    key = (catalog.generation, type, folder, mode, precision)
+    cached = min_reports.get(key)
+    if cached is not None:
+        return Response(content=cached, media_type="application/json")
+
+    def collect():
+        svg_items = []
+        for collection in catalog_collections_for(type, mode):
+            snapshot = catalog.get(collection.name)
+            for item in snapshot["by_folder"].get(folder, []) if folder is not None else snapshot["items"]:
+                if item["file"].lower().endswith(".svg"):
+                    svg_items.append(item)
+        return svg_items
+    svg_items = await io_pool.run(collect)
+
+    # Only files whose content has not been measured before are minified, on the cpu pool
+    lengths = {}
+    missing = []
+    for item in svg_items:
+        entry = minified_sizes.get((item["hash"], precision))
+        if entry is None:
+            missing.append(item)
         else:
-            if mode == "dark":
-                filepath = ICON_DIR_DARK / req.folder / req.icon_name
+            lengths[item["hash"]] = entry[0]
+    if missing:
+        paths = [str(catalog_item_path(item)) for item in missing]
+        for item, length in zip(missing, await cpu_pool.run(minified_lengths, paths, precision)):
+            minified_sizes.put((item["hash"], precision), (length,))
+            lengths[item["hash"]] = length
+
+    items = [{"type": item["type"], "mode": item["mode"], "folder": item["folder"], "name": item["name"],
+              "original": item["size"], "minified": lengths[item["hash"]]}
+             for item in svg_items if lengths[item["hash"]] is not None]
+    original = sum(i["original"] for i in items)
+    minified = sum(i["minified"] for i in items)
+    report = {
+        "files": len(items),
+        "original_bytes": original,
+        "minified_bytes": minified,
+        "saved_percent": round(100 * (1 - minified / original), 2) if original else 0.0,
+        "items": items,
+    }
+    min_reports.put(key, json.dumps(report).encode('utf-8'))
+    return report
+
+# --- Folder Bundles ---
+# One response per folder: an SVG <symbol> sprite, a CSS sheet of mask-image data URIs,
+# or NDJSON of {name, hash, svg}. Bundles are built from the minified variants, keyed by
+# the content hashes of their members. Sprites and CSS sheets are built on the cpu pool and
+# served compressed like any other asset; NDJSON is streamed one member per line.
+BUNDLE_FORMATS = {"sprite": "image/svg+xml", "css": "text/css", "ndjson": "application/x-ndjson"}
+
+def css_identifier(name: str) -> str:
+    return re.sub(r'[^A-Za-z0-9_-]+', '-', name).strip('-') or "icon"
+
+def scoped_svg_root(data: bytes, prefix: str):
+    """Parse an SVG and prefix its ids and classes so many icons can share one document"""
+    root = ET.fromstring(data)
+    ids = {element.get("id") for element in root.iter() if element.get("id")}
+    for element in root.iter():
+        if element.get("id"):
+            element.set("id", f"{prefix}{element.get('id')}")
+        if element.get("class"):
+            element.set("class", " ".join(f"{prefix}{c}" for c in element.get("class").split()))
+        for attribute, value in list(element.attrib.items()):
+            if "#" in value and attribute != "id":
+                value = re.sub(r'url\(\s*#([^)\s]+)\s*\)',
+                               lambda m: f"url(#{prefix}{m.group(1)})" if m.group(1) in ids else m.group(0), value)
+                if attribute.endswith("href") and value.startswith("#") and value[1:] in ids:
+                    value = f"#{prefix}{value[1:]}"
+                element.set(attribute, value)
+        if element.tag.endswith("style") and element.text:
+            element.text = re.sub(r'\.(-?[_a-zA-Z][\w-]*)', lambda m: f".{prefix}{m.group(1)}", element.text)
+            element.text = re.sub(r'#([\w-]+)(?=[^{}]*\{)',
+                                  lambda m: f"#{prefix}{m.group(1)}" if m.group(1) in ids else m.group(0), element.text)
+    return root
+
+def ndjson_line(name: str, digest: str, data: bytes) -> bytes:
+    return serialize_json({"name": name, "hash": digest, "svg": data.decode('utf-8')}) + b"\n"
+
+def build_bundle(members: list, fmt: str) -> bytes:
+    """members: (name, hash, minified svg bytes) in display order"""
+    ET.register_namespace('', SVG_NS)
+    if fmt == "ndjson":
+        return b"".join(ndjson_line(*member) for member in members)
+    if fmt == "css":
+        # Each class only sets a custom property, so the data URI is not repeated per prefix
+        rules = ['[class^="icon-"],[class*=" icon-"]{-webkit-mask-image:var(--icon);mask-image:var(--icon);'
+                 '-webkit-mask-repeat:no-repeat;mask-repeat:no-repeat;-webkit-mask-size:contain;mask-size:contain}']
+        for name, _, data in members:
+            uri = "data:image/svg+xml;charset=utf-8," + quote(data.decode('utf-8'), safe=" /:=;,.-_()'")
+            rules.append(f'.icon-{css_identifier(name)}{{--icon:url("{uri}")}}')
+        return "\n".join(rules).encode('utf-8')
+
+    sprite = ET.Element(f"{{{SVG_NS}}}svg", {"style": "display:none"})
+    for index, (name, _, data) in enumerate(members):
+        root = scoped_svg_root(data, f"i{index}-")
+        symbol = ET.SubElement(sprite, f"{{{SVG_NS}}}symbol", {"id": css_identifier(name)})
+        if root.get("viewBox"):
+            symbol.set("viewBox", root.get("viewBox"))
+        symbol.extend(list(root))
+    return ET.tostring(sprite, encoding='unicode').replace(" />", "/>").encode('utf-8')
+
+def bundle_from_files(members: list, fmt: str) -> bytes:
+    """members: (name, hash, path); minifies and bundles them in a worker process"""
+    minified = []
+    for name, digest, path in members:
+        try:
+            minified.append((name, digest, minify_svg(Path(path).read_bytes(), SVG_MIN_PRECISION)))
+        except (ET.ParseError, OSError) as e:
+            print(f"Warning: skipping {name} in bundle: {e}")
+    return build_bundle(minified, fmt)
+
+async def stream_ndjson_bundle(members: list, encoding: str):
+    """One line per member as soon as it is minified, gzip-flushed per line when negotiated"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if encoding == "gzip" else None
+    for name, digest, path in members:
+        try:
+            data, _ = await io_pool.run(svg_variant, path, "min")
+        except (ET.ParseError, FileNotFoundError) as e:
+            print(f"Warning: skipping {name} in bundle: {e}")
+            continue
+        line = ndjson_line(name, digest, data)
+        yield compressor.compress(line) + compressor.flush(zlib.Z_SYNC_FLUSH) if compressor else line
+    if compressor:
+        yield compressor.flush()
+
+@app.get("/bundle/{type}/{folder_name}")
+async def get_bundle(type: str, folder_name: str, request: Request, mode: str = "light", format: str = "sprite"):
+    """Every SVG of a folder in one response, as a sprite, a CSS sheet or NDJSON"""
+    if format not in BUNDLE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format: {format}")
+    if mode not in ("light", "dark"):
+        raise HTTPException(status_code=400, detail=f"Unknown mode: {mode}")
+    collections = catalog_collections_for(type)
+    if not collections:
+        raise HTTPException(status_code=400, detail=f"Unknown type: {type}")
+    entries = await io_pool.run(folder_variants, collections, folder_name)
+    if not entries and not await io_pool.run(folder_exists, collections, folder_name):
+        raise HTTPException(status_code=404, detail="Folder not found")
+
+    chosen = [(name, pick_variant(entries[name], mode)) for name in sorted(entries)]
+    chosen = [(name, item) for name, item in chosen if item["file"].lower().endswith(".svg")]
+    digest = hashlib.blake2b(
+        "|".join([format, str(SVG_MIN_PRECISION), *(item["hash"] for _, item in chosen)]).encode('utf-8'),
+        digest_size=10).hexdigest()
+
+    members = [(name, item["hash"][:ASSET_HASH_LENGTH], catalog_item_path(item)) for name, item in chosen]
+    headers = {
+        "Cache-Control": "no-cache",
+        "Access-Control-Allow-Origin": "*",
+        "Access-Control-Allow-Methods": "GET, OPTIONS",
+        "Access-Control-Allow-Headers": "*"
+    }
+
+    if format == "ndjson":
+        encoding = "gzip" if "gzip" in negotiate_encodings(request) else None
+        headers["Vary"] = "Accept-Encoding"
+        headers["ETag"] = f'"bundle-{digest}-{encoding}"' if encoding else f'"bundle-{digest}"'
+        if etag_matches(request, headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return StreamingResponse(stream_ndjson_bundle(members, encoding), media_type=BUNDLE_FORMATS[format],
+                                 headers=headers)
+
+    body = derived_cache.get(("bundle", digest))
+    if body is None:
+        body = await cpu_pool.run(bundle_from_files, [(n, d, str(p)) for n, d, p in members], format)
+        derived_cache.put(("bundle", digest), body)
+    return encoded_bytes_response(request, body, f"bundle-{digest}", BUNDLE_FORMATS[format], headers)
+
+# --- Recolor Templates ---
+# Each SVG is compiled once into byte segments separated by colour slots, where a slot is
+# the fill that update_color would rewrite for a shape in a given group. A recolour is then
+# a join over cached segments, with no parsing, no serialization and no disk writes.
+TEMPLATE_CACHE_BYTES = int(os.getenv('TEMPLATE_CACHE_BYTES', str(32 * 1024 * 1024)))
+ENTIRE_SVG_GROUP = "entire_flag"  # pseudo-group that recolours every shape, as in update_color
+COLOR_VALUE_PATTERN = re.compile(r'#[0-9a-fA-F]{3}(?:[0-9a-fA-F]{3})?(?:[0-9a-fA-F]{2})?|none')
+# Slots are marked by private-use characters inside values, or by a marker attribute where
+# update_color would add a fill attribute that does not exist yet
+SLOT_MARKER = re.compile(rb'\xee\x80\x80(\d+)\xee\x80\x81| data-color-slot-(\d+)="1"')
+FILL_ATTRIBUTE_FORMAT = ' fill="{}"'
+STYLE_HEX_FILL = re.compile(r'fill\s*:\s*#[0-9a-fA-F]{3,6}')
+
+template_cache = VariantCache(TEMPLATE_CACHE_BYTES)
+
+class SvgTemplate:
+    """Serialized SVG split at colour slots; slot i sits between segments i and i+1"""
+    def __init__(self, segments: list, slots: list, groups: list):
+        self.segments = segments
+        self.slots = slots  # (groups innermost first, default bytes, format with one {} for the colour)
+        self.groups = groups
+
+    def __len__(self):
+        # Approximate footprint, so VariantCache can budget templates like byte strings
+        return sum(len(s) for s in self.segments) + 64 * len(self.slots)
+
+    def render(self, colors: dict) -> bytes:
+        encoded = {group: color.encode('ascii') for group, color in colors.items()}
+        parts = [self.segments[0]]
+        for (groups, default, fmt), segment in zip(self.slots, self.segments[1:]):
+            for group in groups:
+                if group in encoded:
+                    parts.append(fmt.replace(b"{}", encoded[group]))
+                    break
+            else:
+                parts.append(default)
+            parts.append(segment)
+        return b"".join(parts)
+
+def compile_svg_template(data: bytes) -> SvgTemplate:
+    """Template mirroring apply_group_color: shapes per group, every element for entire_flag"""
+    ET.register_namespace('', SVG_NS)
+    root = ET.fromstring(data)
+    # update_color drops root-level <style> blocks on any edit, so recoloured output never has them
+    for style_block in list(root.findall(f"{{{SVG_NS}}}style")):
+        root.remove(style_block)
+
+    slots = []
+    def slot(groups, default, fmt) -> int:
+        slots.append((groups, default.encode('utf-8'), fmt.encode('utf-8')))
+        return len(slots) - 1
+
+    def marker(groups, default, fmt) -> str:
+        return f"\ue000{slot(groups, default, fmt)}\ue001"
+
+    group_ids = []
+    def visit(element, groups):
+        # entire_flag recolours every element; a named group only the shapes below it
+        slot_groups = groups if element.tag.endswith(SHAPE_TAGS) else (ENTIRE_SVG_GROUP,)
+        has_fill, has_style = 'fill' in element.attrib, 'style' in element.attrib
+        if has_fill:
+            element.set('fill', marker(slot_groups, element.get('fill'), '{}'))
+        if has_style:
+            style = element.get('style')
+            replaced = STYLE_HEX_FILL.sub(lambda m: marker(slot_groups, m.group(0), 'fill:{}'), style)
+            if 'fill:' not in style and not STYLE_HEX_FILL.search(style):
+                replaced += marker(slot_groups, '', ';fill:{}')
+            element.set('style', replaced)
+        if not has_fill and not has_style:
+            element.set(f"data-color-slot-{slot(slot_groups, '', FILL_ATTRIBUTE_FORMAT)}", "1")
+        if element.tag == f"{{{SVG_NS}}}g" and element.get('id') and element.get('id') not in group_ids:
+            # update_color targets the first group with an id, and everything inside it
+            group_ids.append(element.get('id'))
+            groups = (element.get('id'),) + groups
+        for child in element:
+            visit(child, groups)
+    visit(root, (ENTIRE_SVG_GROUP,))
+
+    buffer = io.BytesIO()
+    ET.ElementTree(root).write(buffer, encoding='utf-8', xml_declaration=True)
+    pieces = SLOT_MARKER.split(buffer.getvalue())
+    # split() yields text, then both capture groups for each marker
+    segments = pieces[0::3]
+    order = [int(a or b) for a, b in zip(pieces[1::3], pieces[2::3])]
+    return SvgTemplate(segments, [slots[i] for i in order], group_ids)
+
+def svg_template(path: Path) -> tuple:
+    """(template, digest) for an SVG file, compiled once per content hash"""
+    data = asset_cache.get(path)
+    digest = asset_digest(path, data)
+    return template_cache.get_or_build(digest, lambda: compile_svg_template(data)), digest
+
+RENDER_COLOR_PREFIX = "c."  # colour params are namespaced so cache-busters and tracking params pass through
+
+@app.get("/render/{type}/{folder_name}/{icon_name}")
+async def render_recolored_svg(type: str, folder_name: str, icon_name: str, request: Request, mode: str = None):
+    """Recolour without touching disk: /render/icon/Business/x.svg?c.Color=%23ff0000&c.Grey=%23888"""
+    try:
+        asset = asset_resolver.resolve(type, folder_name, icon_name, mode)
+    except InvalidAssetRequest as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if asset is None or asset.path.suffix.lower() != ".svg":
+        raise HTTPException(status_code=404, detail="File not found")
+
+    session = request_session(request)
+    colors = {k[len(RENDER_COLOR_PREFIX):]: v for k, v in request.query_params.items()
+              if k.startswith(RENDER_COLOR_PREFIX)}
+    for group_id, color in colors.items():
+        if not COLOR_VALUE_PATTERN.fullmatch(color):
+            raise HTTPException(status_code=400, detail=f"Invalid color for {group_id}: {color}")
+
+    try:
+        template, digest = await io_pool.run(svg_template, asset.path)
+    except ET.ParseError as e:
+        raise HTTPException(status_code=422, detail=f"Could not parse SVG: {e}")
+    unknown = [g for g in colors if g not in template.groups and g != ENTIRE_SVG_GROUP]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown group: {', '.join(unknown)}")
+
+    edits = await io_pool.run(workspaces.get, session, asset.path) if session is not None else None
+    if edits is not None:
+        # Preview on top of what the session has already edited
+        data, digest = await io_pool.run(edited_svg, asset.path, {**edits["colors"], **colors}, edits["greyscale"])
+    elif colors:
+        data = template.render(colors)
+        params = "&".join(f"{k}={v}" for k, v in sorted(colors.items()))
+        digest = f"{digest}-{hashlib.blake2b(params.encode('utf-8'), digest_size=8).hexdigest()}"
+    else:
+        data = await io_pool.run(asset_cache.get, asset.path)
+    return encoded_bytes_response(
+        request,
+        data,
+        digest,
+        "image/svg+xml",
+        {
+            "Cache-Control": "no-cache",
+            "Access-Control-Allow-Origin": "*",
+            "Access-Control-Allow-Methods": "GET, OPTIONS",
+            "Access-Control-Allow-Headers": "*"
+        }
+    )
+
+# --- Edit Workspaces ---
+# Opt-in copy-on-write editing: requests carrying a session id (X-Session-Id header or
+# ?session=) record their edits as deltas against the shared library instead of rewriting
+# it. Edited content is derived on demand from the recolor templates, and a reset is a delete.
+WORKSPACE_DB_PATH = Path(os.getenv('WORKSPACE_DB_PATH', str(BASE_DIR / "workspaces.sqlite3")))
+WORKSPACE_TTL = int(os.getenv('WORKSPACE_TTL', str(30 * 24 * 3600)))  # idle seconds before a workspace expires
+SESSION_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]{8,64}')
+NAMED_COLORS = {
+    b"black": (0, 0, 0), b"white": (255, 255, 255), b"red": (255, 0, 0), b"lime": (0, 255, 0),
+    b"green": (0, 128, 0), b"blue": (0, 0, 255), b"yellow": (255, 255, 0), b"cyan": (0, 255, 255),
+    b"aqua": (0, 255, 255), b"magenta": (255, 0, 255), b"fuchsia": (255, 0, 255), b"silver": (192, 192, 192),
+    b"gray": (128, 128, 128), b"grey": (128, 128, 128), b"maroon": (128, 0, 0), b"olive": (128, 128, 0),
+    b"purple": (128, 0, 128), b"teal": (0, 128, 128), b"navy": (0, 0, 128), b"orange": (255, 165, 0),
+}
+PAINT_VALUE = re.compile(
+    rb'((?<![\w-])(?:fill|stroke|stop-color|flood-color|lighting-color)\s*(?:=\s*["\']|:\s*))'
+    rb'(#[0-9a-fA-F]{3,8}\b|rgba?\([^)]*\)|[a-zA-Z]+\b)')
+
+def paint_rgb(value: bytes):
+    """(r, g, b) of a CSS colour value, or None for none/currentColor/url() and unknown names"""
+    if value.startswith(b"#"):
+        digits = value[1:]
+        if len(digits) in (3, 4):
+            return tuple(int(c * 2, 16) for c in (digits[0:1], digits[1:2], digits[2:3]))
+        if len(digits) in (6, 8):
+            return tuple(int(digits[i:i + 2], 16) for i in (0, 2, 4))
+        return None
+    if value.lower().startswith(b"rgb"):
+        channels = re.findall(rb'[\d.]+%?', value)[:3]
+        if len(channels) != 3:
+            return None
+        return tuple(round(float(c[:-1]) * 2.55) if c.endswith(b"%") else round(float(c)) for c in channels)
+    return NAMED_COLORS.get(value.lower())
+
+def paint_alpha(value: bytes):
+    """Alpha component of a CSS colour exactly as written (hex digits or rgba() token), or None if opaque"""
+    if value.startswith(b"#"):
+        digits = value[1:]
+        if len(digits) == 4:
+            return digits[3:4] * 2
+        if len(digits) == 8:
+            return digits[6:8]
+        return None
+    if value.lower().startswith(b"rgb"):
+        channels = re.findall(rb'[\d.]+%?', value)
+        return channels[3] if len(channels) == 4 else None
+    return None
+
+def greyscale_svg_bytes(data: bytes) -> bytes:
+    """Replace every fill/stroke/stop colour with its luma grey, keeping alpha; no filters, no re-serialization"""
+    def to_grey(match):
+        value = match.group(2)
+        rgb = paint_rgb(value)
+        if rgb is None:
+            return match.group(0)
+        luma = max(0, min(255, round(0.299 * rgb[0] + 0.587 * rgb[1] + 0.114 * rgb[2])))
+        alpha = paint_alpha(value)
+        if alpha is None:
+            return match.group(1) + b"#%02x%02x%02x" % (luma, luma, luma)
+        if value.startswith(b"#"):
+            return match.group(1) + b"#%02x%02x%02x" % (luma, luma, luma) + alpha
+        return match.group(1) + b"rgba(%d, %d, %d, %s)" % (luma, luma, luma, alpha)
+    return PAINT_VALUE.sub(to_grey, data)
+
+class WorkspaceStore:
+    """SQLite (WAL) table of per-session edits: group colours and a greyscale flag per asset"""
+    def __init__(self, db_path: Path, ttl: int):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS workspace_edits (
+                session TEXT NOT NULL,
+                path TEXT NOT NULL,
+                colors TEXT NOT NULL DEFAULT '{}',
+                greyscale INTEGER NOT NULL DEFAULT 0,
+                updated REAL NOT NULL,
+                PRIMARY KEY (session, path)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS workspace_edits_updated ON workspace_edits (updated)")
+        self._conn.commit()
+
+    @staticmethod
+    def _to_dict(row) -> dict:
+        return {"path": row["path"], "colors": json.loads(row["colors"]),
+                "greyscale": bool(row["greyscale"]), "updated": row["updated"]}
+
+    def get(self, session: str, path: Path) -> dict:
+        """The session's edits to a file, or None when it sees the shared version"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM workspace_edits WHERE session = ? AND path = ?",
+                                     (session, manifest.key(path))).fetchone()
+        return self._to_dict(row) if row is not None else None
+
+    def update(self, session: str, path: Path, colors: dict = None, replace: bool = False, greyscale: bool = None) -> dict:
+        """Merge colours into (or, with replace, substitute them for) the file's edits; optionally set greyscale"""
+        key = manifest.key(path)
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM workspace_edits WHERE session = ? AND path = ?",
+                                     (session, key)).fetchone()
+            edits = self._to_dict(row) if row is not None else {"colors": {}, "greyscale": False}
+            merged = dict(colors or {}) if replace else {**edits["colors"], **(colors or {})}
+            flag = edits["greyscale"] if greyscale is None else greyscale
+            self._conn.execute(
+                "INSERT OR REPLACE INTO workspace_edits (session, path, colors, greyscale, updated) VALUES (?, ?, ?, ?, ?)",
+                (session, key, json.dumps(merged, sort_keys=True), int(flag), time.time()))
+            self._conn.commit()
+        return {"path": key, "colors": merged, "greyscale": flag}
+
+    def reset(self, session: str, path: Path = None) -> int:
+        """Drop a session's edits to one file, or all of them"""
+        with self._lock:
+            if path is None:
+                cursor = self._conn.execute("DELETE FROM workspace_edits WHERE session = ?", (session,))
             else:
-                filepath = ICON_DIR_LIGHT / req.folder / req.icon_name
-    elif req.type == "colorful-icon":
-        if req.folder == "Root":
-            filepath = COLORFUL_ICON_DIR / req.icon_name
+                cursor = self._conn.execute("DELETE FROM workspace_edits WHERE session = ? AND path = ?",
+                                            (session, manifest.key(path)))
+            self._conn.commit()
+        return cursor.rowcount
+
+    def edits(self, session: str) -> list:
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM workspace_edits WHERE session = ? ORDER BY path",
+                                      (session,)).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def expire(self) -> int:
+        """Delete workspaces idle for longer than the TTL"""
+        with self._lock:
+            stale = [row[0] for row in self._conn.execute(
+                "SELECT session FROM workspace_edits GROUP BY session HAVING MAX(updated) < ?",
+                (time.time() - self.ttl,))]
+            self._conn.executemany("DELETE FROM workspace_edits WHERE session = ?", [(s,) for s in stale])
+            self._conn.commit()
+        return len(stale)
+
+workspaces = WorkspaceStore(WORKSPACE_DB_PATH, WORKSPACE_TTL)
+
+@app.on_event("startup")
+async def expire_workspaces():
+    expired = workspaces.expire()
+    if expired:
+        print(f"Expired {expired} idle edit workspaces")
+
+def request_session(request: Request) -> str:
+    """Session id from X-Session-Id or ?session=, or None for edits to the shared library"""
+    session = request.headers.get("x-session-id") or request.query_params.get("session")
+    if session is None:
+        return None
+    if not SESSION_ID_PATTERN.fullmatch(session):
+        raise HTTPException(status_code=400, detail="Invalid session id")
+    return session
+
+def edited_svg(path: Path, colors: dict, greyscale: bool) -> tuple:
+    """(bytes, digest) of a file with recolours and greyscale applied on the fly"""
+    if not colors and not greyscale:
+        return svg_variant(path)
+    template, digest = svg_template(path)
+    edit_key = json.dumps([colors, greyscale], sort_keys=True)
+    edit_digest = f"{digest}-{hashlib.blake2b(edit_key.encode('utf-8'), digest_size=8).hexdigest()}"
+
+    def build():
+        data = template.render(colors) if colors else asset_cache.get(path)
+        return greyscale_svg_bytes(data) if greyscale else data
+    return derived_cache.get_or_build(("edited", edit_digest), build), edit_digest
+
+def workspace_svg(session: str, path: Path) -> tuple:
+    """(bytes, digest) of a file as a session sees it"""
+    edits = workspaces.get(session, path) if session else None
+    if edits is None:
+        return svg_variant(path)
+    return edited_svg(path, edits["colors"], edits["greyscale"])
+
+def workspace_color_edit(session: str, path: Path, group_id: str, color: str, replace: bool = False) -> dict:
+    """Record a recolour in a workspace after the same checks update_color makes"""
+    if not COLOR_VALUE_PATTERN.fullmatch(color):
+        return {"error": "Invalid color"}
+    template, _ = svg_template(path)
+    if group_id != ENTIRE_SVG_GROUP and group_id not in template.groups:
+        return {"error": "Group not found"}
+    edits = workspaces.update(session, path, {group_id: color}, replace=replace)
+    return {"status": "Color updated in workspace", "session": session, "edits": edits}
+
+@app.get("/workspaces/{session}")
+async def get_workspace(session: str):
+    """Every file the session has edited, with its deltas"""
+    if not SESSION_ID_PATTERN.fullmatch(session):
+        raise HTTPException(status_code=400, detail="Invalid session id")
+    return {"session": session, "edits": await io_pool.run(workspaces.edits, session)}
+
+@app.delete("/workspaces/{session}")
+async def reset_workspace(session: str):
+    """Discard a session's edits; the shared library was never touched"""
+    if not SESSION_ID_PATTERN.fullmatch(session):
+        raise HTTPException(status_code=400, detail="Invalid session id")
+    return {"session": session, "reset": await io_pool.run(workspaces.reset, session)}
+
+# --- Batch Edits ---
+# POST /edits/batch applies many edits in one request. Operations are grouped per file, so
+# each file is parsed and written once. Files are processed concurrently on a thread pool,
+# each under its per-path lock, and results are reported per operation in request order.
+EDIT_OPERATION_TYPES = {
+    "color": "icon",
+    "single-color": "single-color",
+    "single-color-revert": "single-color",
+    "greyscale": "colorful-icon",
+    "revert": "colorful-icon",
+}
+BATCH_MAX_OPERATIONS = int(os.getenv('BATCH_MAX_OPERATIONS', '500'))
+def resolve_edit_target(op: EditOperation) -> Path:
+    """File an edit operation applies to; raises InvalidAssetRequest or FileNotFoundError"""
+    if op.op not in EDIT_OPERATION_TYPES:
+        raise InvalidAssetRequest(f"Unknown op: {op.op}")
+    asset_type = op.type or EDIT_OPERATION_TYPES[op.op]
+    # "icons" addresses the legacy unsplit tree, as in update_color
+    mode = None if asset_type == "icons" else op.mode
+    asset_type = "icon" if asset_type == "icons" else asset_type
+    name = op.icon_name if op.icon_name.lower().endswith(".svg") else f"{op.icon_name}.svg"
+    asset = asset_resolver.resolve(asset_type, op.folder, name, mode)
+    if asset is None:
+        raise FileNotFoundError(name)
+    if op.op in ("color", "single-color") and not op.color:
+        raise InvalidAssetRequest("color is required")
+    if op.op == "color" and not op.group_id:
+        raise InvalidAssetRequest("group_id is required")
+    return asset.path
+
+def apply_file_edits(filepath: Path, ops: list) -> tuple:
+    """Apply (index, op) pairs to one file in order and write it once; returns (results, manifest entry)"""
+    ET.register_namespace('', "http://www.w3.org/2000/svg")
+    current = asset_cache.get(filepath)
+    # A file without history gets its current bytes as the original on the first write,
+    # so a revert after an earlier op in this batch nets out as it would sequentially
+    original = versions.original(filepath)
+    tree = None
+    # Set by a revert: the original bytes, written as-is unless a later op edits them
+    reverted = None
+    results = []
+    changed = False
+    for index, op in ops:
+        if op.op == "revert":
+            if original is None and not changed:
+                results.append({"index": index, "error": "No backup found to revert from"})
+                continue
+            tree, reverted = None, original if original is not None else current
+            results.append({"index": index, "status": "Reverted to original colors"})
+            changed = True
+            continue
+        if tree is None:
+            tree = ET.ElementTree(ET.fromstring(reverted if reverted is not None else current))
+        root = tree.getroot()
+        if op.op == "color":
+            if not apply_group_color(root, op.group_id, op.color):
+                results.append({"index": index, "error": "Group not found"})
+                continue
+            results.append({"index": index, "status": "Color updated"})
+        elif op.op == "single-color":
+            apply_shape_color(root, op.color)
+            results.append({"index": index, "status": "Color updated successfully"})
+        elif op.op == "single-color-revert":
+            apply_default_shape_color(root, op.mode)
+            results.append({"index": index, "status": "Reverted to original color"})
+        else:
+            apply_greyscale_filter(root)
+            results.append({"index": index, "status": "Converted to greyscale"})
+        changed, reverted = True, None
+    if not changed:
+        entry = manifest.lookup(filepath)
+    elif reverted is not None:
+        entry = write_svg_bytes(filepath, reverted, label="revert")
+    else:
+        entry = write_svg_tree(tree, filepath)
+    return results, entry
+
+def apply_workspace_edits(session: str, filepath: Path, ops: list) -> tuple:
+    """Record (index, op) pairs as workspace deltas; returns (results, content digest)"""
+    results = []
+    for index, op in ops:
+        if op.op in ("revert", "single-color-revert"):
+            workspaces.reset(session, filepath)
+            result = {"status": "Reverted to original colors"}
+        elif op.op == "greyscale":
+            workspaces.update(session, filepath, greyscale=True)
+            result = {"status": "Converted to greyscale"}
         else:
-            filepath = COLORFUL_ICON_DIR / req.folder / req.icon_name
-    elif req.type == "flag":
-        filepath = FLAG_DIR / req.icon_name
+            group_id = op.group_id if op.op == "color" else ENTIRE_SVG_GROUP
+            result = workspace_color_edit(session, filepath, group_id, op.color,
+                                          replace=group_id == ENTIRE_SVG_GROUP)
+            result.pop("edits", None)
+            result.pop("session", None)
+        results.append({"index": index, **result})
+    return results, workspace_svg(session, filepath)[1]
+
+@app.post("/edits/batch")
+async def batch_edits(req: BatchEditRequest, request: Request):
+    """Apply recolor/greyscale/revert operations across many icons in one request"""
+    if len(req.operations) > BATCH_MAX_OPERATIONS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_OPERATIONS} operations per batch")
+    session = request_session(request)
+
+    results = [None] * len(req.operations)
+    by_file = OrderedDict()
+    for index, op in enumerate(req.operations):
+        try:
+            by_file.setdefault(resolve_edit_target(op), []).append((index, op))
+        except InvalidAssetRequest as e:
+            results[index] = {"index": index, "error": str(e)}
+        except FileNotFoundError:
+            results[index] = {"index": index, "error": "File not found"}
+
+    async def run(filepath: Path, ops: list):
+        key = manifest.key(filepath)
+        try:
+            if session is not None:
+                file_results, digest = await io_pool.run(apply_workspace_edits, session, filepath, ops)
+                return key, file_results, {"hash": digest}
+            async with file_locks.hold(filepath):
+                file_results, entry = await edit_pool.run(apply_file_edits, filepath, ops)
+            sha256 = entry["sha256"] if entry else None
+            return key, file_results, {"hash": sha256[:ASSET_HASH_LENGTH] if sha256 else None,
+                                       "url": asset_url(sha256, filepath.name) if sha256 else None}
+        except Exception as e:
+            return key, [{"index": index, "error": f"Failed to edit file: {e}"} for index, _ in ops], {}
+
+    files = {}
+    for key, file_results, info in await asyncio.gather(*(run(path, ops) for path, ops in by_file.items())):
+        files[key] = info
+        for result in file_results:
+            results[result["index"]] = {**result, "file": key}
+
+    return {
+        "results": results,
+        "files": files,
+        "succeeded": sum(1 for r in results if "error" not in r),
+        "failed": sum(1 for r in results if "error" in r),
+    }
+
+# --- Content-Addressed Assets ---
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+ASSET_MEDIA_TYPES = {".svg": "image/svg+xml", ".png": "image/png"}
+
+@app.get("/a/{asset_name}")
+async def get_asset_by_hash(asset_name: str, request: Request, variant: str = None, precision: int = None):
+    """Serve an asset by content hash with far-future caching"""
+    digest, _, extension = asset_name.partition(".")
+    media_type = ASSET_MEDIA_TYPES.get(f".{extension.lower()}")
+    if media_type is None or len(digest) < 8 or not re.fullmatch(r'[0-9a-f]+', digest):
+        raise HTTPException(status_code=404, detail="Asset not found")
+    path = await io_pool.run(manifest.find_by_hash, digest)
+    if path is None or path.suffix.lower() != f".{extension.lower()}":
+        raise HTTPException(status_code=404, detail="Asset not found")
+    if variant is not None and media_type == "image/svg+xml":
+        data, variant_digest = await io_pool.run(svg_variant, path, variant, precision)
+    elif variant is not None:
+        raise HTTPException(status_code=400, detail=f"Unknown variant: {variant}")
     else:
-        return {"error": "Invalid type"}
-    
-    if not filepath.exists():
-        return {"error": "File not found"}
+        data, variant_digest = await io_pool.run(svg_variant, path)
+    return encoded_bytes_response(
+        request,
+        data,
+        variant_digest,
+        media_type,
+        {
+            "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+            "Access-Control-Allow-Origin": "*",
+            "Access-Control-Allow-Methods": "GET, OPTIONS",
+            "Access-Control-Allow-Headers": "*"
+        }
+    )
 
-    try:
-        # Read the SVG file
-        with open(filepath, 'r', encoding='utf-8') as f:
-            svg_content = f.read()
-        
-        # Return the SVG content as a downloadable file
-        return StreamingResponse(
-            io.BytesIO(svg_content.encode('utf-8')),
-            media_type="image/svg+xml",
-            headers={
-                "Content-Disposition": f"attachment; filename={req.icon_name}",
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Methods": "POST, OPTIONS",
-                "Access-Control-Allow-Headers": "*"
-            }
-        )
-    except Exception as e:
-        return {"error": f"Failed to download SVG: {str(e)}"}
+@app.get("/cache-stats")
+async def get_cache_stats():
+    """Hit, miss and eviction counters for the in-process caches"""
+    return {"asset_cache": asset_cache.stats(), "encoded_cache": encoded_cache.stats(),
+            "derived_cache": derived_cache.stats(), "resolver": asset_resolver.stats(),
+            "template_cache": template_cache.stats(), "image_cache": image_cache.stats(),
+            "image_derivatives": image_derivatives.stats(), "raster_cache": raster_cache.stats(),
+            "raster_renders": raster_renders.stats(), "minified_sizes": minified_sizes.stats(),
+            "min_reports": min_reports.stats()}
 
-@app.post("/export-zip")
-async def export_zip(req: ZipExportRequest):
-    """Export multiple icons as a ZIP file"""
-    try:
-        # Create a ZIP file in memory
-        zip_buffer = io.BytesIO()
-        
-        # Get the mode from the request, default to light
-        mode = getattr(req, 'mode', 'light')
-        
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for item_name in req.items:
-                try:
-                    # Determine the source file path
-                    if req.type == "icon":
-                        if req.folder == "Root":
-                            if mode == "dark":
-                                source_path = ICON_DIR_DARK / f"{item_name}.svg"
-                            else:
-                                source_path = ICON_DIR_LIGHT / f"{item_name}.svg"
-                        else:
-                            if mode == "dark":
-                                source_path = ICON_DIR_DARK / req.folder / f"{item_name}.svg"
-                            else:
-                                source_path = ICON_DIR_LIGHT / req.folder / f"{item_name}.svg"
-                    elif req.type == "colorful-icon":
-                        if req.folder == "Root":
-                            source_path = COLORFUL_ICON_DIR / f"{item_name}.svg"
-                        else:
-                            source_path = COLORFUL_ICON_DIR / req.folder / f"{item_name}.svg"
-                    elif req.type == "single-color":
-                        if mode == "dark":
-                            source_path = SINGLE_COLOR_DIR_DARK / f"{item_name}.svg"
-                        else:
-                            source_path = SINGLE_COLOR_DIR_LIGHT / f"{item_name}.svg"
-                    else:  # flag
-                        source_path = FLAG_DIR / f"{item_name}.svg"
-                    
-                    if not source_path.exists():
-                        continue
-                    
-                    # Determine the filename in the ZIP
-                    if req.format == "png":
-                        # Convert SVG to PNG
-                        if CAIRO_AVAILABLE:
-                            png_data = cairosvg.svg2png(bytestring=source_path.read_text(encoding='utf-8').encode('utf-8'))
-                            zip_file.writestr(f"{item_name}.png", png_data)
-                        else:
-                            # Fallback to SVG if PNG conversion not available
-                            with open(source_path, 'rb') as f:
-                                zip_file.writestr(f"{item_name}.svg", f.read())
-                    else:
-                        # Export as SVG
-                        with open(source_path, 'rb') as f:
-                            zip_file.writestr(f"{item_name}.svg", f.read())
-                            
-                except Exception as e:
-                    print(f"Error processing {item_name}: {e}")
+# --- Search Index ---
+# Prebuilt prefix + trigram index over icon, folder, flag, infographic and BCORE names.
+# It is rebuilt lazily whenever a catalog snapshot or infographics/mapping.json changes.
+SEARCH_MIN_SIMILARITY = float(os.getenv('SEARCH_MIN_SIMILARITY', '0.3'))
+SEARCH_MAX_PREFIX = 16
+
+def split_name_tokens(text: str) -> list:
+    """Lower-case tokens from CamelCase, snake_case, spaced and hyphenated names"""
+    tokens = set()
+    for word in re.split(r'[^0-9A-Za-z]+', text):
+        if not word:
+            continue
+        tokens.add(word.lower())
+        for part in re.findall(r'[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+', word):
+            tokens.add(part.lower())
+    return sorted(tokens)
+
+def trigrams(text: str) -> set:
+    padded = f"  {text.lower()} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class SearchIndex:
+    """Ranked search-as-you-type over every named asset in the library"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._docs = []
+        self._prefixes = {}
+        self._trigrams = {}
+
+    def _source_stamp(self) -> tuple:
+        snapshots = catalog.versions(catalog.collections)
+        try:
+            mapping_mtime = (INFOGRAPHICS_DIR / "mapping.json").stat().st_mtime_ns
+        except FileNotFoundError:
+            mapping_mtime = None
+        try:
+            bcore_mtimes = tuple(d.stat().st_mtime_ns for d in [BCORE_DIR, *BCORE_DIR.iterdir()] if d.is_dir())
+        except FileNotFoundError:
+            bcore_mtimes = ()
+        return snapshots, mapping_mtime, bcore_mtimes
+
+    def _collect(self) -> list:
+        docs = {}
+
+        def add(key, title, extra_text, result):
+            doc = docs.get(key)
+            if doc is None:
+                docs[key] = {"title": title, "text": " ".join([title, *extra_text]), "result": result}
+            return docs[key]
+
+        for collection in catalog_collections_for():
+            snapshot = catalog.get(collection.name)
+            for folder in snapshot["by_folder"]:
+                if folder != "Root":
+                    add(("folder", collection.asset_type, folder), folder, [],
+                        {"kind": "folder", "type": collection.asset_type, "name": folder})
+            for item in snapshot["items"]:
+                if collection.asset_type == "flag":
+                    # "Albania" and "Albania_circle" are one country with two variants
+                    country = item["name"][:-len("_circle")] if item["name"].endswith("_circle") else item["name"]
+                    doc = add(("flag", country), country, [],
+                              {"kind": "flag", "name": country, "files": []})
+                    doc["result"]["files"].append(item["file"])
                     continue
-        
-        # Prepare the response
-        zip_buffer.seek(0)
-        
-        # Create a meaningful filename
-        folder_name = req.folder if req.folder != "Root" else "icons"
-        zip_filename = f"{folder_name}_{req.type}_{req.format}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
-        
-        return StreamingResponse(
-            io.BytesIO(zip_buffer.getvalue()),
-            media_type="application/zip",
-            headers={"Content-Disposition": f"attachment; filename={zip_filename}"}
-        )
-        
-    except Exception as e:
-        return {"error": f"Failed to create ZIP: {str(e)}"}
+                doc = add(("icon", item["type"], item["folder"], item["name"]), item["name"], [item["folder"]],
+                          {"kind": "icon", "type": item["type"], "folder": item["folder"],
+                           "name": item["name"], "modes": []})
+                if item["mode"] and item["mode"] not in doc["result"]["modes"]:
+                    doc["result"]["modes"].append(item["mode"])
 
-@app.get("/groups/{type}/{folder_name}/{icon_name}")
-async def get_groups(type: str, folder_name: str, icon_name: str):
-    if type == "icon":
-        if folder_name == "Root":
-            filepath = ICON_DIR / icon_name
-        else:
-            filepath = ICON_DIR / folder_name / icon_name
-    elif type == "flag":
-        filepath = FLAG_DIR / icon_name
-    else:
-        return {"groups": []}
-    
-    if not filepath.exists():
-        return {"groups": []}
+        try:
+            with open(INFOGRAPHICS_DIR / "mapping.json", 'r', encoding='utf-8') as f:
+                mapping_data = json.load(f)
+            for entry in mapping_data:
+                title = entry.get("title") or Path(entry.get("filename", "")).stem
+                add(("infographic", entry.get("filename")), title, [entry.get("category", "")],
+                    {"kind": "infographic", "name": title, "filename": entry.get("filename"),
+                     "category": entry.get("category")})
+        except Exception as e:
+            print(f"[ERROR] Failed to index mapping.json: {e}")
 
-    ET.register_namespace('', "http://www.w3.org/2000/svg")
-    tree = ET.parse(filepath)
-    root = tree.getroot()
-    namespaces = {'svg': 'http://www.w3.org/2000/svg'}
+        if BCORE_DIR.exists():
+            for dirpath, _, filenames in os.walk(BCORE_DIR):
+                for filename in filenames:
+                    if filename.lower().endswith(('.md', '.txt')):
+                        continue
+                    section = Path(dirpath).relative_to(BCORE_DIR).as_posix()
+                    add(("bcore", section, filename), Path(filename).stem, [section],
+                        {"kind": "bcore", "name": filename, "section": section,
+                         "url": f"/bcore/{quote(filename)}"})
 
-    groups = []
-    for g in root.findall(".//svg:g", namespaces):
-        group_id = g.get("id")
-        if group_id:
-            # Check if this group contains other groups with IDs (parent groups)
-            has_child_groups_with_ids = False
-            for child in g:
-                if child.tag.endswith('g') and child.get("id"):
-                    has_child_groups_with_ids = True
-                    break
-            
-            # Only include groups that don't contain other groups with IDs
-            # This excludes parent/container groups like "Layer_2"
-            if not has_child_groups_with_ids:
-                groups.append(group_id)
-    
-    return {"groups": groups}
+        return list(docs.values())
 
-@app.get("/svg/{type}/{folder_name}/{icon_name}")
-async def get_svg_with_cors(type: str, folder_name: str, icon_name: str):
-    """Serve SVG files with proper CORS headers for frontend fetch requests"""
-    try:
-        if type == "icon":
-            # Construct the file path
-            if folder_name == "Root":
-                file_path = ICON_DIR / icon_name
-            else:
-                file_path = ICON_DIR / folder_name / icon_name
-        elif type == "colorful-icon":
-            # For colorful icons
-            if folder_name == "Root":
-                file_path = COLORFUL_ICON_DIR / icon_name
-            else:
-                file_path = COLORFUL_ICON_DIR / folder_name / icon_name
-        else:
-            # For flags
-            file_path = FLAG_DIR / icon_name
-        
-        if not file_path.exists():
-            return {"error": "File not found"}
-        
-        # Read the SVG content
-        with open(file_path, 'r', encoding='utf-8') as f:
-            svg_content = f.read()
-        
-        # Return with proper headers
-        from fastapi.responses import Response
-        return Response(
-            content=svg_content,
-            media_type="image/svg+xml",
-            headers={
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Methods": "GET, OPTIONS",
-                "Access-Control-Allow-Headers": "*"
-            }
-        )
-    except Exception as e:
-        print(f"Error serving SVG: {e}")
-        return {"error": "Failed to serve SVG"}
+    def _rebuild(self, stamp):
+        docs = self._collect()
+        prefixes, grams = {}, {}
+        for doc_id, doc in enumerate(docs):
+            doc["tokens"] = split_name_tokens(doc["text"])
+            doc["lower"] = doc["title"].lower()
+            doc["trigrams"] = trigrams(doc["title"])
+            for token in doc["tokens"]:
+                for i in range(1, min(len(token), SEARCH_MAX_PREFIX) + 1):
+                    prefixes.setdefault(token[:i], set()).add(doc_id)
+            for gram in doc["trigrams"]:
+                grams.setdefault(gram, set()).add(doc_id)
+        self._docs, self._prefixes, self._trigrams, self._stamp = docs, prefixes, grams, stamp
 
-@app.post("/update_color")
-async def update_color(req: UpdateColorRequest):
-    try:
-        print(f"DEBUG: update_color called with {req}", flush=True)
-        print("DEBUG: Starting function execution...", flush=True)
-        
-        # Get the appropriate directory based on type, folder, and mode
-        icon_dir = get_icon_directory(req.type, req.folder, req.mode)
-        
-        if req.type == "icon" or req.type == "icons":
-            print("DEBUG: Type is icon", flush=True)
-            filepath = icon_dir / req.icon_name
-        elif req.type == "flag":
-            print("DEBUG: Type is flag", flush=True)
-            filepath = FLAG_DIR / req.icon_name
-        else:
-            print("DEBUG: Invalid type", flush=True)
-            return {"error": "Invalid type"}
-        
-        print(f"DEBUG: Filepath: {filepath}", flush=True)
-        
-        if not filepath.exists():
-            print(f"DEBUG: File not found: {filepath}", flush=True)
-            return {"error": "File not found"}
+    def ensure_current(self):
+        stamp = self._source_stamp()
+        if stamp != self._stamp:
+            with self._lock:
+                if stamp != self._stamp:
+                    self._rebuild(stamp)
 
-        print(f"DEBUG: File exists, parsing SVG...", flush=True)
-        ET.register_namespace('', "http://www.w3.org/2000/svg")
-        tree = ET.parse(filepath)
-        root = tree.getroot()
-        namespaces = {"svg": "http://www.w3.org/2000/svg"}
-        
-        if req.group_id == "entire_flag":
-            # For flags, update all elements in the SVG
-            print(f"DEBUG: Updating entire flag with color {req.color}", flush=True)
-            for element in root.iter():
-                update_element_color(element, req.color)
-        else:
-            # For icons, update specific group
-            print(f"DEBUG: Looking for group '{req.group_id}' in icon", flush=True)
-            groups = []
-            for g in root.findall(".//svg:g", namespaces):
-                group_id = g.get("id")
-                if group_id:
-                    groups.append(group_id)
-
-            print(f"DEBUG: Found groups: {groups}", flush=True)
-
-            target_group = root.find(f".//svg:g[@id='{req.group_id}']", namespaces)
-            if target_group is None:
-                print(f"DEBUG: Group '{req.group_id}' not found!", flush=True)
-                return {"error": "Group not found"}
+    def _score(self, doc: dict, query: str, query_tokens: list, query_grams: set) -> float:
+        if doc["lower"] == query:
+            return 100.0
+        if doc["lower"].startswith(query):
+            return 90.0 - min(len(doc["lower"]) - len(query), 20) * 0.1
+        if query_tokens and all(any(t.startswith(q) for t in doc["tokens"]) for q in query_tokens):
+            return 70.0 - min(len(doc["tokens"]), 20) * 0.1
+        shared = len(query_grams & doc["trigrams"])
+        similarity = shared / len(query_grams | doc["trigrams"])
+        return 60.0 * similarity if similarity >= SEARCH_MIN_SIMILARITY else 0.0
 
-            print(f"DEBUG: Found target group '{req.group_id}', updating with color {req.color}", flush=True)
-            
-            # Update all descendants inside the group
-            updated_count = 0
-            for element in target_group.iter():
-                if element.tag.endswith(('path', 'rect', 'circle', 'ellipse', 'polygon', 'polyline', 'line')):
-                    old_fill = element.get('fill', 'N/A')
-                    old_style = element.get('style', 'N/A')
-                    update_element_color(element, req.color)
-                    new_fill = element.get('fill', 'N/A')
-                    new_style = element.get('style', 'N/A')
-                    if old_fill != new_fill or old_style != new_style:
-                        updated_count += 1
-                        print(f"DEBUG: Updated element {element.tag} - fill: {old_fill} -> {new_fill}, style: {old_style} -> {new_style}", flush=True)
-            
-            print(f"DEBUG: Updated {updated_count} elements in group '{req.group_id}'", flush=True)
+    def search(self, query: str, kind: str = None, limit: int = 20) -> list:
+        self.ensure_current()
+        query = query.strip().lower()
+        if not query:
+            return []
+        query_tokens = [t for t in split_name_tokens(query) if t]
+        query_grams = trigrams(query)
 
-        # Only remove <style> blocks directly under root
-        for style_block in list(root.findall("svg:style", namespaces)):
-            root.remove(style_block)
+        # Candidates: docs matching every query token as a prefix, plus trigram neighbours
+        candidates = None
+        for token in query_tokens:
+            hits = self._prefixes.get(token[:SEARCH_MAX_PREFIX], set())
+            candidates = hits.copy() if candidates is None else candidates & hits
+        candidates = candidates or set()
+        for gram in query_grams:
+            candidates |= self._trigrams.get(gram, set())
 
-        # Ensure the directory exists
-        filepath.parent.mkdir(parents=True, exist_ok=True)
-        
-        # Write the file back
-        print(f"DEBUG: Writing file back to {filepath}", flush=True)
-        tree.write(filepath, encoding='utf-8', xml_declaration=True)
-        print(f"DEBUG: File written successfully", flush=True)
-        
-        return {"status": "Color updated"}
-    except Exception as e:
-        print(f"DEBUG: Exception in update_color: {e}", flush=True)
-        import traceback
-        print(f"DEBUG: Traceback: {traceback.format_exc()}", flush=True)
-        return {"error": f"Internal server error: {str(e)}"}
+        scored = []
+        for doc_id in candidates:
+            doc = self._docs[doc_id]
+            if kind and doc["result"]["kind"] != kind:
+                continue
+            score = self._score(doc, query, query_tokens, query_grams)
+            if score > 0:
+                scored.append((-score, doc["lower"], doc_id))
+        scored.sort()
+        return [{**self._docs[doc_id]["result"], "score": round(-neg, 2)} for neg, _, doc_id in scored[:limit]]
 
-@app.get("/colorful-icons")
-async def get_colorful_icons():
-    # Get all folders and files in the COLORFUL_ICON_DIR
-    folders = {}
-    
-    # Get folders
-    for folder_path in COLORFUL_ICON_DIR.iterdir():
-        if folder_path.is_dir():
-            folder_name = folder_path.name
-            # Get all SVG files in this folder
-            svg_files = [f.stem for f in folder_path.glob("*.svg")]
-            if svg_files:  # Only include folders that have SVG files
-                folders[folder_name] = svg_files
-    
-    # Get SVG files in the root directory (not in folders)
-    root_svgs = [f.stem for f in COLORFUL_ICON_DIR.glob("*.svg")]
-    if root_svgs:
-        folders["Root"] = root_svgs
-    
-    # Sort folders by icon count (descending), then alphabetically for same count
-    sorted_folders = dict(sorted(folders.items(), key=lambda x: (-len(x[1]), x[0])))
-    
-    return {"folders": sorted_folders}
+search_index = SearchIndex()
 
-@app.get("/single-color")
-async def get_single_color_icons():
-    # Get all files from both light and dark mode directories
-    light_dir = SINGLE_COLOR_DIR_LIGHT
-    dark_dir = SINGLE_COLOR_DIR_DARK
-    
-    all_files = set()
-    
-    # Get files from light directory
-    if light_dir.exists():
-        png_files = [f.stem for f in light_dir.glob("*.png")]
-        svg_files = [f.stem for f in light_dir.glob("*.svg")]
-        all_files.update(png_files + svg_files)
-    
-    # Get files from dark directory
-    if dark_dir.exists():
-        png_files = [f.stem for f in dark_dir.glob("*.png")]
-        svg_files = [f.stem for f in dark_dir.glob("*.svg")]
-        all_files.update(png_files + svg_files)
-    
-    # Return sorted list of unique files
-    return {"icons": sorted(list(all_files))}
+@app.get("/search")
+async def search(q: str, kind: str = None, limit: int = Query(20, ge=1, le=100)):
+    """Ranked prefix and fuzzy search across icons, folders, flags, infographics and BCORE files"""
+    started = time.perf_counter()
+    # A stale index is rebuilt inside search(), which walks BCORE and reads mapping.json
+    results = await io_pool.run(search_index.search, q, kind, limit)
+    return {"results": results, "took_ms": round((time.perf_counter() - started) * 1000, 3)}
 
 @app.post("/single-color/update")
-async def update_single_color_icon(req: SingleColorUpdateRequest):
+async def update_single_color_icon(req: SingleColorUpdateRequest, request: Request):
     """Update the color of a single color icon (PNG or SVG)"""
-    # Use mode-specific directory
-    single_color_dir = SINGLE_COLOR_DIR_LIGHT if req.mode == "light" else SINGLE_COLOR_DIR_DARK
+    session = request_session(request)
+    try:
+        single_color_dir = asset_resolver.directory("single-color", "Root", req.mode)
+    except InvalidAssetRequest as e:
+        return {"error": str(e)}
     
     if not single_color_dir.exists():
         return {"error": f"SingleColor {req.mode} directory not found"}
     
     # Check for both PNG and SVG files
-    png_file = single_color_dir / f"{req.icon_name}.png"
-    svg_file = single_color_dir / f"{req.icon_name}.svg"
+    svg_asset = asset_resolver.resolve("single-color", "Root", f"{req.icon_name}.svg", req.mode)
+    png_asset = asset_resolver.resolve("single-color", "Root", f"{req.icon_name}.png", req.mode)
     
-    if not png_file.exists() and not svg_file.exists():
+    if svg_asset is None and png_asset is None:
         return {"error": "Icon not found"}
+    svg_file = svg_asset.path if svg_asset else None
+    
+    if session is not None and svg_asset is not None:
+        return await io_pool.run(workspace_color_edit, session, svg_file, ENTIRE_SVG_GROUP, req.color, True)
     
     try:
-        if svg_file.exists():
-            # Handle SVG file
-            create_backup(svg_file)
-            
-            ET.register_namespace('', "http://www.w3.org/2000/svg")
-            tree = ET.parse(svg_file)
-            root = tree.getroot()
-            
-            # Update all elements that can have colors
-            for element in root.findall(".//{http://www.w3.org/2000/svg}path") + root.findall(".//{http://www.w3.org/2000/svg}rect") + root.findall(".//{http://www.w3.org/2000/svg}circle") + root.findall(".//{http://www.w3.org/2000/svg}ellipse") + root.findall(".//{http://www.w3.org/2000/svg}polygon") + root.findall(".//{http://www.w3.org/2000/svg}polyline") + root.findall(".//{http://www.w3.org/2000/svg}line"):
-                update_element_color(element, req.color)
-            
-            # Save the modified SVG
-            tree.write(svg_file, encoding='utf-8', xml_declaration=True)
+        if svg_asset is not None:
+            async with file_locks.hold(svg_file):
+                # Handle SVG file; the first write snapshots the original version
+                await edit_pool.run(edit_svg_file, svg_file, lambda root: apply_shape_color(root, req.color))
             
-        elif png_file.exists():
+        elif png_asset is not None:
             # For PNG files, we'll need to convert them to SVG or handle them differently
             # For now, we'll return an error suggesting to use SVG format
             return {"error": "PNG files cannot be recolored. Please use SVG format for color changes."}
@@ -1049,41 +3577,36 @@ async def update_single_color_icon(req: SingleColorUpdateRequest):
         return {"error": f"Failed to update color: {str(e)}"}
 
 @app.post("/single-color/revert")
-async def revert_single_color_icon(req: SingleColorRevertRequest):
+async def revert_single_color_icon(req: SingleColorRevertRequest, request: Request):
     """Revert a single color icon to its original state"""
-    # Use mode-specific directory
-    single_color_dir = SINGLE_COLOR_DIR_LIGHT if req.mode == "light" else SINGLE_COLOR_DIR_DARK
+    session = request_session(request)
+    try:
+        single_color_dir = asset_resolver.directory("single-color", "Root", req.mode)
+    except InvalidAssetRequest as e:
+        return {"error": str(e)}
     
     if not single_color_dir.exists():
         return {"error": f"SingleColor {req.mode} directory not found"}
     
     # Check for both PNG and SVG files
-    png_file = single_color_dir / f"{req.icon_name}.png"
-    svg_file = single_color_dir / f"{req.icon_name}.svg"
+    svg_asset = asset_resolver.resolve("single-color", "Root", f"{req.icon_name}.svg", req.mode)
+    png_asset = asset_resolver.resolve("single-color", "Root", f"{req.icon_name}.png", req.mode)
     
-    if not png_file.exists() and not svg_file.exists():
+    if svg_asset is None and png_asset is None:
         return {"error": "Icon not found"}
+    svg_file = svg_asset.path if svg_asset else None
+    
+    if session is not None and svg_asset is not None:
+        await io_pool.run(workspaces.reset, session, svg_file)
+        return {"status": "Reverted to original color", "session": session}
     
     try:
-        if svg_file.exists():
-            # Reset to default color for the current mode
-            ET.register_namespace('', "http://www.w3.org/2000/svg")
-            tree = ET.parse(svg_file)
-            root = tree.getroot()
-            
-            # Set default color based on mode
-            default_color = "#282828" if req.mode == "light" else "#D3D3D3"
-            
-            # Update all elements to the default color
-            for element in root.iter():
-                if element.tag.endswith(('path', 'rect', 'circle', 'ellipse', 'polygon', 'polyline', 'line')):
-                    if element.get('fill') and element.get('fill') != 'none':
-                        element.set('fill', default_color)
-            
-            # Save the modified SVG
-            tree.write(svg_file, encoding='utf-8', xml_declaration=True)
-            return {"status": "Reverted to original color"}
-        elif png_file.exists():
+        if svg_asset is not None:
+            async with file_locks.hold(svg_file):
+                # Reset to the default color for the mode
+                await edit_pool.run(edit_svg_file, svg_file, lambda root: apply_default_shape_color(root, req.mode))
+                return {"status": "Reverted to original color"}
+        elif png_asset is not None:
             # For PNG files, we'll need to handle them differently
             return {"error": "PNG files cannot be reverted. Please use SVG format for color changes."}
         
@@ -1091,106 +3614,80 @@ async def revert_single_color_icon(req: SingleColorRevertRequest):
         return {"error": f"Failed to revert color: {str(e)}"}
 
 @app.post("/greyscale")
-async def convert_to_greyscale_endpoint(req: GreyscaleRequest):
-    if req.folder == "Root":
-        filepath = COLORFUL_ICON_DIR / f"{req.icon_name}.svg"
-    else:
-        filepath = COLORFUL_ICON_DIR / req.folder / f"{req.icon_name}.svg"
+async def convert_to_greyscale_endpoint(req: GreyscaleRequest, request: Request):
+    session = request_session(request)
+    try:
+        asset = asset_resolver.resolve("colorful-icon", req.folder, f"{req.icon_name}.svg")
+    except InvalidAssetRequest as e:
+        return {"error": str(e)}
     
-    if not filepath.exists():
+    if asset is None:
         return {"error": "File not found"}
+    filepath = asset.path
+
+    if session is not None:
+        edits = await io_pool.run(workspaces.update, session, filepath, None, False, True)
+        return {"status": "Converted to greyscale", "session": session, "edits": edits}
 
     try:
-        # Create backup of original file before converting
-        create_backup(filepath)
-        
-        ET.register_namespace('', "http://www.w3.org/2000/svg")
-        tree = ET.parse(filepath)
-        root = tree.getroot()
-        
-        # Add greyscale filter definition if it doesn't exist
-        defs = root.find(".//{http://www.w3.org/2000/svg}defs")
-        if defs is None:
-            defs = ET.SubElement(root, "defs")
-        
-        # Check if greyscale filter already exists
-        existing_filter = defs.find(".//{http://www.w3.org/2000/svg}filter[@id='greyscale']")
-        if existing_filter is None:
-            # Create greyscale filter
-            filter_elem = ET.SubElement(defs, "filter", id="greyscale")
-            fe_color_matrix = ET.SubElement(filter_elem, "feColorMatrix", 
-                                          type="matrix", 
-                                          values="0.299 0.587 0.114 0 0 0.299 0.587 0.114 0 0 0.299 0.587 0.114 0 0 0 0 0 1 0")
-        
-        # Apply greyscale filter to all path and rect elements
-        for element in root.findall(".//{http://www.w3.org/2000/svg}path") + root.findall(".//{http://www.w3.org/2000/svg}rect"):
-            convert_to_greyscale(element)
-        
-        # Apply greyscale filter to all other elements that can have colors
-        for element in root.findall(".//{http://www.w3.org/2000/svg}circle") + root.findall(".//{http://www.w3.org/2000/svg}ellipse") + root.findall(".//{http://www.w3.org/2000/svg}polygon") + root.findall(".//{http://www.w3.org/2000/svg}polyline") + root.findall(".//{http://www.w3.org/2000/svg}line"):
-            convert_to_greyscale(element)
-        
-        # Save the modified SVG
-        tree.write(filepath, encoding='utf-8', xml_declaration=True)
-        
-        return {"status": "Converted to greyscale"}
+        async with file_locks.hold(filepath):
+            await edit_pool.run(edit_svg_file, filepath, apply_greyscale_filter)
+            return {"status": "Converted to greyscale"}
     except Exception as e:
         return {"error": f"Failed to convert to greyscale: {str(e)}"}
 
 @app.post("/revert")
-async def revert_to_color_endpoint(req: RevertRequest):
-    if req.folder == "Root":
-        filepath = COLORFUL_ICON_DIR / f"{req.icon_name}.svg"
-    else:
-        filepath = COLORFUL_ICON_DIR / req.folder / f"{req.icon_name}.svg"
+async def revert_to_color_endpoint(req: RevertRequest, request: Request):
+    session = request_session(request)
+    try:
+        asset = asset_resolver.resolve("colorful-icon", req.folder, f"{req.icon_name}.svg")
+    except InvalidAssetRequest as e:
+        return {"error": str(e)}
     
-    if not filepath.exists():
+    if asset is None:
         return {"error": "File not found"}
+    filepath = asset.path
+
+    if session is not None:
+        if await io_pool.run(workspaces.reset, session, filepath):
+            return {"status": "Reverted to original colors", "session": session}
+        return {"error": "No workspace edits to revert"}
 
     try:
-        # Restore from backup
-        if restore_from_backup(filepath):
-            return {"status": "Reverted to original colors"}
-        else:
-            return {"error": "No backup found to revert from"}
+        async with file_locks.hold(filepath):
+            # Restore the original version from the version store
+            if await edit_pool.run(restore_original, filepath):
+                return {"status": "Reverted to original colors"}
+            else:
+                return {"error": "No backup found to revert from"}
     except Exception as e:
         return {"error": f"Failed to revert to original colors: {str(e)}"}
 
 @app.get("/check-greyscale/{folder_name}/{icon_name}")
-async def check_greyscale(folder_name: str, icon_name: str):
-    if folder_name == "Root":
-        filepath = COLORFUL_ICON_DIR / f"{icon_name}.svg"
-    else:
-        filepath = COLORFUL_ICON_DIR / folder_name / f"{icon_name}.svg"
+async def check_greyscale(folder_name: str, icon_name: str, request: Request):
+    session = request_session(request)
+    try:
+        asset = asset_resolver.resolve("colorful-icon", folder_name, f"{icon_name}.svg")
+    except InvalidAssetRequest as e:
+        return {"error": str(e)}
     
-    if not filepath.exists():
+    meta = await io_pool.run(manifest.lookup, asset.path) if asset is not None else None
+    if meta is None:
         return {"error": "File not found"}
-
-    try:
-        ET.register_namespace('', "http://www.w3.org/2000/svg")
-        tree = ET.parse(filepath)
-        root = tree.getroot()
-        
-        # Check if greyscale filter exists in the SVG
-        defs = root.find(".//{http://www.w3.org/2000/svg}defs")
-        if defs is not None:
-            greyscale_filter = defs.find(".//{http://www.w3.org/2000/svg}filter[@id='greyscale']")
-            if greyscale_filter is not None:
-                return {"is_greyscale": True}
-        
-        return {"is_greyscale": False}
-    except Exception as e:
-        return {"error": f"Failed to check greyscale status: {str(e)}"}
+    edits = await io_pool.run(workspaces.get, session, asset.path) if session is not None else None
+    if edits is not None:
+        return {"is_greyscale": meta["greyscale"] or edits["greyscale"]}
+    return {"is_greyscale": meta["greyscale"]}
 
 @app.post("/feedback")
 async def submit_feedback(req: FeedbackRequest):
     """Submit feedback from users"""
     try:
-        feedback_id = save_feedback(req.type, req.message, req.email)
+        feedback_id = await io_pool.run(save_feedback, req.type, req.message, req.email)
         
         if feedback_id:
-            # Send email notification
-            send_feedback_notification(req.type, req.message, feedback_id, req.email)
+            # Send the email notification in the background; its result never changed the response
+            mail_pool.submit(send_feedback_notification, req.type, req.message, feedback_id, req.email)
             return {"status": "Feedback submitted successfully", "id": feedback_id}
         else:
             return {"error": "Failed to save feedback"}
@@ -1201,7 +3698,7 @@ async def submit_feedback(req: FeedbackRequest):
 async def get_feedback():
     """Get all feedback (for creator/admin to view)"""
     try:
-        feedback_list = load_feedback()
+        feedback_list = await io_pool.run(load_feedback)
         # Sort by timestamp (newest first)
         feedback_list.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
         return {"feedback": feedback_list}
@@ -1212,7 +3709,7 @@ async def get_feedback():
 async def update_feedback_status(feedback_id: int, status: str):
     """Update feedback status (e.g., 'read', 'in_progress', 'resolved')"""
     try:
-        if update_feedback_status_file(feedback_id, status):
+        if await io_pool.run(update_feedback_status_file, feedback_id, status):
             return {"status": "Feedback status updated successfully"}
         else:
             return {"error": "Feedback not found"}
@@ -1224,7 +3721,7 @@ async def respond_to_feedback(req: FeedbackResponseRequest):
     """Send a response email to the user who submitted feedback"""
     try:
         # Load the feedback to get the user's email
-        feedback_list = load_feedback()
+        feedback_list = await io_pool.run(load_feedback)
         feedback = next((f for f in feedback_list if f["id"] == req.feedback_id), None)
         
         if not feedback:
@@ -1235,9 +3732,9 @@ async def respond_to_feedback(req: FeedbackResponseRequest):
             return {"error": "No email address provided with this feedback"}
         
         # Send response email
-        if send_feedback_response(user_email, req.feedback_id, req.response_message):
+        if await mail_pool.run(send_feedback_response, user_email, req.feedback_id, req.response_message):
             # Update status to 'responded'
-            update_feedback_status_file(req.feedback_id, "responded")
+            await io_pool.run(update_feedback_status_file, req.feedback_id, "responded")
             return {"status": "Response sent successfully"}
         else:
             return {"error": "Failed to send response email"}
@@ -1326,7 +3823,7 @@ def serve_bcore_thumbnail(filename: str):
     print(f"[DEBUG] Decoded filename: {decoded_filename}")
     
     # Create thumbnails directory path
-    thumbnails_dir = Path(__file__).parent / "thumbnails"
+    thumbnails_dir = THUMBNAILS_DIR
     
     # Generate thumbnail filename - try both .png and .PNG
     thumbnail_filename_lower = f"{Path(decoded_filename).stem}.png"
@@ -1358,6 +3855,463 @@ def serve_bcore_thumbnail(filename: str):
         }
     )
 
+# --- Raster Derivatives ---
+# Resized WebP/PNG/JPEG derivatives of the large raster assets (BCORE images, branding
+# previews, video thumbnails, infographic previews) for grid views. Each derivative is
+# rendered once in a process pool, then served from memory or the on-disk cache.
+IMAGE_ROOTS = {
+    "bcore": BCORE_DIR,
+    "thumbnails": THUMBNAILS_DIR,
+    "infographics": INFOGRAPHICS_DIR,
+}
+IMAGE_SOURCE_SUFFIXES = (".png", ".jpg", ".jpeg", ".gif", ".webp")
+IMAGE_FORMATS = {"webp": "image/webp", "png": "image/png", "jpeg": "image/jpeg"}
+IMAGE_FITS = ("contain", "cover", "fill")
+IMAGE_MAX_DIMENSION = int(os.getenv('IMAGE_MAX_DIMENSION', '4096'))
+IMAGE_DEFAULT_QUALITY = int(os.getenv('IMAGE_DEFAULT_QUALITY', '80'))
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', str(min(4, os.cpu_count() or 1))))
+IMAGE_CACHE_BYTES = int(os.getenv('IMAGE_CACHE_BYTES', str(64 * 1024 * 1024)))
+IMAGE_DISK_CACHE_DIR = Path(os.getenv('IMAGE_DISK_CACHE_DIR', str(BASE_DIR / ".image_cache")))
+IMAGE_DISK_CACHE_BYTES = int(os.getenv('IMAGE_DISK_CACHE_BYTES', str(512 * 1024 * 1024)))
+IMAGE_SOURCE_HASH_ENTRIES = int(os.getenv('IMAGE_SOURCE_HASH_ENTRIES', '10000'))  # hashes of files outside the manifest
+IMAGE_CACHE_CONTROL = "public, max-age=86400"
+
+image_cache = VariantCache(IMAGE_CACHE_BYTES)
+
+def render_image_derivative(source: str, width: int, height: int, fit: str, fmt: str, quality: int) -> bytes:
+    """Resize and encode one raster image; runs in a worker process"""
+    with Image.open(source) as img:
+        if img.format == "JPEG":
+            # Let the decoder do the coarse downscale for JPEG sources
+            img.draft("RGB", (width or img.width, height or img.height))
+        img = ImageOps.exif_transpose(img)
+        img.load()
+
+    has_alpha = img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info)
+    img = img.convert("RGBA" if has_alpha else "RGB")
+
+    if width or height:
+        # A missing dimension follows the source aspect ratio; never upscale
+        scale_w = width / img.width if width else None
+        scale_h = height / img.height if height else None
+        if fit == "fill" and width and height:
+            target = (width, height)
+        elif fit == "cover" and width and height:
+            target = None
+        else:
+            scale = min(s for s in (scale_w, scale_h) if s is not None)
+            target = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+        if target is None:
+            img = ImageOps.fit(img, (width, height), method=Image.Resampling.LANCZOS)
+        elif target != img.size and (fit == "fill" or target[0] < img.width):
+            img = img.resize(target, Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+    if fmt == "jpeg" and img.mode == "RGBA":
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel("A"))
+        img = background
+
+    out = io.BytesIO()
+    if fmt == "webp":
+        img.save(out, "WEBP", quality=quality, method=4)
+    elif fmt == "jpeg":
+        img.save(out, "JPEG", quality=quality, optimize=True, progressive=True)
+    else:
+        img.save(out, "PNG", optimize=True)
+    return out.getvalue()
+
+class RenderCache:
+    """Memory tier, size-bounded disk tier and worker pool behind one kind of rendered output"""
+    def __init__(self, memory: VariantCache, cache_dir: Path, disk_budget: int, pool: WorkerPool):
+        self.memory = memory
+        self.cache_dir = cache_dir
+        self.disk_budget = disk_budget
+        self.pool = pool
+        self.rendered = 0
+        self.disk_hits = 0
+        self._inflight = {}
+        self._disk_usage = None
+        self._lock = threading.Lock()
+
+    def _disk_path(self, key: str, fmt: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.{fmt}"
+
+    def _read_disk(self, key: str, fmt: str):
+        path = self._disk_path(key, fmt)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        os.utime(path)  # mtime doubles as last-use time for pruning
+        self.disk_hits += 1
+        return data
+
+    def _write_disk(self, key: str, fmt: str, data: bytes):
+        path = self._disk_path(key, fmt)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write_bytes(path, data, durable=False)
+        with self._lock:
+            if self._disk_usage is None:
+                self._disk_usage = sum(p.stat().st_size for p in self.cache_dir.rglob("*.*") if p.is_file())
+            else:
+                self._disk_usage += len(data)
+            over_budget = self._disk_usage > self.disk_budget
+        if over_budget:
+            self._prune()
+
+    def _prune(self):
+        """Drop least recently used files until the disk tier is back under 90% of its budget"""
+        files = []
+        for p in self.cache_dir.rglob("*.*"):
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            files.append((st.st_mtime, st.st_size, p))
+        files.sort()
+        usage = sum(size for _, size, _ in files)
+        for _, size, p in files:
+            if usage <= self.disk_budget * 0.9:
+                break
+            p.unlink(missing_ok=True)
+            usage -= size
+        with self._lock:
+            self._disk_usage = usage
+
+    async def fetch(self, params: str, fmt: str, render, *args):
+        """(bytes, key) for render(*args) identified by params, rendering at most once across concurrent requests"""
+        key = hashlib.blake2b(params.encode('utf-8'), digest_size=16).hexdigest()
+
+        data = self.memory.get(key)
+        if data is None:
+            data = await io_pool.run(self._read_disk, key, fmt)
+            if data is not None:
+                self.memory.put(key, data)
+        if data is not None:
+            return data, key
+
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = asyncio.wrap_future(self.pool.submit(render, *args))
+                self._inflight[key] = future
+        try:
+            data = await asyncio.shield(future)
+        finally:
+            if owner:
+                with self._lock:
+                    self._inflight.pop(key, None)
+        if owner:
+            self.rendered += 1
+            self.memory.put(key, data)
+            await io_pool.run(self._write_disk, key, fmt, data)
+        return data, key
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"rendered": self.rendered, "disk_hits": self.disk_hits, "inflight": len(self._inflight),
+                    "disk_bytes": self._disk_usage, "disk_budget": self.disk_budget, "workers": self.pool.workers}
+
+class ImageDerivatives(RenderCache):
+    """Resized raster derivatives, keyed by source content hash and output parameters"""
+    def __init__(self, cache_dir: Path, disk_budget: int, workers: int):
+        super().__init__(image_cache, cache_dir, disk_budget, WorkerPool("image", workers, processes=True))
+        # (path, size, mtime_ns) -> sha256 for sources the manifest does not track
+        self._source_hashes = VariantCache(IMAGE_SOURCE_HASH_ENTRIES, weigh=lambda digest: 1)
+
+    def source_digest(self, path: Path) -> str:
+        """Content hash of a source image, from the manifest when it tracks the file; blocking"""
+        meta = manifest.lookup(path)
+        if meta is not None:
+            return meta["sha256"]
+        st = path.stat()
+        key = (str(path), st.st_size, st.st_mtime_ns)
+        digest = self._source_hashes.get(key)
+        if digest is None:
+            h = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    h.update(chunk)
+            digest = h.hexdigest()
+            self._source_hashes.put(key, digest)
+        return digest
+
+    async def get(self, path: Path, width: int, height: int, fit: str, fmt: str, quality: int):
+        """(bytes, key) for a derivative of path"""
+        digest = await io_pool.run(self.source_digest, path)
+        params = f"{digest}|{width}|{height}|{fit}|{fmt}|{quality}"
+        return await self.fetch(params, fmt, render_image_derivative, str(path), width, height, fit, fmt, quality)
+
+image_derivatives = ImageDerivatives(IMAGE_DISK_CACHE_DIR, IMAGE_DISK_CACHE_BYTES, IMAGE_WORKERS)
+
+def negotiate_image_format(request: Request, source: Path) -> str:
+    """WebP when the client advertises it, otherwise the closest format to the source"""
+    if "image/webp" in request.headers.get("accept", ""):
+        return "webp"
+    return "jpeg" if source.suffix.lower() in (".jpg", ".jpeg") else "png"
+
+@app.get("/img/{asset:path}")
+async def get_image_derivative(asset: str, request: Request,
+                               w: int = Query(None, ge=1), h: int = Query(None, ge=1),
+                               fit: str = "contain", format: str = None,
+                               q: int = Query(IMAGE_DEFAULT_QUALITY, ge=1, le=100)):
+    """Resized raster derivative: /img/bcore/Images/x.png, /img/thumbnails/x.png, /img/infographics/x.PNG"""
+    if not PIL_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Image derivatives require Pillow")
+    root_name, _, rel = asset.partition("/")
+    root = IMAGE_ROOTS.get(root_name)
+    if root is None or not rel:
+        raise HTTPException(status_code=404, detail="Image not found")
+    if fit not in IMAGE_FITS:
+        raise HTTPException(status_code=400, detail=f"fit must be one of {', '.join(IMAGE_FITS)}")
+    if format is not None and format not in IMAGE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(IMAGE_FORMATS)}")
+    if (w and w > IMAGE_MAX_DIMENSION) or (h and h > IMAGE_MAX_DIMENSION):
+        raise HTTPException(status_code=400, detail=f"w and h must be at most {IMAGE_MAX_DIMENSION}")
+
+    path = asset_resolver.resolve_static(root, rel)
+    if path is None or path.suffix.lower() not in IMAGE_SOURCE_SUFFIXES:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    fmt = format or negotiate_image_format(request, path)
+    # Lossless output ignores quality, so it must not split the cache
+    quality = q if fmt != "png" else 0
+    try:
+        data, key = await image_derivatives.get(path, w or 0, h or 0, fit, fmt, quality)
+    except FileNotFoundError:
+        asset_resolver.forget()
+        raise HTTPException(status_code=404, detail="Image not found")
+    except (OSError, ValueError) as e:
+        raise HTTPException(status_code=422, detail=f"Could not decode image: {e}")
+
+    headers = {"ETag": f'"{key}"', "Cache-Control": IMAGE_CACHE_CONTROL, "Access-Control-Allow-Origin": "*"}
+    if format is None:
+        headers["Vary"] = "Accept"
+    if etag_matches(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return Response(content=data, media_type=IMAGE_FORMATS[fmt], headers=headers)
+
+# --- Raster Cache ---
+# PNG exports are cached in memory and on disk by (SVG content hash, width, height, scale,
+# background, mode). Recolouring changes the hash, so a stale PNG is never served; old
+# renders just age out of both tiers.
+RASTER_CACHE_BYTES = int(os.getenv('RASTER_CACHE_BYTES', str(32 * 1024 * 1024)))
+RASTER_DISK_CACHE_DIR = Path(os.getenv('RASTER_DISK_CACHE_DIR', str(BASE_DIR / ".raster_cache")))
+RASTER_DISK_CACHE_BYTES = int(os.getenv('RASTER_DISK_CACHE_BYTES', str(256 * 1024 * 1024)))
+
+raster_cache = VariantCache(RASTER_CACHE_BYTES)
+raster_renders = RenderCache(raster_cache, RASTER_DISK_CACHE_DIR, RASTER_DISK_CACHE_BYTES, cpu_pool)
+
+def raster_options(req) -> tuple:
+    """(width, height, scale, background) from an export request; raises ValueError when out of range"""
+    for dimension in (req.width, req.height):
+        if dimension is not None and not 0 < dimension <= IMAGE_MAX_DIMENSION:
+            raise ValueError(f"width and height must be between 1 and {IMAGE_MAX_DIMENSION}")
+    if not 0 < req.scale <= 16:
+        raise ValueError("scale must be between 0 and 16")
+    return req.width, req.height, req.scale, req.background
+
+async def cached_png(svg_data: bytes, digest: str, mode: str, options: tuple = (None, None, 1.0, None)) -> bytes:
+    """PNG for an SVG's exact bytes, rendered on the cpu pool only on a miss in both tiers"""
+    width, height, scale, background = options
+    params = f"{digest}|{width}|{height}|{scale}|{background}|{mode}"
+    data, _ = await raster_renders.fetch(params, "png", rasterize_svg, svg_data, width, height, scale, background)
+    return data
+
+# --- Multi-Size Export ---
+# POST /export-sizes renders one icon at several sizes and formats in one request. The SVG
+# is parsed and rasterized once, at the largest requested size (through the raster cache).
+# Smaller sizes are Lanczos downsamples of that master. ICO output packs every size up to
+# 256px into one file, and results come back as a zip or as multipart/mixed.
+EXPORT_SIZE_FORMATS = {"png": "image/png", "webp": "image/webp", "ico": "image/x-icon"}
+EXPORT_MAX_SIZES = int(os.getenv('EXPORT_MAX_SIZES', '16'))
+ICO_MAX_SIZE = 256
+
+SVG_LENGTH = re.compile(r'\s*([0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?)\s*(px|pt|pc|mm|cm|in)?\s*$')
+SVG_UNIT_PX = {None: 1.0, "px": 1.0, "pt": 4 / 3, "pc": 16.0, "mm": 96 / 25.4, "cm": 96 / 2.54, "in": 96.0}
+
+def svg_aspect_ratio(data: bytes) -> float:
+    """Height over width of an SVG's intrinsic size, from width/height or the viewBox; None if unknown"""
+    try:
+        root = ET.fromstring(data)
+    except ET.ParseError:
+        return None
+    width, height = (SVG_LENGTH.match(root.get(name) or "") for name in ("width", "height"))
+    if width and height:
+        w, h = (float(m.group(1)) * SVG_UNIT_PX[m.group(2)] for m in (width, height))
+        if w > 0 and h > 0:
+            return h / w
+    try:
+        _, _, w, h = (float(v) for v in re.split(r'[\s,]+', (root.get("viewBox") or "").strip()))
+    except ValueError:
+        return None
+    return h / w if w > 0 and h > 0 else None
+
+def derive_size_set(master: bytes, stem: str, sizes: list, formats: list) -> list:
+    """(filename, bytes) for each size/format, downsampled from one master PNG; runs in a worker process"""
+    with Image.open(io.BytesIO(master)) as img:
+        img = img.convert("RGBA")
+    frames = {}
+    for size in sorted(set(sizes), reverse=True):
+        frame = img.copy()
+        if max(frame.size) > size:
+            frame.thumbnail((size, size), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        frames[size] = frame
+
+    files = []
+    for size in sizes:
+        for fmt in formats:
+            out = io.BytesIO()
+            if fmt == "png":
+                frames[size].save(out, "PNG", optimize=True)
+            elif fmt == "webp":
+                frames[size].save(out, "WEBP", lossless=True, method=4)
+            else:
+                continue
+            files.append((f"{stem}_{size}.{fmt}", out.getvalue()))
+    if "ico" in formats:
+        icons = []
+        for size in sorted(frames):
+            if size > ICO_MAX_SIZE:
+                continue
+            # ICO entries are square; centre non-square frames on a transparent canvas
+            frame = frames[size]
+            canvas = Image.new("RGBA", (size, size), (0, 0, 0, 0))
+            canvas.paste(frame, ((size - frame.width) // 2, (size - frame.height) // 2))
+            icons.append(canvas)
+        out = io.BytesIO()
+        icons[-1].save(out, "ICO", sizes=[frame.size for frame in icons], append_images=icons[:-1])
+        files.append((f"{stem}.ico", out.getvalue()))
+    return files
+
+def multipart_response(files: list) -> Response:
+    boundary = f"export-{secrets.token_hex(16)}"
+    parts = []
+    for name, data in files:
+        media_type = EXPORT_SIZE_FORMATS[name.rsplit(".", 1)[-1]]
+        parts.append(f"--{boundary}\r\nContent-Type: {media_type}\r\n"
+                     f"Content-Disposition: attachment; filename=\"{name}\"\r\n"
+                     f"Content-Length: {len(data)}\r\n\r\n".encode('utf-8') + data + b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode('utf-8'))
+    return Response(content=b"".join(parts), media_type=f"multipart/mixed; boundary={boundary}")
+
+@app.post("/export-sizes")
+async def export_sizes(req: MultiSizeExportRequest, request: Request):
+    """Several PNG/WebP sizes and a multi-size ICO of one icon from a single rasterization"""
+    if not (CAIRO_AVAILABLE and PIL_AVAILABLE):
+        raise HTTPException(status_code=503, detail="Multi-size export requires cairosvg and Pillow")
+    sizes = list(dict.fromkeys(req.sizes))
+    formats = list(dict.fromkeys(f.lower() for f in req.formats))
+    if not sizes or len(sizes) > EXPORT_MAX_SIZES:
+        raise HTTPException(status_code=400, detail=f"Give between 1 and {EXPORT_MAX_SIZES} sizes")
+    if any(not 0 < size <= IMAGE_MAX_DIMENSION for size in sizes):
+        raise HTTPException(status_code=400, detail=f"Sizes must be between 1 and {IMAGE_MAX_DIMENSION}")
+    if not formats or any(f not in EXPORT_SIZE_FORMATS for f in formats):
+        raise HTTPException(status_code=400, detail=f"formats must be from {', '.join(EXPORT_SIZE_FORMATS)}")
+    if "ico" in formats and min(sizes) > ICO_MAX_SIZE:
+        raise HTTPException(status_code=400, detail=f"ICO needs at least one size up to {ICO_MAX_SIZE}")
+    if req.packaging not in ("zip", "multipart"):
+        raise HTTPException(status_code=400, detail="packaging must be zip or multipart")
+
+    try:
+        asset = asset_resolver.resolve(req.type, req.folder, req.icon_name, req.mode)
+    except InvalidAssetRequest as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if asset is None or asset.path.suffix.lower() != ".svg":
+        raise HTTPException(status_code=404, detail="File not found")
+
+    svg_data, digest = await io_pool.run(workspace_svg, request_session(request), asset.path)
+    # Frames fit a size x size box, so the master's longer side is the largest size; a tall
+    # icon rendered by width alone would come out taller than IMAGE_MAX_DIMENSION allows
+    aspect = await io_pool.run(svg_aspect_ratio, svg_data)
+    if aspect is not None and aspect > 1:
+        master_options = (None, max(sizes), 1.0, req.background)
+    else:
+        master_options = (max(sizes), None, 1.0, req.background)
+    master = await cached_png(svg_data, digest, req.mode, master_options)
+    files = await cpu_pool.run(derive_size_set, master, asset.path.stem, sizes, formats)
+
+    if req.packaging == "multipart":
+        return multipart_response(files)
+    archive = ZipStream()
+    entries = []
+    for name, data in files:
+        method, crc, payload = compress_zip_entry(name, data)
+        entries.append(archive.entry(name, method, crc, len(data), payload))
+    entries.append(archive.finish())
+    return Response(content=b"".join(entries), media_type="application/zip",
+                    headers={"Content-Disposition": f"attachment; filename={asset.path.stem}_sizes.zip"})
+
+# --- Ranged File Streaming ---
+# Large BCORE files (videos, branding images) are streamed in chunks and honour
+# Range / If-Range / HEAD, so scrubbing and resumed downloads work and memory stays flat.
+STREAM_CHUNK_SIZE = int(os.getenv('STREAM_CHUNK_SIZE', str(256 * 1024)))
+
+BYTE_RANGE_RE = re.compile(r'^\s*(\d*)\s*-\s*(\d*)\s*$')
+
+def parse_byte_range(range_header: str, size: int):
+    """(start, end) for a single "bytes=" range, None to ignore the header, or "unsatisfiable" """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None  # other units or multiple ranges: fall back to the full body
+    match = BYTE_RANGE_RE.match(spec)
+    if match is None or match.group(1) == match.group(2) == "":
+        return None  # malformed ranges are ignored, as RFC 9110 allows
+    start_text, end_text = match.groups()
+    if start_text == "":
+        length = int(end_text)
+        if length == 0 or size == 0:
+            return "unsatisfiable"
+        return max(size - length, 0), size - 1
+    start = int(start_text)
+    end = int(end_text) if end_text else None
+    if end is not None and end < start:
+        return None
+    if start >= size:
+        return "unsatisfiable"
+    return start, size - 1 if end is None else min(end, size - 1)
+
+def iter_file_range(path: Path, start: int, length: int):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(STREAM_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+def ranged_file_response(request: Request, path: Path, media_type: str, headers: dict) -> Response:
+    """Stream a file, answering HEAD, conditional and single-range requests"""
+    st = path.stat()
+    etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+    last_modified = formatdate(st.st_mtime, usegmt=True)
+    headers = {**headers, "Accept-Ranges": "bytes", "ETag": etag, "Last-Modified": last_modified}
+
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    start, end, status_code = 0, st.st_size - 1, 200
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range.strip() in (etag, last_modified)):
+        byte_range = parse_byte_range(range_header, st.st_size)
+        if byte_range == "unsatisfiable":
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{st.st_size}"})
+        if byte_range is not None:
+            start, end = byte_range
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{st.st_size}"
+
+    length = max(end - start + 1, 0)
+    headers["Content-Length"] = str(length)
+    if request.method == "HEAD":
+        return Response(status_code=status_code, headers=headers, media_type=media_type)
+    return StreamingResponse(iter_file_range(path, start, length), status_code=status_code,
+                             media_type=media_type, headers=headers)
+
 @app.options("/bcore/{filename:path}")
 async def options_bcore_file(filename: str):
     """Handle CORS preflight requests for BCORE files"""
@@ -1365,175 +4319,90 @@ async def options_bcore_file(filename: str):
         status_code=200,
         headers={
             "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Methods": "GET, OPTIONS",
+            "Access-Control-Allow-Methods": "GET, HEAD, OPTIONS",
             "Access-Control-Allow-Headers": "*"
         }
     )
 
-@app.get("/bcore/{filename:path}")
-def serve_bcore_file(filename: str):
+@app.api_route("/bcore/{filename:path}", methods=["GET", "HEAD"])
+def serve_bcore_file(filename: str, request: Request):
     """Serve BCORE branding files from the frontend public directory"""
     # Decode URL-encoded filename
     decoded_filename = unquote(filename)
     
-    # Use local BCORE directory in the backend
-    bcore_dir = Path(__file__).parent / "bcore_files"
-    
-    # Check if it's a video file and look in Videos subfolder
-    if decoded_filename.lower().endswith(('.mp4', '.mov', '.avi')):
-        file_path = bcore_dir / "Videos" / decoded_filename
-    # Check if it's an SVG file and look in Logos subfolder
-    elif decoded_filename.lower().endswith('.svg'):
-        file_path = bcore_dir / "Logos" / decoded_filename
-    # Check if it's an image file and look in Images subfolder
-    elif decoded_filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif')):
-        # First check if it's a preview image in Branding folder
-        branding_preview_path = bcore_dir / "Branding" / decoded_filename
-        if branding_preview_path.exists():
-            file_path = branding_preview_path
-        else:
-            file_path = bcore_dir / "Images" / decoded_filename
-    # Check if it's a PowerPoint file and look in Branding subfolder
-    elif decoded_filename.lower().endswith(('.pptx', '.ppt')):
-        file_path = bcore_dir / "Branding" / decoded_filename
-    # Check if it's a branding asset and look in Branding subfolder
-    elif decoded_filename.lower().endswith(('.pdf', '.docx', '.doc')):
-        file_path = bcore_dir / "Branding" / decoded_filename
-    else:
-        file_path = bcore_dir / decoded_filename
+    try:
+        asset = asset_resolver.resolve("bcore", "Root", decoded_filename)
+    except InvalidAssetRequest:
+        asset = None
     
     print(f"[DEBUG] BCORE request for: {filename}")
     print(f"[DEBUG] Decoded filename: {decoded_filename}")
-    print(f"[DEBUG] bcore_dir: {bcore_dir}")
-    print(f"[DEBUG] file_path: {file_path}")
-    print(f"[DEBUG] file exists: {file_path.exists()}")
+    print(f"[DEBUG] file_path: {asset.path if asset else None}")
     
-    if not file_path.exists():
-        raise HTTPException(status_code=404, detail=f"File not found: {file_path}")
+    if asset is None:
+        raise HTTPException(status_code=404, detail=f"File not found: {decoded_filename}")
+    file_path = asset.path
+    content_type = asset.media_type
     
-    # Determine content type based on file extension
-    content_type = "application/octet-stream"
-    if decoded_filename.lower().endswith('.mp4'):
-        content_type = "video/mp4"
-    elif decoded_filename.lower().endswith('.mov'):
-        content_type = "video/quicktime"
-    elif decoded_filename.lower().endswith('.avi'):
-        content_type = "video/x-msvideo"
-    elif decoded_filename.lower().endswith('.png'):
-        content_type = "image/png"
-    elif decoded_filename.lower().endswith('.jpg') or decoded_filename.lower().endswith('.jpeg'):
-        content_type = "image/jpeg"
-    elif decoded_filename.lower().endswith('.gif'):
-        content_type = "image/gif"
-    elif decoded_filename.lower().endswith('.svg'):
-        content_type = "image/svg+xml"
-    elif decoded_filename.lower().endswith('.pptx'):
-        content_type = "application/vnd.openxmlformats-officedocument.presentationml.presentation"
-    elif decoded_filename.lower().endswith('.ppt'):
-        content_type = "application/vnd.ms-powerpoint"
-    elif decoded_filename.lower().endswith('.pdf'):
-        content_type = "application/pdf"
-    elif decoded_filename.lower().endswith('.docx'):
-        content_type = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-    elif decoded_filename.lower().endswith('.doc'):
-        content_type = "application/msword"
-    
-    return FileResponse(
-        str(file_path), 
-        media_type=content_type,
-        headers={
+    return ranged_file_response(
+        request,
+        file_path,
+        content_type,
+        {
             "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Methods": "GET, OPTIONS",
-            "Access-Control-Allow-Headers": "*"
+            "Access-Control-Allow-Methods": "GET, HEAD, OPTIONS",
+            "Access-Control-Allow-Headers": "*",
+            "Access-Control-Expose-Headers": "Content-Range, Accept-Ranges, Content-Length, ETag"
         }
     )
 
 @app.post("/bcore-download")
-async def download_bcore_file(request: dict):
+async def download_bcore_file(request: Request):
     """Download BCORE files with proper CORS handling"""
+    body = await request.json()
+    return bcore_download_response(request, body.get("filename") if isinstance(body, dict) else None)
+
+@app.api_route("/bcore-download", methods=["GET", "HEAD"])
+def download_bcore_file_ranged(request: Request, filename: str = None):
+    """Resumable variant of /bcore-download for clients that retry with Range"""
+    return bcore_download_response(request, filename)
+
+def bcore_download_response(request: Request, filename: str):
     try:
-        filename = request.get("filename")
         if not filename:
             raise HTTPException(status_code=400, detail="Filename is required")
         
         # Decode URL-encoded filename
         decoded_filename = unquote(filename)
         
-        # Use local BCORE directory in the backend
-        bcore_dir = Path(__file__).parent / "bcore_files"
-        
-        # Check if it's a video file and look in Videos subfolder
-        if decoded_filename.lower().endswith(('.mp4', '.mov', '.avi')):
-            file_path = bcore_dir / "Videos" / decoded_filename
-        # Check if it's an SVG file and look in Logos subfolder
-        elif decoded_filename.lower().endswith('.svg'):
-            file_path = bcore_dir / "Logos" / decoded_filename
-        # Check if it's an image file and look in Images subfolder
-        elif decoded_filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif')):
-            # First check if it's a preview image in Branding folder
-            branding_preview_path = bcore_dir / "Branding" / decoded_filename
-            if branding_preview_path.exists():
-                file_path = branding_preview_path
-            else:
-                file_path = bcore_dir / "Images" / decoded_filename
-        # Check if it's a PowerPoint file and look in Branding subfolder
-        elif decoded_filename.lower().endswith(('.pptx', '.ppt')):
-            file_path = bcore_dir / "Branding" / decoded_filename
-        # Check if it's a branding asset and look in Branding subfolder
-        elif decoded_filename.lower().endswith(('.pdf', '.docx', '.doc')):
-            file_path = bcore_dir / "Branding" / decoded_filename
-        else:
-            file_path = bcore_dir / decoded_filename
+        try:
+            asset = asset_resolver.resolve("bcore", "Root", decoded_filename)
+        except InvalidAssetRequest:
+            asset = None
         
         print(f"[DEBUG] BCORE download request for: {filename}")
         print(f"[DEBUG] Decoded filename: {decoded_filename}")
-        print(f"[DEBUG] file_path: {file_path}")
-        print(f"[DEBUG] file exists: {file_path.exists()}")
-        
-        if not file_path.exists():
-            raise HTTPException(status_code=404, detail=f"File not found: {file_path}")
+        print(f"[DEBUG] file_path: {asset.path if asset else None}")
         
-        # Read the file content
-        with open(file_path, 'rb') as f:
-            file_content = f.read()
+        if asset is None:
+            raise HTTPException(status_code=404, detail=f"File not found: {decoded_filename}")
+        file_path = asset.path
+        content_type = asset.media_type
         
-        # Determine content type based on file extension
-        content_type = "application/octet-stream"
-        if decoded_filename.lower().endswith('.mp4'):
-            content_type = "video/mp4"
-        elif decoded_filename.lower().endswith('.mov'):
-            content_type = "video/quicktime"
-        elif decoded_filename.lower().endswith('.avi'):
-            content_type = "video/x-msvideo"
-        elif decoded_filename.lower().endswith('.png'):
-            content_type = "image/png"
-        elif decoded_filename.lower().endswith('.jpg') or decoded_filename.lower().endswith('.jpeg'):
-            content_type = "image/jpeg"
-        elif decoded_filename.lower().endswith('.gif'):
-            content_type = "image/gif"
-        elif decoded_filename.lower().endswith('.svg'):
-            content_type = "image/svg+xml"
-        elif decoded_filename.lower().endswith('.pptx'):
-            content_type = "application/vnd.openxmlformats-officedocument.presentationml.presentation"
-        elif decoded_filename.lower().endswith('.ppt'):
-            content_type = "application/vnd.ms-powerpoint"
-        elif decoded_filename.lower().endswith('.pdf'):
-            content_type = "application/pdf"
-        elif decoded_filename.lower().endswith('.docx'):
-            content_type = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-        elif decoded_filename.lower().endswith('.doc'):
-            content_type = "application/msword"
-        
-        return Response(
-            content=file_content,
-            media_type=content_type,
-            headers={
+        return ranged_file_response(
+            request,
+            file_path,
+            content_type,
+            {
                 "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Methods": "POST, OPTIONS",
+                "Access-Control-Allow-Methods": "GET, HEAD, POST, OPTIONS",
                 "Access-Control-Allow-Headers": "*",
+                "Access-Control-Expose-Headers": "Content-Range, Accept-Ranges, Content-Length, ETag, Content-Disposition",
                 "Content-Disposition": f"attachment; filename={decoded_filename}"
             }
         )
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"[DEBUG] Error in download_bcore_file: {e}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
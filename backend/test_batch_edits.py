@@ -0,0 +1,44 @@
+"""A batch of edits to one file must net out like the same requests sent one by one"""
+import pytest
+
+import main
+from main import AssetManifest, EditOperation, VersionStore, apply_file_edits
+
+SVG = (b'<?xml version="1.0" encoding="utf-8"?>\n'
+       b'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 10 10">'
+       b'<g id="Color"><path fill="#ff0000" d="M0 0h10v10H0z"/></g></svg>')
+
+
+@pytest.fixture
+def icon(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "BASE_DIR", tmp_path)
+    monkeypatch.setattr(main, "manifest", AssetManifest(tmp_path / "manifest.sqlite3", [tmp_path]))
+    monkeypatch.setattr(main, "versions", VersionStore(tmp_path / ".versions"))
+    path = tmp_path / "icons" / "icon.svg"
+    path.parent.mkdir()
+    path.write_bytes(SVG)
+    return path
+
+
+def op(name: str, **fields) -> EditOperation:
+    return EditOperation(op=name, icon_name="icon", **fields)
+
+
+def test_edit_then_revert_restores_original(icon):
+    results, _ = apply_file_edits(icon, list(enumerate([op("greyscale"), op("revert")])))
+    assert [r.get("status") for r in results] == ["Converted to greyscale", "Reverted to original colors"]
+    assert icon.read_bytes() == SVG
+
+
+def test_revert_then_edit_applies_edit(icon):
+    apply_file_edits(icon, [(0, op("greyscale"))])
+    results, _ = apply_file_edits(icon, list(enumerate([
+        op("revert"), op("color", group_id="Color", color="#00ff00")])))
+    assert all("error" not in r for r in results)
+    assert b"#00ff00" in icon.read_bytes()
+
+
+def test_revert_without_history_is_an_error(icon):
+    results, _ = apply_file_edits(icon, [(0, op("revert"))])
+    assert results == [{"index": 0, "error": "No backup found to revert from"}]
+    assert icon.read_bytes() == SVG
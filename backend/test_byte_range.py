@@ -0,0 +1,83 @@
+"""Range header parsing and the 206/416 responses built from it"""
+import pytest
+from starlette.requests import Request
+
+from main import parse_byte_range, ranged_file_response
+
+SIZE = 1000
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=-100", (900, 999)),  # suffix: last 100 bytes
+    ("bytes=-5000", (0, 999)),  # suffix longer than the file: whole file
+    ("bytes=500-", (500, 999)),  # open-ended
+    ("bytes=900-5000", (900, 999)),  # end past EOF is clamped
+    ("bytes=999-999", (999, 999)),
+    ("Bytes = 10 - 19", (10, 19)),
+])
+def test_satisfiable_ranges(header, expected):
+    assert parse_byte_range(header, SIZE) == expected
+
+
+@pytest.mark.parametrize("header", [
+    "bytes=0-9,20-29",  # multi-range: served as a full 200
+    "bytes=-",
+    "bytes=abc-def",
+    "bytes=5",
+    "bytes=--5",
+    "bytes=5--1",
+    "bytes=+5-10",
+    "bytes=10-5",  # last-pos before first-pos is invalid, not unsatisfiable
+    "items=0-9",
+    "bytes",
+])
+def test_invalid_or_multi_ranges_are_ignored(header):
+    assert parse_byte_range(header, SIZE) is None
+
+
+@pytest.mark.parametrize("header, size", [
+    ("bytes=1000-", SIZE),
+    ("bytes=5000-6000", SIZE),
+    ("bytes=-0", SIZE),
+    ("bytes=0-0", 0),
+    ("bytes=-10", 0),
+])
+def test_unsatisfiable_ranges(header, size):
+    assert parse_byte_range(header, size) == "unsatisfiable"
+
+
+def request_with(headers: dict, method: str = "GET") -> Request:
+    return Request({
+        "type": "http",
+        "method": method,
+        "path": "/",
+        "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+    })
+
+
+@pytest.fixture
+def blob(tmp_path):
+    path = tmp_path / "blob.bin"
+    path.write_bytes(bytes(range(256)) * 4)  # 1024 bytes
+    return path
+
+
+def test_range_response_is_partial(blob):
+    response = ranged_file_response(request_with({"Range": "bytes=-24"}), blob, "application/octet-stream", {})
+    assert response.status_code == 206
+    assert response.headers["content-range"] == "bytes 1000-1023/1024"
+    assert response.headers["content-length"] == "24"
+
+
+def test_unsatisfiable_range_response_is_416(blob):
+    response = ranged_file_response(request_with({"Range": "bytes=2048-"}), blob, "application/octet-stream", {})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == "bytes */1024"
+
+
+def test_multi_range_response_is_full_body(blob):
+    response = ranged_file_response(request_with({"Range": "bytes=0-1,5-6"}), blob, "application/octet-stream", {})
+    assert response.status_code == 200
+    assert response.headers["content-length"] == "1024"
+    assert "content-range" not in response.headers
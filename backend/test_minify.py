@@ -0,0 +1,53 @@
+"""Path data compaction must not move any coordinate"""
+import pytest
+
+from main import PATH_ARITY, compact_path_data, parse_path_data
+
+
+def absolute_segments(d: str) -> list:
+    """(command, numbers) per drawing step, with implicit repeats spelled out"""
+    steps = []
+    for command, args in parse_path_data(d):
+        arity = PATH_ARITY[command.lower()]
+        if arity == 0:
+            steps.append((command.lower(), []))
+            continue
+        for i in range(0, len(args), arity):
+            # Extra coordinate pairs after a moveto are linetos
+            step = command if i == 0 or command not in "Mm" else ("L" if command == "M" else "l")
+            steps.append((step, args[i:i + arity]))
+    return steps
+
+
+@pytest.mark.parametrize("d", [
+    "M10 10 L-5 -5 L-5.5-6.25",
+    "M0,0 l-1.5,-.5 -.25-.75z",
+    "M1e2 2E-1 L3.5e+1 -4e-2",
+    "M0 0 L1 1 L2 2 L3 3 C1 2 3 4 5 6 7 8 9 10 11 12",
+    "M0 0 1 1 2 2 m5 5 6 6",
+    "M10 80 Q 52.5 10, 95 80 T 180 80 S 10 10 20 20",
+    "M0 0 H10 V-10 h-.5 v.5 Z",
+    "M10 10 A30 50 0 0 1 162.55 162.45",
+    "M10 10 a25 25 -30 1 0 50 -25 a5 5 0 0150-25",
+    "M0 0A1.5 1.5 0 11 3 3",
+    "M.5.5L.25.125.75-.5",
+    "M-0.0001 0.0004 L1000000 -1000000",
+])
+@pytest.mark.parametrize("precision", [1, 3, 6])
+def test_compaction_keeps_coordinates(d, precision):
+    compacted = compact_path_data(d, precision)
+    before = absolute_segments(d)
+    after = absolute_segments(compacted)
+    assert [command for command, _ in after] == [command for command, _ in before]
+    for (_, expected), (_, actual) in zip(before, after):
+        assert actual == pytest.approx(expected, abs=0.5 * 10 ** -precision + 1e-9)
+
+
+def test_compaction_shortens_output():
+    d = "M 10.000 20.000 L 30.500 -40.250 L 50.000 60.000 Z"
+    assert compact_path_data(d, 3) == "M10 20L30.5-40.25 50 60Z"
+
+
+def test_malformed_path_is_left_as_authored():
+    d = "M10 10 L20"
+    assert compact_path_data(d, 3) == d
@@ -0,0 +1,54 @@
+"""Recolour templates must produce exactly what update_color writes for the same group"""
+import io
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+import pytest
+
+from main import BASE_DIR, ENTIRE_SVG_GROUP, SVG_NS, apply_group_color, compile_svg_template
+
+COLOR = "#12ab34"
+
+HANDWRITTEN = b"""<?xml version="1.0" encoding="UTF-8"?>
+<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" viewBox="0 0 10 10" fill="#000">
+  <style>.a{fill:#fff}</style>
+  <defs><path id="dot" d="M0 0h1v1H0z"/><linearGradient id="lg"><stop offset="0" style="stop-color:#fff"/></linearGradient></defs>
+  <g id="Color" fill="#ff0000">
+    <path d="M0 0h5v5H0z"/>
+    <rect x="1" y="1" width="2" height="2" style="stroke:#000"/>
+    <g><circle cx="5" cy="5" r="1" fill="#00f" style="fill :#abc;opacity:.5"/></g>
+    <g id="Inner"><polyline points="0 0 1 1" style="fill: red"/></g>
+  </g>
+  <g id="Grey"><ellipse cx="2" cy="2" rx="1" ry="1" fill="none"/><text x="0" y="9">Label</text></g>
+  <g id="Color"><line x1="0" y1="0" x2="1" y2="1"/></g>
+  <use xlink:href="#dot" x="3"/>
+</svg>"""
+
+
+def edited_with_update_color(data: bytes, group_id: str) -> bytes:
+    ET.register_namespace('', SVG_NS)
+    tree = ET.ElementTree(ET.fromstring(data))
+    assert apply_group_color(tree.getroot(), group_id, COLOR)
+    buffer = io.BytesIO()
+    tree.write(buffer, encoding='utf-8', xml_declaration=True)
+    return buffer.getvalue()
+
+
+def library_samples(limit: int = 40) -> list:
+    samples = []
+    for directory in ("exported_svgs", "flags", "colorful_icons"):
+        samples.extend(sorted((BASE_DIR / directory).rglob("*.svg"))[:limit // 3])
+    return samples
+
+
+@pytest.mark.parametrize("source", [pytest.param(HANDWRITTEN, id="handwritten")] + [
+    pytest.param(path, id=path.relative_to(BASE_DIR).as_posix()) for path in library_samples()])
+def test_template_matches_update_color_for_every_group(source):
+    data = source.read_bytes() if isinstance(source, Path) else source
+    template = compile_svg_template(data)
+    for group_id in [ENTIRE_SVG_GROUP, *template.groups]:
+        assert template.render({group_id: COLOR}) == edited_with_update_color(data, group_id), group_id
+
+
+def test_handwritten_sample_has_named_groups():
+    assert compile_svg_template(HANDWRITTEN).groups == ["Color", "Inner", "Grey"]
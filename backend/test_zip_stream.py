@@ -0,0 +1,58 @@
+"""The streaming ZIP encoder must produce archives zipfile reads back byte for byte"""
+import io
+import os
+import zipfile
+
+from main import ZipStream, compress_zip_entry
+
+ENTRIES = [
+    ("icon.svg", b"<svg xmlns='http://www.w3.org/2000/svg'>" + b"<path d='M0 0L10 10'/>" * 200 + b"</svg>"),
+    ("empty.txt", b""),
+    ("image.png", b"\x89PNG\r\n\x1a\n" + os.urandom(2048)),
+    ("noise.bin", os.urandom(4096)),
+    ("Business/Ünïcode name.svg", b"<svg/>" * 50),
+]
+
+
+def stream_archive(entries) -> bytes:
+    archive = ZipStream()
+    chunks = []
+    for name, data in entries:
+        method, crc, payload = compress_zip_entry(name, data)
+        chunks.append(archive.entry(name, method, crc, len(data), payload))
+    chunks.append(archive.finish())
+    return b"".join(chunks)
+
+
+def test_streamed_archive_round_trips():
+    with zipfile.ZipFile(io.BytesIO(stream_archive(ENTRIES))) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == [name for name, _ in ENTRIES]
+        for name, data in ENTRIES:
+            assert archive.read(name) == data
+
+
+def test_compression_method_per_entry():
+    with zipfile.ZipFile(io.BytesIO(stream_archive(ENTRIES))) as archive:
+        methods = {info.filename: info.compress_type for info in archive.infolist()}
+        sizes = {info.filename: info.compress_size for info in archive.infolist()}
+    assert methods["icon.svg"] == zipfile.ZIP_DEFLATED
+    assert sizes["icon.svg"] < len(ENTRIES[0][1])
+    assert methods["empty.txt"] == zipfile.ZIP_STORED
+    assert methods["image.png"] == zipfile.ZIP_STORED  # already compressed format
+    assert methods["noise.bin"] == zipfile.ZIP_STORED  # deflate would not shrink it
+
+
+def test_empty_archive():
+    with zipfile.ZipFile(io.BytesIO(stream_archive([]))) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == []
+
+
+def test_offsets_track_streamed_bytes():
+    archive = ZipStream()
+    emitted = 0
+    for name, data in ENTRIES:
+        method, crc, payload = compress_zip_entry(name, data)
+        emitted += len(archive.entry(name, method, crc, len(data), payload))
+        assert archive.offset == emitted